@@ -1,7 +1,10 @@
+import ctypes
 from OpenGL.GL import *
 from pyglm import glm
 import numpy as np
+import utils
 from utils import draw_colored_cube, draw_colored_sphere, bone_rotation, draw_arrow, draw_undercircle, draw_arrow_from_direction
+from bvh_controller import get_preorder_joint_list, get_parent_indices
 
 joint_size = 0.8
 
@@ -9,14 +12,15 @@ joint_size = 0.8
 def glm_mat4_to_glf(m: glm.mat4) -> np.ndarray:
     return np.array(m.to_list(), dtype=np.float32).flatten()
 
-def draw_humanoid(root_joint, color):
+def draw_humanoid(root_joint, color, root_kinematics=None):
     """
     Skeleton을 그리기 위한 함수입니다.
     :param root_joint: 그릴 joint (전역 kinematics가 이미 계산되어 있음)
     :param color: RGB 컬러 (tuple 또는 list of 3 floats)
+    :param root_kinematics: root_joint.kinematics 대신 쓸 root 변환 (render 보간 등)
     """
     glPushMatrix()
-    glMultMatrixf(glm_mat4_to_glf(root_joint.kinematics))
+    glMultMatrixf(glm_mat4_to_glf(root_joint.kinematics if root_kinematics is None else root_kinematics))
     draw_joint(root_joint.children[0], color)
     glPopMatrix()
 
@@ -68,14 +72,14 @@ def draw_virtual_root_axis(kinematics, color, circle_radius=2, arrow_length=4):
     draw_undercircle(circle_radius)
     glPopMatrix()
 
-def draw_matching_features(root_joint, frame, circle_radius = 2):
+def draw_matching_features(root_joint, frame, circle_radius = 2, root_kinematics=None):
     if frame is not None:
         #glPushMatrix()
-        glMultMatrixf(glm_mat4_to_glf(root_joint.kinematics))
+        glMultMatrixf(glm_mat4_to_glf(root_joint.kinematics if root_kinematics is None else root_kinematics))
 
         for pos, rot in zip(frame.future_position, frame.future_orientation):
             glPushMatrix()
-            glTranslatef(pos.x, pos.y, pos.z)
+            glTranslatef(pos[0], pos[1], pos[2])
 
             draw_arrow_from_direction(rot)
             glRotatef(90, 1.0, 0.0, 0.0)
@@ -84,4 +88,274 @@ def draw_matching_features(root_joint, frame, circle_radius = 2):
             draw_undercircle(circle_radius)
 
             glPopMatrix()
-        #glPopMatrix()
\ No newline at end of file
+        #glPopMatrix()
+
+
+# ---- instancing으로 그리는 skeleton ----
+# joint의 sphere와 bone의 box를 mesh 하나씩 VBO에 올려 두고, 모든 캐릭터의 joint / bone 변환 행렬을
+# frame마다 float32 배열 하나에 모아 instanced draw 두 번으로 그립니다. GL 호출 수는 joint 수와 무관합니다.
+
+SPHERE_COLOR = (1.0, 0.0, 0.0)
+# instance 하나: 변환 행렬 16 (column-major) + 색 3 + padding 1
+INSTANCE_FLOATS = 20
+
+_VERTEX_SHADER = """
+#version 120
+attribute vec3 position;
+attribute vec3 normal;
+attribute vec4 model0;
+attribute vec4 model1;
+attribute vec4 model2;
+attribute vec4 model3;
+attribute vec3 color;
+varying vec3 v_normal;
+varying vec3 v_view;
+varying vec3 v_color;
+void main() {
+    mat4 model = mat4(model0, model1, model2, model3);
+    vec4 view = gl_ModelViewMatrix * model * vec4(position, 1.0);
+    v_normal = gl_NormalMatrix * (mat3(model0.xyz, model1.xyz, model2.xyz) * normal);
+    v_view = view.xyz;
+    v_color = color;
+    gl_Position = gl_ProjectionMatrix * view;
+}
+"""
+
+# set_lights의 고정 파이프라인 조명(GL_LIGHT0, GL_COLOR_MATERIAL)을 그대로 읽어서 계산
+_FRAGMENT_SHADER = """
+#version 120
+varying vec3 v_normal;
+varying vec3 v_view;
+varying vec3 v_color;
+void main() {
+    vec3 n = normalize(v_normal);
+    vec3 l = normalize(gl_LightSource[0].position.xyz);
+    float diffuse = max(dot(n, l), 0.0);
+    vec3 color = v_color * (gl_LightModel.ambient.rgb + gl_LightSource[0].ambient.rgb
+                            + gl_LightSource[0].diffuse.rgb * diffuse);
+    if (diffuse > 0.0) {
+        vec3 h = normalize(l - normalize(v_view));
+        color += gl_LightSource[0].specular.rgb * gl_FrontMaterial.specular.rgb
+                 * pow(max(dot(n, h), 0.0), gl_FrontMaterial.shininess);
+    }
+    gl_FragColor = vec4(color, 1.0);
+}
+"""
+
+_ATTRIBUTES = ('position', 'normal', 'model0', 'model1', 'model2', 'model3', 'color')
+
+
+def unit_sphere(slices=30, stacks=30):
+    """
+    반지름 1인 sphere (gluSphere와 같은 분할).
+    :return: (vertices (V, 6) 위치 + normal, indices (T * 3,))
+    """
+    theta = np.linspace(0, np.pi, stacks + 1, dtype=np.float32)[:, None]
+    phi = np.linspace(0, 2 * np.pi, slices + 1, dtype=np.float32)[None, :]
+    positions = np.stack(np.broadcast_arrays(np.sin(theta) * np.sin(phi), np.cos(theta),
+                                             np.sin(theta) * np.cos(phi)), axis=-1).reshape(-1, 3)
+    first = (np.arange(stacks)[:, None] * (slices + 1) + np.arange(slices)[None, :]).ravel()
+    quads = np.stack([first, first + slices + 1, first + slices + 2, first + 1], axis=-1)
+    indices = quads[:, [0, 1, 2, 0, 2, 3]].ravel()
+    return np.concatenate([positions, positions], axis=1).astype(np.float32), indices.astype(np.uint32)
+
+
+def unit_box():
+    """
+    draw_colored_cube(1)과 같은 [-1, 1] cube. 면마다 normal이 다르도록 vertex를 나눔.
+    :return: (vertices (24, 6), indices (36,))
+    """
+    positions = np.array(utils.vertices, dtype=np.float32)
+    normals = np.repeat(np.array(utils.normals, dtype=np.float32), 4, axis=0)
+    indices = (np.arange(6)[:, None] * 4 + np.array([0, 1, 2, 0, 2, 3])).ravel()
+    return np.concatenate([positions, normals], axis=1), indices.astype(np.uint32)
+
+
+class _SkeletonShape:
+    """
+    skeleton 하나의 고정된 그리기 정보: joint 순서와 parent, sphere를 그릴 joint, bone의 parent와 local 변환.
+    행렬은 모두 column-major (numpy (4, 4)로 보면 전치된) 배열입니다.
+    """
+    def __init__(self, root_joint):
+        self.root_joint = root_joint
+        self.joints = get_preorder_joint_list(root_joint)
+        self.parents = get_parent_indices(self.joints).tolist()
+        # draw_humanoid와 같이 root(VirtualRoot)와 joint_Root는 sphere / bone을 그리지 않음
+        drawn = [i for i, joint in enumerate(self.joints) if i > 0 and joint.name != "joint_Root"]
+        self.sphere_joints = np.array(drawn, dtype=np.int64)
+
+        bone_parents = []
+        bone_locals = []
+        for i in drawn:
+            for child in self.joints[i].children:
+                offset = glm.vec3(*child.offset)
+                local = glm.translate(glm.mat4(1.0), offset / 2.0) * glm.mat4_cast(bone_rotation(offset))
+                local = glm.scale(local, glm.vec3(joint_size, abs(glm.length(offset) - 2 * joint_size) / 2,
+                                                  joint_size / 3))
+                bone_parents.append(i)
+                bone_locals.append(local.to_bytes())
+        self.bone_parents = np.array(bone_parents, dtype=np.int64)
+        self.bone_locals = np.frombuffer(b''.join(bone_locals), dtype=np.float32).reshape(-1, 4, 4)
+
+    def world_matrices(self, root_kinematics=None):
+        """
+        현재 kinematics로 모든 joint의 전역 변환을 계산합니다.
+        :param root_kinematics: root joint의 kinematics 대신 쓸 변환
+        :return: (J, 4, 4) column-major
+        """
+        worlds = []
+        for joint, parent in zip(self.joints, self.parents):
+            if parent >= 0:
+                worlds.append(worlds[parent] * joint.kinematics)
+            else:
+                worlds.append(joint.kinematics if root_kinematics is None else root_kinematics)
+        return np.frombuffer(b''.join([world.to_bytes() for world in worlds]), dtype=np.float32).reshape(-1, 4, 4)
+
+
+class SkeletonRenderer:
+    """
+    여러 캐릭터의 skeleton을 instancing으로 한 번에 그립니다.
+    frame마다 add(root_joint, color)로 캐릭터를 모으고 draw()로 그립니다. add는 그 순간의 kinematics를 복사하므로
+    crowd처럼 skeleton 하나를 돌려 쓰는 경우에도 agent마다 pose를 적용한 직후에 부르면 됩니다.
+    GL context가 만들어진 뒤 첫 draw에서 초기화하고, instancing을 쓸 수 없으면 draw_humanoid로 그립니다.
+    :param instanced: False면 항상 draw_humanoid로 그림 (비교용)
+    """
+    def __init__(self, instanced=True):
+        self.instanced = instanced
+        self.program = None
+        self.meshes = {}
+        self.instance_buffer = None
+        self.shapes = {}
+        self._spheres = []
+        self._bones = []
+
+    def _init_gl(self):
+        if not (bool(glDrawElementsInstanced) and bool(glVertexAttribDivisor)):
+            print("Instanced drawing is not supported; falling back to draw_humanoid.")
+            self.instanced = False
+            return
+        self.program = _link_program(_VERTEX_SHADER, _FRAGMENT_SHADER, _ATTRIBUTES)
+        self.meshes = {'sphere': _upload_mesh(*unit_sphere()), 'box': _upload_mesh(*unit_box())}
+        self.instance_buffer = glGenBuffers(1)
+
+    def shape(self, root_joint):
+        shape = self.shapes.get(id(root_joint))
+        if shape is None or shape.root_joint is not root_joint:
+            shape = self.shapes[id(root_joint)] = _SkeletonShape(root_joint)
+        return shape
+
+    def add(self, root_joint, color, root_kinematics=None):
+        """
+        root_joint(VirtualRoot)부터 현재 kinematics로 skeleton 하나를 이번 frame에 그릴 목록에 넣습니다.
+        :param root_kinematics: root_joint.kinematics 대신 쓸 root 변환 (render 보간 등)
+        """
+        if not self.instanced:
+            draw_humanoid(root_joint, color, root_kinematics)
+            return
+        shape = self.shape(root_joint)
+        worlds = shape.world_matrices(root_kinematics)
+
+        spheres = np.empty((len(shape.sphere_joints), INSTANCE_FLOATS), dtype=np.float32)
+        # world * scale(joint_size): column-major에서는 앞의 세 column에 곱함
+        spheres[:, :16] = worlds[shape.sphere_joints].reshape(-1, 16)
+        spheres[:, :12] *= joint_size
+        spheres[:, 16:19] = SPHERE_COLOR
+        spheres[:, 19] = 0
+
+        bones = np.empty((len(shape.bone_parents), INSTANCE_FLOATS), dtype=np.float32)
+        # world * local == (local^T @ world^T)^T
+        bones[:, :16] = np.matmul(shape.bone_locals, worlds[shape.bone_parents]).reshape(-1, 16)
+        bones[:, 16:19] = color
+        bones[:, 19] = 0
+
+        self._spheres.append(spheres)
+        self._bones.append(bones)
+
+    def draw(self):
+        """
+        이번 frame에 add된 skeleton을 모두 그리고 목록을 비웁니다.
+        """
+        if self.instanced and self.program is None:
+            self._init_gl()
+        if not self.instanced or not self._spheres:
+            self._spheres, self._bones = [], []
+            return
+        instances = np.concatenate(self._spheres + self._bones)
+        sphere_count = sum(len(spheres) for spheres in self._spheres)
+        self._spheres, self._bones = [], []
+
+        glUseProgram(self.program)
+        glBindBuffer(GL_ARRAY_BUFFER, self.instance_buffer)
+        glBufferData(GL_ARRAY_BUFFER, instances.nbytes, instances, GL_STREAM_DRAW)
+        for location in range(len(_ATTRIBUTES)):
+            glEnableVertexAttribArray(location)
+            glVertexAttribDivisor(location, 1 if location >= 2 else 0)
+
+        self._draw_instances(self.meshes['sphere'], 0, sphere_count)
+        self._draw_instances(self.meshes['box'], sphere_count, len(instances) - sphere_count)
+
+        for location in range(len(_ATTRIBUTES)):
+            glVertexAttribDivisor(location, 0)
+            glDisableVertexAttribArray(location)
+        glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, 0)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+        glUseProgram(0)
+
+    def _draw_instances(self, mesh, first, count):
+        if count == 0:
+            return
+        vertex_buffer, index_buffer, index_count = mesh
+        glBindBuffer(GL_ARRAY_BUFFER, vertex_buffer)
+        glVertexAttribPointer(0, 3, GL_FLOAT, GL_FALSE, 24, ctypes.c_void_p(0))
+        glVertexAttribPointer(1, 3, GL_FLOAT, GL_FALSE, 24, ctypes.c_void_p(12))
+
+        stride = INSTANCE_FLOATS * 4
+        base = first * stride
+        glBindBuffer(GL_ARRAY_BUFFER, self.instance_buffer)
+        for column in range(4):
+            glVertexAttribPointer(2 + column, 4, GL_FLOAT, GL_FALSE, stride, ctypes.c_void_p(base + column * 16))
+        glVertexAttribPointer(6, 3, GL_FLOAT, GL_FALSE, stride, ctypes.c_void_p(base + 64))
+
+        glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, index_buffer)
+        glDrawElementsInstanced(GL_TRIANGLES, index_count, GL_UNSIGNED_INT, ctypes.c_void_p(0), count)
+
+
+def _upload_mesh(vertices, indices):
+    """
+    :return: (vertex buffer, index buffer, index 수)
+    """
+    vertex_buffer, index_buffer = glGenBuffers(2)
+    glBindBuffer(GL_ARRAY_BUFFER, vertex_buffer)
+    glBufferData(GL_ARRAY_BUFFER, vertices.nbytes, vertices, GL_STATIC_DRAW)
+    glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, index_buffer)
+    glBufferData(GL_ELEMENT_ARRAY_BUFFER, indices.nbytes, indices, GL_STATIC_DRAW)
+    glBindBuffer(GL_ARRAY_BUFFER, 0)
+    glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, 0)
+    return vertex_buffer, index_buffer, len(indices)
+
+
+def _compile_shader(source, shader_type):
+    shader = glCreateShader(shader_type)
+    glShaderSource(shader, source)
+    glCompileShader(shader)
+    if not glGetShaderiv(shader, GL_COMPILE_STATUS):
+        raise RuntimeError(f"Shader compile failed: {glGetShaderInfoLog(shader)}")
+    return shader
+
+
+def _link_program(vertex_source, fragment_source, attributes):
+    """
+    attributes 순서대로 attribute location을 0, 1, ...에 묶어서 program을 만듭니다.
+    """
+    program = glCreateProgram()
+    shaders = [_compile_shader(vertex_source, GL_VERTEX_SHADER), _compile_shader(fragment_source, GL_FRAGMENT_SHADER)]
+    for shader in shaders:
+        glAttachShader(program, shader)
+    for location, name in enumerate(attributes):
+        glBindAttribLocation(program, location, name)
+    glLinkProgram(program)
+    if not glGetProgramiv(program, GL_LINK_STATUS):
+        raise RuntimeError(f"Program link failed: {glGetProgramInfoLog(program)}")
+    for shader in shaders:
+        glDeleteShader(shader)
+    return program
@@ -1,4 +1,5 @@
 import imgui
+import time
 from bvh_controller import connect
 from utils import blend_color
 
@@ -97,3 +98,50 @@ def draw_side_panel(state, viewport):
                     print("Motions connected:", new_name)
 
     imgui.end()
+
+
+def draw_profiler_panel(state, viewport):
+    """
+    단계별 frame time (평균/p95/최대)과 frame time 그래프. 3D 화면 왼쪽 위에 접힌 채로 시작합니다.
+    """
+    profiler = state.get('profiler')
+    if profiler is None:
+        return
+
+    imgui.set_next_window_position(viewport.work_pos.x + 10, viewport.work_pos.y + 10,
+                                   condition=imgui.FIRST_USE_EVER)
+    imgui.set_next_window_size(340, 300, condition=imgui.FIRST_USE_EVER)
+    imgui.set_next_window_collapsed(not profiler.enabled, condition=imgui.FIRST_USE_EVER)
+
+    expanded, _ = imgui.begin("Profiler")
+    if expanded:
+        changed, enabled = imgui.checkbox("Enabled", profiler.enabled)
+        if changed:
+            profiler.enabled = enabled
+        imgui.same_line()
+        if imgui.button("Reset"):
+            profiler.reset()
+        imgui.same_line()
+        if imgui.button("Dump trace"):
+            path = time.strftime("trace_%Y%m%d_%H%M%S.json")
+            print(f"Trace saved: {path} ({profiler.dump_trace(path)} events)")
+
+        frame_times = profiler.frame_times.values()
+        if len(frame_times):
+            imgui.plot_lines("##frame", frame_times, overlay_text=f"frame {frame_times[-1]:.2f} ms",
+                             scale_min=0.0, scale_max=max(float(frame_times.max()), 16.7),
+                             graph_size=(imgui.get_content_region_available_width(), 60))
+
+        imgui.columns(4, "profiler_stages")
+        for label in ("stage", "mean", "p95", "max"):
+            imgui.text(label)
+            imgui.next_column()
+        imgui.separator()
+        for name, values in profiler.summary().items():
+            imgui.text(name)
+            imgui.next_column()
+            for value in values:
+                imgui.text(f"{value:.2f}")
+                imgui.next_column()
+        imgui.columns(1)
+    imgui.end()
@@ -0,0 +1,386 @@
+import argparse
+import json
+import os
+import platform
+import subprocess
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+from bvh_controller import parse_bvh, connect, get_preorder_joint_list
+from feature_extractor import MotionKDTree, read_bvh_file, prepare_motion
+from search_backends import BACKENDS, make_backend
+
+TEMPLATE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'base_data.bvh')
+
+
+def make_queries(feature_vectors, count, noise, seed=0):
+    """
+    database의 임의 frame에 noise를 더한 query를 만듭니다.
+    """
+    rng = np.random.default_rng(seed)
+    rows = rng.integers(0, len(feature_vectors), count)
+    queries = np.asarray(feature_vectors[rows], dtype=np.float32)
+    return queries + rng.normal(0.0, noise, queries.shape).astype(np.float32)
+
+
+def recall(feature_vectors, queries, idxs, exact_dists):
+    """
+    찾은 frame의 거리가 정확한 최근접 거리와 같은 비율. 같은 feature가 여러 frame에 있을 수 있으므로 index 대신 거리로 비교합니다.
+    """
+    dists = np.linalg.norm(np.asarray(feature_vectors[np.asarray(idxs)], dtype=np.float64) - queries, axis=1)
+    return float(np.mean(dists <= exact_dists + 1e-9))
+
+
+def benchmark_backend(name, feature_vectors, queries, exact_dists, options=None, clip_offsets=None):
+    """
+    backend 하나의 생성 시간, 단일/일괄 query 시간, 정확 검색 대비 일치율을 잽니다.
+    :param clip_offsets: clip 경계 행 번호. clip 단위로 block을 나누는 backend(aabb)에 넘김
+    :return: 결과 dict
+    """
+    start = time.perf_counter()
+    backend = make_backend(name, feature_vectors, clip_offsets, **(options or {}))
+    build_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    single_idxs = [backend.query(query)[1] for query in queries]
+    single_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    _, batch_idxs = backend.query_batch(queries)
+    batch_time = time.perf_counter() - start
+
+    result = {
+        'backend': name,
+        'exact': backend.exact,
+        'build_s': build_time,
+        'single_query_us': single_time / len(queries) * 1e6,
+        'batch_query_us': batch_time / len(queries) * 1e6,
+        'recall': recall(feature_vectors, queries, single_idxs, exact_dists),
+        'batch_recall': recall(feature_vectors, queries, batch_idxs, exact_dists),
+    }
+    if hasattr(backend, 'stats'):
+        result['stats'] = dict(backend.stats)
+        if hasattr(backend, 'components'):
+            result['stats']['components'] = backend.components
+    return result
+
+
+def print_results(results):
+    print(f"{'backend':<10}{'exact':>7}{'build(s)':>10}{'single(us)':>12}{'batch(us)':>11}{'recall':>8}")
+    for r in results:
+        print(f"{r['backend']:<10}{str(r['exact']):>7}{r['build_s']:>10.3f}"
+              f"{r['single_query_us']:>12.1f}{r['batch_query_us']:>11.1f}{r['recall']:>8.3f}")
+    for r in results:
+        stats = r.get('stats')
+        if stats and stats.get('queries'):
+            print(f"{r['backend']}: " + ', '.join(f"{key}={value}" for key, value in stats.items()))
+
+def load_template(path=TEMPLATE_PATH):
+    """
+    synthetic clip의 바탕이 될 BVH를 읽습니다.
+    :return: dict — header(MOTION 앞까지의 HIERARCHY), data(frame, channel), channel 이름, root channel 수
+    """
+    with open(path) as file:
+        text = file.read()
+    root, motion = parse_bvh(path)
+    channels = [channel for joint in get_preorder_joint_list(root) for channel in joint.channels]
+    return {
+        'header': text[:text.index('MOTION')],
+        'data': np.asarray(motion.motion_data, dtype=np.float64),
+        'frame_time': motion.frame_time,
+        'channels': channels,
+        'root_channels': len(root.channels),
+    }
+
+
+def synthesize_channels(template, frames, rng, noise=3.0, swing=10.0, max_speed=20.0, turn=30.0):
+    """
+    template motion을 흔들어 frames 길이의 channel 배열을 만듭니다.
+    template을 재생 속도를 바꿔 왕복 재생하고 (base_data.bvh처럼 정지 pose여도 됨), 회전 channel에 걸음 주기의 흔들림과
+    완만한 noise를 더하고, root를 진행 방향으로 걷게 합니다.
+    :param noise: 회전 channel noise의 크기 (도)
+    :param swing: 걸음 주기 흔들림의 크기 (도)
+    :param max_speed: root의 최대 이동 속도 (단위/초)
+    :param turn: 진행 방향이 도는 최대 속도 (도/초)
+    """
+    data = template['data']
+    channels = template['channels']
+    frame_time = template['frame_time']
+    rotation_cols = np.array([not name.endswith('position') for name in channels])
+    # 각도가 ±180에서 튀지 않도록 펴서 보간
+    data = data.copy()
+    data[:, rotation_cols] = np.degrees(np.unwrap(np.radians(data[:, rotation_cols]), axis=0))
+
+    # 0 → 끝 → 0으로 왕복하며 재생 위치를 고름
+    last = max(len(data) - 1, 1)
+    data = np.concatenate([data, data[-1:]]) if len(data) == 1 else data
+    t = (rng.uniform(0, last) + np.arange(frames) * rng.uniform(0.8, 1.2)) % (2 * last)
+    t = np.where(t > last, 2 * last - t, t)
+    i0 = np.minimum(t.astype(np.int64), last - 1)
+    w = (t - i0)[:, None]
+    out = data[i0] * (1 - w) + data[i0 + 1] * w
+
+    seconds = np.arange(frames)[:, None] * frame_time
+    num_channels = len(channels)
+    # 모든 회전 channel이 같은 걸음 주기로 흔들림 + channel마다 느린 noise
+    gait = 2 * np.pi * rng.uniform(0.8, 2.0) * seconds
+    offsets = rng.normal(0, swing / 2, num_channels) * np.sin(gait + rng.uniform(0, 2 * np.pi, num_channels))
+    amp = rng.normal(0, noise / 3, (3, 1, num_channels))
+    freq = rng.uniform(0.1, 1.0, (3, 1, num_channels))
+    phase = rng.uniform(0, 2 * np.pi, (3, 1, num_channels))
+    offsets += np.sum(amp * np.sin(2 * np.pi * freq * seconds + phase), axis=0)
+    out[:, rotation_cols] += offsets[:, rotation_cols]
+
+    # root: 서고 걷기를 반복하며 천천히 도는 방향으로 이동
+    root = channels[:template['root_channels']]
+    x, z, yaw = root.index('Xposition'), root.index('Zposition'), root.index('Yrotation')
+    seconds = seconds[:, 0]
+    speed = max_speed * np.clip(0.6 + 0.6 * np.sin(2 * np.pi * rng.uniform(0.02, 0.1) * seconds
+                                                    + rng.uniform(0, 2 * np.pi)), 0, 1)
+    turn_rate = np.radians(turn) * np.sin(2 * np.pi * rng.uniform(0.05, 0.2) * seconds + rng.uniform(0, 2 * np.pi))
+    heading = rng.uniform(0, 2 * np.pi) + np.cumsum(turn_rate) * frame_time
+    step = np.diff(out[:, [x, z]], axis=0, prepend=out[:1, [x, z]])
+    cos, sin = np.cos(heading), np.sin(heading)
+    out[:, x] = out[0, x] + np.cumsum(cos * step[:, 0] + sin * step[:, 1] + sin * speed * frame_time)
+    out[:, z] = out[0, z] + np.cumsum(-sin * step[:, 0] + cos * step[:, 1] + cos * speed * frame_time)
+    out[:, yaw] += np.degrees(heading)
+    return out
+
+
+def write_bvh(path, template, data):
+    with open(path, 'w') as file:
+        file.write(template['header'])
+        file.write(f"MOTION\nFrames: {len(data)}\nFrame Time: {template['frame_time']:.7f}\n")
+        np.savetxt(file, data, fmt='%.5f')
+
+
+def generate_library(out_dir, clips, seconds, template_path=TEMPLATE_PATH, seed=0):
+    """
+    template skeleton으로 전체 길이가 약 seconds초인 synthetic BVH clip들을 out_dir에 씁니다.
+    clip 길이는 평균의 ±25% 안에서 무작위입니다.
+    :return: 쓴 BVH 경로 목록
+    """
+    template = load_template(template_path)
+    rng = np.random.default_rng(seed)
+    mean_frames = seconds / template['frame_time'] / clips
+    os.makedirs(out_dir, exist_ok=True)
+    paths = []
+    for i in range(clips):
+        # 검색 대상에서 빠지는 앞뒤 frame보다 길어야 함
+        frames = max(int(mean_frames * rng.uniform(0.75, 1.25)), 64)
+        path = os.path.join(out_dir, f"synthetic_{i:04d}.bvh")
+        write_bvh(path, template, synthesize_channels(template, frames, rng))
+        paths.append(path)
+    return paths
+
+
+def measure_stage(run, setup=None, repeat=3, items=1):
+    """
+    stage 하나를 repeat번 재고, 따로 한 번 더 실행해 tracemalloc으로 최대 메모리를 잽니다.
+    setup은 매번 시간 밖에서 호출되어 run의 인자를 만듭니다.
+    :param items: 처리한 frame/query 수 (item당 시간 계산용)
+    """
+    times = []
+    for _ in range(repeat):
+        args = setup() if setup else None
+        start = time.perf_counter()
+        run(args)
+        times.append(time.perf_counter() - start)
+
+    args = setup() if setup else None
+    tracemalloc.start()
+    run(args)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        'seconds': min(times),
+        'mean_seconds': float(np.mean(times)),
+        'items': items,
+        'per_item_us': min(times) / max(items, 1) * 1e6,
+        'peak_mb': peak / 2 ** 20,
+    }
+
+
+def benchmark_stages(library_dir, paths, repeat=3, queries=1000, connects=100, skeleton_frames=1000, seed=0):
+    """
+    BVH 읽기부터 검색, 전환, pose 적용까지 각 단계를 잽니다.
+    :return: {stage 이름: measure_stage 결과}
+    """
+    rng = np.random.default_rng(seed)
+
+    def parsed():
+        return [parse_bvh(path) for path in paths]
+
+    def with_quaternions():
+        clips = parsed()
+        for root, motion in clips:
+            motion.build_quaternion_frames(get_preorder_joint_list(root))
+        return clips
+
+    def with_virtual():
+        return [(motion, motion.apply_virtual(root)) for root, motion in with_quaternions()]
+
+    def with_velocity():
+        clips = with_virtual()
+        for motion, virtual in clips:
+            motion.apply_velocity_feature(virtual)
+        return clips
+
+    def prepared():
+        return [read_bvh_file(path) for path in paths]
+
+    total_frames = sum(motion.frames for _, motion in parsed())
+    stages = {}
+    stages['parse_bvh'] = measure_stage(lambda _: parsed(), repeat=repeat, items=total_frames)
+    stages['build_quaternion_frames'] = measure_stage(
+        lambda clips: [motion.build_quaternion_frames(get_preorder_joint_list(root)) for root, motion in clips],
+        parsed, repeat, total_frames)
+    stages['apply_virtual'] = measure_stage(
+        lambda clips: [motion.apply_virtual(root) for root, motion in clips], with_quaternions, repeat, total_frames)
+    stages['velocity_feature'] = measure_stage(
+        lambda clips: [motion.apply_velocity_feature(virtual) for motion, virtual in clips],
+        with_virtual, repeat, total_frames)
+    stages['future_feature'] = measure_stage(
+        lambda clips: [motion.apply_future_feature() for motion, _ in clips], with_velocity, repeat, total_frames)
+    stages['extract_features'] = measure_stage(
+        lambda motions: [MotionKDTree.extract_feature_matrix(motion, 1, max(len(motion.velocities) - 21, 1))
+                         for motion in motions],
+        prepared, repeat, total_frames)
+
+    stages['kdtree_build'] = measure_stage(lambda _: MotionKDTree(library_dir), repeat=repeat, items=total_frames)
+    tree = MotionKDTree(library_dir)
+    query_vecs = make_queries(np.asarray(tree.feature_vectors), queries, 0.05, seed)
+    stages['search'] = measure_stage(lambda _: [tree.search(query) for query in query_vecs],
+                                     repeat=repeat, items=queries)
+    stages['search_batch'] = measure_stage(lambda _: tree.search_batch(query_vecs), repeat=repeat, items=queries)
+
+    motions = prepared()
+    pairs = []
+    for _ in range(connects):
+        a, b = rng.integers(0, len(motions), 2)
+        start = int(rng.integers(0, motions[a].frames - 20))
+        matched = int(rng.integers(0, motions[b].frames - 20))
+        pairs.append((motions[a][start:start + 20], motions[b][matched:]))
+    stages['connect'] = measure_stage(lambda _: [connect(m1, m2, 0, transition_frames=20) for m1, m2 in pairs],
+                                      repeat=repeat, items=connects)
+
+    root, motion = parse_bvh(paths[0])
+    virtual = prepare_motion(root, motion)
+    frames = [i % motion.frames for i in range(skeleton_frames)]
+    stages['apply_to_skeleton'] = measure_stage(lambda _: [motion.apply_to_skeleton(i, virtual) for i in frames],
+                                                repeat=repeat, items=skeleton_frames)
+    return stages
+
+
+def parse_scale(text):
+    """
+    'clip 수x전체 초' (예: 16x120)
+    """
+    clips, _, seconds = text.lower().partition('x')
+    return int(clips), float(seconds)
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=os.path.dirname(os.path.abspath(__file__)),
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_suite(scales, repeat=3, queries=1000, template_path=TEMPLATE_PATH, library_dir=None, seed=0):
+    """
+    scale마다 synthetic library를 만들고 benchmark_stages를 실행합니다.
+    :param scales: [(clip 수, 전체 초)]
+    :param library_dir: 주어지면 생성한 library를 그 아래에 남김 (없으면 임시 폴더)
+    :return: JSON으로 저장할 결과 dict
+    """
+    results = {
+        'commit': git_commit(),
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'machine': platform.machine(),
+        'scales': [],
+    }
+    for clips, seconds in scales:
+        with tempfile.TemporaryDirectory() as tmp:
+            out_dir = os.path.join(library_dir or tmp, f"{clips}x{seconds:g}")
+            paths = generate_library(out_dir, clips, seconds, template_path, seed)
+            stages = benchmark_stages(out_dir, paths, repeat, queries, seed=seed)
+        frames = stages['parse_bvh']['items']
+        results['scales'].append({'clips': clips, 'seconds': seconds, 'frames': frames, 'stages': stages})
+        print_suite_scale(results['scales'][-1])
+    return results
+
+
+def print_suite_scale(scale, baseline=None):
+    print(f"\n{scale['clips']} clips, {scale['seconds']:g}s ({scale['frames']} frames)")
+    header = f"{'stage':<26}{'total(ms)':>11}{'per item(us)':>14}{'peak(MB)':>10}"
+    print(header + (f"{'vs base':>9}" if baseline else ''))
+    for name, stage in scale['stages'].items():
+        line = f"{name:<26}{stage['seconds'] * 1e3:>11.2f}{stage['per_item_us']:>14.2f}{stage['peak_mb']:>10.2f}"
+        base = (baseline or {}).get(name)
+        if base:
+            line += f"{stage['seconds'] / base['seconds']:>8.2f}x"
+        print(line)
+
+
+def compare_results(results, baseline):
+    """
+    같은 scale의 이전 결과와 단계별 시간 비율을 출력합니다 (1보다 작으면 빨라진 것).
+    """
+    print(f"\ncompared with {baseline.get('commit') or 'baseline'}")
+    for scale in results['scales']:
+        base = next((b for b in baseline.get('scales', [])
+                     if b['clips'] == scale['clips'] and b['seconds'] == scale['seconds']), None)
+        if base:
+            print_suite_scale(scale, base['stages'])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="motion matching 검색 backend 비교 / 단계별 benchmark suite")
+    parser.add_argument('root_path', nargs='?', help="BVH 폴더 (backend 비교)")
+    parser.add_argument('--cache-dir', default=None)
+    parser.add_argument('--backends', nargs='+', default=list(BACKENDS), choices=list(BACKENDS))
+    parser.add_argument('--queries', type=int, default=1000)
+    parser.add_argument('--noise', type=float, default=0.05)
+    parser.add_argument('--suite', action='store_true', help="synthetic library로 단계별 시간/메모리 측정")
+    parser.add_argument('--scales', nargs='+', default=['4x30', '16x120'], help="'clip 수x전체 초' 목록")
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--template', default=TEMPLATE_PATH, help="synthetic clip의 skeleton/motion BVH")
+    parser.add_argument('--library-dir', default=None, help="생성한 library를 남길 폴더")
+    parser.add_argument('--json', default=None, help="결과를 저장할 JSON 경로")
+    parser.add_argument('--baseline', default=None, help="비교할 이전 결과 JSON")
+    args = parser.parse_args()
+
+    if args.suite:
+        results = run_suite([parse_scale(scale) for scale in args.scales], args.repeat, args.queries,
+                            args.template, args.library_dir)
+        if args.baseline:
+            with open(args.baseline) as file:
+                compare_results(results, json.load(file))
+        if args.json:
+            with open(args.json, 'w') as file:
+                json.dump(results, file, indent=2)
+        return
+    if not args.root_path:
+        parser.error("root_path is required unless --suite is given")
+
+    tree = MotionKDTree(args.root_path, cache_dir=args.cache_dir)
+    feature_vectors = np.asarray(tree.feature_vectors)
+    print(f"database: {feature_vectors.shape[0]} frames x {feature_vectors.shape[1]} dims, "
+          f"configured backend: {tree.backend_description()}")
+
+    queries = make_queries(feature_vectors, args.queries, args.noise)
+    exact_dists, _ = make_backend('brute', feature_vectors).query_batch(queries)
+    clip_offsets = tree.index.clip_offsets
+    print_results([benchmark_backend(name, feature_vectors, queries, exact_dists, clip_offsets=clip_offsets)
+                   for name in args.backends])
+
+
+if __name__ == "__main__":
+    main()
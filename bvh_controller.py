@@ -1,5 +1,8 @@
 from pyglm import glm
-from virtual_transforms import get_pelvis_virtual_safe
+import bisect
+import copy
+from virtual_transforms import split_pelvis_virtual, euler_to_quat, forward_kinematics, quat_multiply, quat_conjugate, quat_rotate, quat_slerp, vec_mix, \
+    quat_to_rotation_vector, quat_from_rotation_vector
 import math
 import numpy as np
 
@@ -11,6 +14,12 @@ def mat4_close(a, b, eps=1e-4):
                 return False
     return True
 
+# apply_future_feature가 기본으로 보는 미래 frame 간격
+FUTURE_HORIZONS = (20, 40, 60)
+
+# inertialize가 pose 차이를 줄이는 기본 반감기 (초)
+INERTIALIZATION_HALFLIFE = 0.1
+
 class Joint:
     def __init__(self, name, offset, channels):
         self.name = name
@@ -29,10 +38,87 @@ class VirtualRootJoint(Joint):
         super().__init__("VirtualRoot", [0, 0, 0], ['Xposition', 'Yposition', 'Zposition', 'Zrotation', 'Yrotation', 'Xrotation'])
         self.add_child(root)
 
+class SkeletonLayout:
+    """
+    Motion 배열의 column 배치입니다. joint 이름 -> column 번호를 skeleton 당 한 번만 만듭니다.
+    rotation column은 preorder joint 순서(중복되는 'End Site'는 하나) 뒤에 VirtualRoot,
+    position column은 position channel이 있는 joint 뒤에 VirtualRoot 순서입니다.
+    """
+    def __init__(self, rotation_names, position_names):
+        self.rotation_names = list(rotation_names)
+        self.position_names = list(position_names)
+        self.rotation_index = {name: i for i, name in enumerate(self.rotation_names)}
+        self.position_index = {name: i for i, name in enumerate(self.position_names)}
+
+    @classmethod
+    def from_joint_order(cls, joint_order):
+        rotation_names = list(dict.fromkeys(joint.name for joint in joint_order))
+        position_names = [joint.name for joint in joint_order
+                          if any(ch.endswith('position') for ch in joint.channels)]
+        return cls(rotation_names + ["VirtualRoot"], position_names + ["VirtualRoot"])
+
+    def __eq__(self, other):
+        return (isinstance(other, SkeletonLayout)
+                and self.rotation_names == other.rotation_names
+                and self.position_names == other.position_names)
+
+
+class JointArrayView:
+    """
+    (J, k) 배열 한 행을 joint 이름으로 읽고 쓰는 dict 호환 accessor입니다.
+    읽으면 glm.quat / glm.vec3 값을 새로 만들어 반환하고, 쓰면 배열에 바로 기록합니다.
+    :param writable: 처음 쓸 때 부르는 함수. 쓸 수 있는 행을 돌려줌 (Motion.writable_row). None이면 row에 그대로 씀
+    """
+    def __init__(self, row, index, value_type, writable=None):
+        self.row = row
+        self.index = index
+        self.value_type = value_type
+        self._writable = writable
+
+    def __getitem__(self, name):
+        return self.value_type(*self.row[self.index[name]].tolist())
+
+    def __setitem__(self, name, value):
+        if self._writable is not None:
+            self.row = self._writable()
+            self._writable = None
+        self.row[self.index[name]] = value
+
+    def __contains__(self, name):
+        return name in self.index
+
+    def __iter__(self):
+        return iter(self.index)
+
+    def __len__(self):
+        return len(self.index)
+
+    def get(self, name, default=None):
+        if name in self.index:
+            return self[name]
+        return default
+
+    def keys(self):
+        return self.index.keys()
+
+    def values(self):
+        return [self.value_type(*v) for v in self.row.tolist()]
+
+    def items(self):
+        return zip(self.index.keys(), self.values())
+
+
 class MotionFrame:
-    def __init__(self):
-        self.joint_rotations = {}
-        self.joint_positions = {}
+    """
+    Motion 배열의 한 frame을 예전처럼 frame.joint_rotations[name] 으로 접근하기 위한 view입니다.
+    쓰면 motion이 소유한 배열에 기록합니다 (Motion.writable_row).
+    """
+    def __init__(self, motion, index):
+        layout = motion.layout
+        self.joint_rotations = JointArrayView(motion.row('rotations', index), layout.rotation_index, glm.quat,
+                                              lambda: motion.writable_row('rotations', index))
+        self.joint_positions = JointArrayView(motion.row('positions', index), layout.position_index, glm.vec3,
+                                              lambda: motion.writable_row('positions', index))
 
 class FeatureFrame:
     def __init__(self):
@@ -41,175 +127,528 @@ class FeatureFrame:
         self.future_position = []
         self.future_orientation = []
 
+    @classmethod
+    def from_motion(cls, motion, index):
+        """
+        Motion의 feature 배열에서 index frame을 glm 값으로 복사한 FeatureFrame을 만듭니다.
+        """
+        feature_frame = cls()
+        velocities = motion.row('velocities', index).tolist()
+        site_positions = motion.row('site_positions', index).tolist()
+        for name, vel, pos in zip(motion.site_names, velocities, site_positions):
+            feature_frame.velocity[name] = glm.vec3(*vel)
+            feature_frame.site_positions[name] = glm.vec3(*pos)
+        feature_frame.future_position = [glm.vec3(*p) for p in motion.row('future_positions', index).tolist()]
+        feature_frame.future_orientation = [glm.vec3(*f) for f in motion.row('future_orientations', index).tolist()]
+        return feature_frame
+
+
+class FrameSequence:
+    """
+    motion.quaternion_frames / motion.feature_frames 호환용 sequence입니다.
+    원소는 접근할 때 factory(motion, index)로 만들어집니다.
+    """
+    def __init__(self, motion, factory, length):
+        self.motion = motion
+        self.factory = factory
+        self.length = length
+
+    def __len__(self):
+        return self.length()
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return [self.factory(self.motion, i) for i in range(*key.indices(len(self)))]
+        if key < 0:
+            key += len(self)
+        if not 0 <= key < len(self):
+            raise IndexError("frame index out of range")
+        return self.factory(self.motion, key)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self.factory(self.motion, i)
+
+
+class MotionSegment:
+    """
+    lazy Motion의 한 구간입니다. source 배열들의 [start, stop) frame을 복사 없이 가리키고,
+    VirtualRoot offset(회전 rotation_offset, 이동 position_offset)은 frame을 읽을 때 적용합니다.
+    feature 중 발 위치/속도는 전역 방향 기준이라 offset 회전을, Hips 위치는 VirtualRoot 이동을 따라가고,
+    나머지(VirtualRoot 기준 Hips 속도, 미래 궤적)는 그대로 읽습니다.
+    :param arrays: {배열 이름: (F, ...) 배열} — Motion.LAZY_ARRAYS 중 이 구간에 있는 것
+    """
+    def __init__(self, arrays, start, stop, layout, rotation_offset=None, position_offset=None):
+        self.arrays = arrays
+        self.start = start
+        self.stop = stop
+        self.layout = layout
+        self._set_offset(rotation_offset, position_offset)
+
+    def _set_offset(self, rotation_offset, position_offset):
+        self.rotation_offset = rotation_offset
+        self.position_offset = position_offset
+        if rotation_offset is not None:
+            # frame 하나만 읽을 때도 싸도록 offset을 행렬로: q_offset * q == q @ left.T, 회전 == v @ matrix.T
+            w, x, y, z = np.asarray(rotation_offset, dtype=np.float64).tolist()
+            self._left = np.array([[w, -x, -y, -z],
+                                   [x, w, -z, y],
+                                   [y, z, w, -x],
+                                   [z, -y, x, w]], dtype=np.float32).T.copy()
+            self._matrix = np.array([[1 - 2 * (y * y + z * z), 2 * (x * y - w * z), 2 * (x * z + w * y)],
+                                     [2 * (x * y + w * z), 1 - 2 * (x * x + z * z), 2 * (y * z - w * x)],
+                                     [2 * (x * z - w * y), 2 * (y * z + w * x), 1 - 2 * (x * x + y * y)]],
+                                    dtype=np.float32).T.copy()
+
+    def __len__(self):
+        return self.stop - self.start
+
+    def take(self, name, start, stop):
+        """
+        구간 안의 frame start ~ stop - 1 (구간 기준 번호). pose 배열이면 offset을 적용한 복사본
+        """
+        values = self.arrays[name][self.start + start:self.start + stop]
+        if self.rotation_offset is None or name not in ('rotations', 'positions', 'site_positions', 'velocities'):
+            return values
+        values = values.copy()
+        if name == 'rotations':
+            column = self.layout.rotation_index["VirtualRoot"]
+            values[:, column] = values[:, column] @ self._left
+        elif name == 'positions':
+            column = self.layout.position_index["VirtualRoot"]
+            values[:, column] = values[:, column] @ self._matrix + self.position_offset
+        else:
+            values[:, 1:] = values[:, 1:] @ self._matrix
+            if name == 'site_positions':
+                column = self.layout.position_index["VirtualRoot"]
+                root = self.arrays['positions'][self.start + start:self.start + stop, column]
+                values[:, 0] += root @ self._matrix + self.position_offset - root
+        return values
+
+    def slice(self, start, stop):
+        segment = copy.copy(self)
+        segment.start, segment.stop = self.start + start, self.start + stop
+        return segment
+
+    def with_offset(self, rotation_offset, position_offset):
+        """
+        이미 있는 offset 위에 (rotation_offset, position_offset)을 한 번 더 적용한 구간.
+        복사본을 고치므로 subclass(InertializedSegment 등)의 상태도 그대로 유지됩니다.
+        """
+        if self.rotation_offset is not None:
+            position_offset = quat_rotate(rotation_offset, self.position_offset) + position_offset
+            rotation_offset = quat_multiply(rotation_offset, self.rotation_offset)
+        segment = copy.copy(self)
+        segment._set_offset(rotation_offset.astype(np.float32), position_offset.astype(np.float32))
+        return segment
+
+
+def slice_segments(segments, start, stop):
+    """
+    이어 붙인 구간 목록에서 frame start ~ stop - 1에 해당하는 구간 목록 (복사 없음)
+    """
+    result = []
+    offset = 0
+    for segment in segments:
+        lo, hi = max(start - offset, 0), min(stop - offset, len(segment))
+        if lo < hi:
+            result.append(segment.slice(lo, hi))
+        offset += len(segment)
+    return result
+
+
+def gather_segments(segments, name):
+    """
+    구간들의 배열 name을 offset을 적용해 하나로 합칩니다.
+    """
+    return np.concatenate([segment.take(name, 0, len(segment)) for segment in segments])
+
+
+class InertializedSegment(MotionSegment):
+    """
+    전환 순간의 source와 target pose 차이(joint 별 회전 / 위치 offset과 그 속도)를 구간 위에 더하고
+    critically damped spring으로 줄여 나가는 구간입니다. offset은 frame을 읽을 때 계산하므로 frame마다 O(joint)입니다.
+    feature 배열은 target clip의 값을 그대로 읽습니다.
+    :param segment: offset을 얹을 MotionSegment
+    :param origin: 전환 시점(t = 0)에 해당하는 source 배열의 frame 번호
+    :param rotation_offsets: (J, 3) 회전 offset (회전 벡터), rotation_velocities는 그 각속도
+    :param position_offsets: (P, 3) 위치 offset, position_velocities는 그 속도
+    :param halflife: offset이 절반으로 줄어드는 시간 (초)
+    """
+    def __init__(self, segment, origin, rotation_offsets, rotation_velocities, position_offsets, position_velocities,
+                 frame_time, halflife):
+        super().__init__(segment.arrays, segment.start, segment.stop, segment.layout,
+                         segment.rotation_offset, segment.position_offset)
+        self.origin = origin
+        self.frame_time = frame_time
+        self.damping = np.float32(2 * math.log(2) / halflife)
+        # offset(t) = e^(-damping t) (x0 + (v0 + damping x0) t)
+        self.rotation_offsets = rotation_offsets.astype(np.float32)
+        self.position_offsets = position_offsets.astype(np.float32)
+        self._rotation_slopes = (rotation_velocities + self.damping * rotation_offsets).astype(np.float32)
+        self._position_slopes = (position_velocities + self.damping * position_offsets).astype(np.float32)
+
+    def with_offset(self, rotation_offset, position_offset):
+        """
+        VirtualRoot의 spring offset은 전역 방향 기준이므로 함께 회전합니다. 나머지 joint는 부모 기준이라 그대로입니다.
+        """
+        segment = super().with_offset(rotation_offset, position_offset)
+        vr_rot = self.layout.rotation_index["VirtualRoot"]
+        vr_pos = self.layout.position_index["VirtualRoot"]
+        rotation_offset = np.asarray(rotation_offset, dtype=np.float32)
+        for name, column in (('rotation_offsets', vr_rot), ('_rotation_slopes', vr_rot),
+                             ('position_offsets', vr_pos), ('_position_slopes', vr_pos)):
+            values = getattr(self, name).copy()
+            values[column] = quat_rotate(rotation_offset, values[column])
+            setattr(segment, name, values)
+        return segment
+
+    def take(self, name, start, stop):
+        values = super().take(name, start, stop)
+        if name not in ('rotations', 'positions'):
+            return values
+        t = ((np.arange(self.start + start, self.start + stop) - self.origin) * self.frame_time)
+        t = t.astype(np.float32)[:, None, None]
+        decay = np.exp(-self.damping * t)
+        if name == 'rotations':
+            offsets = decay * (self.rotation_offsets + self._rotation_slopes * t)
+            return quat_multiply(quat_from_rotation_vector(offsets), values).astype(np.float32)
+        return values + decay * (self.position_offsets + self._position_slopes * t)
+
+
 class Motion:
+    """
+    BVH motion입니다. 회전은 (F, J, 4) (w, x, y, z), 위치는 (F, P, 3) float32 배열에 저장하고,
+    column 배치는 layout(SkeletonLayout)이 정합니다.
+    feature는 site(Hips, 발) 별 velocities / site_positions (F, S, 3)와
+    future_positions / future_orientations (F, K, 3) 배열에 저장합니다.
+    connect로 만든 motion은 배열 대신 MotionSegment 목록을 들고 있다가(lazy), 전체 배열을 처음 읽을 때 합칩니다.
+    한 frame만 읽을 때는 row()를 쓰면 합치지 않습니다.
+    """
+    LAZY_ARRAYS = ('rotations', 'positions', 'velocities', 'site_positions', 'future_positions', 'future_orientations')
+
     def __init__(self, frames, frame_time):
+        self._arrays = {}
+        self._segments = None
+        self._segment_starts = None
         self.frames = frames
         self.frame_time = frame_time
-        self.motion_data = []
-        self.quaternion_frames = []
-        self.feature_frames = []
+        self.motion_data = np.empty((0, 0), dtype=np.float32)
+        self.channel_offsets = None
+        self.layout = None
+        self.rotations = np.zeros((0, 0, 4), dtype=np.float32)
+        self.positions = np.zeros((0, 0, 3), dtype=np.float32)
+        self.site_names = []
+        self.velocities = np.zeros((0, 0, 3), dtype=np.float32)
+        self.site_positions = np.zeros((0, 0, 3), dtype=np.float32)
+        self.future_positions = np.zeros((0, 0, 3), dtype=np.float32)
+        self.future_orientations = np.zeros((0, 0, 3), dtype=np.float32)
+        self.quaternion_frames = FrameSequence(self, MotionFrame, lambda: self.length('rotations'))
+        self.feature_frames = FrameSequence(self, FeatureFrame.from_motion, lambda: self.length('velocities'))
+
+    @classmethod
+    def from_segments(cls, frame_time, layout, segments, site_names=()):
+        """
+        MotionSegment들을 이어 붙인 lazy motion을 만듭니다. 모든 구간에 있는 배열만 lazy로 읽히고,
+        나머지(예: 한 구간에만 있는 feature)는 빈 배열입니다.
+        """
+        segments = [segment for segment in segments if len(segment)]
+        motion = cls(sum(len(segment) for segment in segments), frame_time)
+        motion.layout = layout
+        motion._segments = segments
+        motion._segment_starts = np.cumsum([0] + [len(segment) for segment in segments]).tolist()
+        for name in cls.LAZY_ARRAYS:
+            if segments and all(name in segment.arrays for segment in segments):
+                del motion._arrays[name]
+        if 'velocities' not in motion._arrays:
+            motion.site_names = list(site_names)
+        return motion
+
+    @property
+    def is_lazy(self):
+        return self._segments is not None
+
+    def segments(self):
+        """
+        이 motion을 이루는 MotionSegment 목록. 배열로 저장된 motion이면 자신 전체를 가리키는 구간 하나
+        """
+        if self._segments is not None:
+            return self._segments
+        arrays = {name: self._arrays[name] for name in self.LAZY_ARRAYS if len(self._arrays[name]) == self.frames}
+        return [MotionSegment(arrays, 0, self.frames, self.layout)]
+
+    def length(self, name):
+        if name in self._arrays:
+            return len(self._arrays[name])
+        return self.frames
+
+    def row(self, name, index):
+        """
+        배열 name의 index frame. lazy motion이어도 전체를 합치지 않고 해당 구간에서 읽습니다.
+        """
+        array = self._arrays.get(name)
+        if array is not None:
+            return array[index]
+        if index < 0:
+            index += self.frames
+        if not 0 <= index < self.frames:
+            raise IndexError("frame index out of range")
+        k = bisect.bisect_right(self._segment_starts, index) - 1
+        local = index - self._segment_starts[k]
+        return self._segments[k].take(name, local, local + 1)[0]
+
+    def writable_row(self, name, index):
+        """
+        배열 name의 index frame을 이 motion만 바뀌도록 쓸 수 있는 행으로 돌려줍니다.
+        lazy motion이면 먼저 합치고 구간을 버리며, 다른 motion과 공유하는 배열(slice view, memory-map)이면 복사합니다.
+        """
+        if name not in self._arrays:
+            self._set_array(name, gather_segments(self._segments, name))
+        array = self._arrays[name]
+        if array.base is not None or not array.flags.writeable:
+            array = self._arrays[name] = np.array(array)
+        return array[index]
+
+    def _materialize(self, name):
+        array = gather_segments(self._segments, name)
+        self._arrays[name] = array
+        return array
+
+    def _set_array(self, name, value):
+        # 배열을 새로 쓰면 구간과 어긋나므로 나머지 lazy 배열도 모두 합친 뒤 구간을 버림
+        if self._segments is not None:
+            for other in self.LAZY_ARRAYS:
+                if other not in self._arrays:
+                    self._materialize(other)
+            self._segments = None
+            self._segment_starts = None
+        self._arrays[name] = value
 
     def get_frames(self):
         return self.frames
     
     def __getitem__(self, key):
+        if isinstance(key, slice) and self._segments is not None and key.step in (None, 1):
+            start, stop, _ = key.indices(self.frames)
+            return Motion.from_segments(self.frame_time, self.layout,
+                                        slice_segments(self._segments, start, stop), self.site_names)
         if isinstance(key, slice):
             new_motion = Motion(0, self.frame_time)
-            new_motion.quaternion_frames = self.quaternion_frames[key]
-            new_motion.frames = len(new_motion.quaternion_frames)
+            new_motion.layout = self.layout
+            new_motion.rotations = self.rotations[key]
+            new_motion.positions = self.positions[key]
+            if len(self.velocities):
+                new_motion.site_names = self.site_names
+                new_motion.velocities = self.velocities[key]
+                new_motion.site_positions = self.site_positions[key]
+                new_motion.future_positions = self.future_positions[key]
+                new_motion.future_orientations = self.future_orientations[key]
+            new_motion.frames = len(new_motion.rotations)
             return new_motion
         elif isinstance(key, int):
             return self.quaternion_frames[key]
         else:
             raise TypeError("Motion indices must be integers or slices.")
 
-    def add_frame_data(self, frame_data):
-        self.motion_data.append(frame_data)
+    def get_pose_arrays(self):
+        """
+        :return: (rotation_names, rotations, position_names, positions)
+        """
+        return self.layout.rotation_names, self.rotations, self.layout.position_names, self.positions
+
+    @classmethod
+    def from_pose_arrays(cls, frame_time, rotation_names, rotations, position_names, positions):
+        """
+        pose 배열(예: cache에서 memory-map 한 배열)을 복사 없이 감싼 Motion을 만듭니다.
+        """
+        motion = cls(len(rotations), frame_time)
+        motion.layout = SkeletonLayout(rotation_names, position_names)
+        motion.rotations = rotations
+        motion.positions = positions
+        return motion
 
     def apply_velocity_feature(self, root):
         joint_chains = get_joint_chains_from_root(root)
+        site_names = [chain[-1].name for chain in joint_chains]
+
+        # 발 위치: root 기준(이동 제외) 전역 회전을 따라간 FK 결과
+        joints = get_preorder_joint_list(root)
+        parents = get_parent_indices(joints)
+        offsets = np.array([joint.offset for joint in joints], dtype=np.float32)
+        columns = [self.layout.rotation_index[joint.name] for joint in joints]
+        global_positions, _ = forward_kinematics(parents, offsets, self.rotations[:, columns])
+
+        site_positions = np.empty((len(self.rotations), len(site_names), 3), dtype=np.float32)
+        for s, chain in enumerate(joint_chains[1:], start=1):
+            site_positions[:, s] = global_positions[:, joints.index(chain[-1])]
+
+        # Hips 위치: VirtualRoot 위치 + Hips local 위치
+        position_index = self.layout.position_index
+        site_positions[:, 0] = self.positions[:, position_index[root.name]] + self.positions[:, position_index[root.children[0].name]]
+        site_positions[:1] = 0
+
+        velocities = np.zeros_like(site_positions)
+        velocities[1:] = site_positions[1:] - site_positions[:-1]
+        root_rotations = self.rotations[1:, self.layout.rotation_index[root.name]]
+        velocities[1:, 0] = quat_rotate(quat_conjugate(root_rotations), velocities[1:, 0])
+        velocities /= self.frame_time
+
+        self.site_names = site_names
+        self.velocities = velocities
+        self.site_positions = site_positions
+
+    def apply_future_feature(self, horizons=FUTURE_HORIZONS, end_policy='hold'):
+        """
+        VirtualRoot 기준 미래 위치/방향 feature를 계산합니다.
+        horizon이 clip 끝을 넘어가는 frame은 end_policy에 따라 처리합니다.
+          'hold': 모든 horizon이 유효한 마지막 frame의 값을 그대로 사용 (clip이 너무 짧으면 0)
+          'clamp': 넘어간 horizon은 마지막 frame을 미래 값으로 사용
+          'extrapolate': 마지막 두 frame의 이동을 이어서 위치를 연장하고, 방향은 마지막 frame을 유지
+        :param horizons: 미래 frame 간격 목록 (예: (20, 40, 60))
+        :param end_policy: 'hold', 'clamp', 'extrapolate' 중 하나
+        """
+        if end_policy not in ('hold', 'clamp', 'extrapolate'):
+            raise ValueError(f"Unknown end_policy: {end_policy}")
+        horizons = np.asarray(horizons, dtype=np.int64)
+        if horizons.ndim != 1 or np.any(horizons <= 0):
+            raise ValueError("horizons must be a list of positive frame counts.")
+
+        num_frames = len(self.rotations)
+        root_positions = self.positions[:, self.layout.position_index["VirtualRoot"]]
+        root_rotations = self.rotations[:, self.layout.rotation_index["VirtualRoot"]]
+        future_positions = np.zeros((num_frames, len(horizons), 3), dtype=np.float32)
+        future_orientations = np.zeros((num_frames, len(horizons), 3), dtype=np.float32)
+        if num_frames == 0:
+            self.future_positions = future_positions
+            self.future_orientations = future_orientations
+            return
+
+        # (F, K) 미래 frame 번호
+        future_index = np.arange(num_frames)[:, None] + horizons[None, :]
+        last = num_frames - 1
+        future_pos = root_positions[np.minimum(future_index, last)]
+        future_rot = root_rotations[np.minimum(future_index, last)]
+
+        if end_policy == 'extrapolate' and num_frames >= 2:
+            overshoot = np.maximum(future_index - last, 0).astype(np.float32)[..., None]
+            step = root_positions[last] - root_positions[last - 1]
+            future_pos = future_pos + overshoot * step
+
+        current_inv = quat_conjugate(root_rotations)[:, None]
+        rel_pos = quat_rotate(current_inv, future_pos - root_positions[:, None])
+        rel_rot = quat_multiply(current_inv, future_rot)
+        future_forward = quat_rotate(rel_rot, np.array([0, 0, 1], dtype=np.float32))
+
+        if end_policy == 'hold':
+            last_valid = num_frames - 1 - int(horizons.max())
+            if last_valid >= 0:
+                future_positions[:last_valid + 1] = rel_pos[:last_valid + 1]
+                future_orientations[:last_valid + 1] = future_forward[:last_valid + 1]
+                future_positions[last_valid + 1:] = rel_pos[last_valid]
+                future_orientations[last_valid + 1:] = future_forward[last_valid]
+        else:
+            future_positions[:] = rel_pos
+            future_orientations[:] = future_forward
 
-        for idx, frame in enumerate(self.quaternion_frames):
-            feature_frame = FeatureFrame()
-
-            if idx == 0:
-                for chain in joint_chains:
-                    feature_frame.site_positions[chain[-1].name] = glm.vec3(0,0,0)
-                    feature_frame.velocity[chain[-1].name] = glm.vec3(0,0,0)
-
-            else:
-                pos = frame.joint_positions[root.name] + frame.joint_positions[root.children[0].name]
-                feature_frame.site_positions["Hips"] = pos
-                vel = (pos - self.feature_frames[idx-1].site_positions["Hips"])
-                vel = glm.conjugate(frame.joint_rotations[root.name]) * vel
-                feature_frame.velocity["Hips"] = vel / self.frame_time
-                
-                for chain in joint_chains[1:]:
-                    pos = glm.vec3(0)
-                    rot = rot = glm.quat(1, 0, 0, 0)
-
-                    for joint in chain:
-                        offset = joint.offset
-                        q_local = frame.joint_rotations[joint.name]
-
-                        offset_rotated = rot * offset
-                        pos = pos + offset_rotated
-                        rot = rot * q_local
-                    feature_frame.site_positions[chain[-1].name] = pos
-                    feature_frame.velocity[chain[-1].name] = (pos - self.feature_frames[idx-1].site_positions[chain[-1].name]) / self.frame_time
-            
-            self.feature_frames.append(feature_frame)
-
-    def apply_future_feature(self):
-        fw = glm.vec3(0, 0, 1)
-        num_frames = len(self.quaternion_frames)
-
-        for idx, frame in enumerate(self.quaternion_frames):
-            feature_frame = self.feature_frames[idx]
-            current_pos = frame.joint_positions["VirtualRoot"]
-            current_rot = frame.joint_rotations["VirtualRoot"]
-
-            if idx <= num_frames - 60 - 1:
-                for k in [20, 40, 60]:
-                    future_frame = self.quaternion_frames[idx + k]
-                    future_pos = future_frame.joint_positions["VirtualRoot"]
-                    future_rot = future_frame.joint_rotations["VirtualRoot"]
-
-                    rel_pos = glm.conjugate(current_rot) * (future_pos - current_pos)
-                    rel_rot = glm.conjugate(current_rot) * future_rot
-                    future_forward = rel_rot * fw
-
-                    feature_frame.future_position.append(rel_pos)
-                    feature_frame.future_orientation.append(future_forward)
-            else:
-                if num_frames < 61:
-                    for _ in range(3):
-                        feature_frame.future_position.append(glm.vec3(0,0,0))
-                        feature_frame.future_orientation.append(glm.vec3(0,0,0))
-                else:
-                    prev_valid = self.feature_frames[num_frames-61]
-                    feature_frame.future_position = list(prev_valid.future_position)
-                    feature_frame.future_orientation = list(prev_valid.future_orientation)
+        self.future_positions = future_positions
+        self.future_orientations = future_orientations
 
 
     def build_quaternion_frames(self, joint_order):
-        for idx, frame in enumerate(self.motion_data):
-            motion_frame = MotionFrame()
-            channel_index = 0
-            for joint in joint_order:
-                num_channels = len(joint.channels)
-                ch_values = frame[channel_index:channel_index + num_channels]
-
-                rotation = glm.vec3(0.0)
-                position = glm.vec3(0.0)
-
-                for i, ch in enumerate(joint.channels):
-                    val = ch_values[i]
-                    if ch.endswith("position"):
-                        if ch == "Xposition": position.x = val
-                        elif ch == "Yposition": position.y = val
-                        elif ch == "Zposition": position.z = val
-                    elif ch.endswith("rotation"):
-                        if ch == "Xrotation": rotation.x = glm.radians(val)
-                        elif ch == "Yrotation": rotation.y = glm.radians(val)
-                        elif ch == "Zrotation": rotation.z = glm.radians(val)
-
-                quat = glm.quat(1, 0, 0, 0)
-                for ch in joint.channels:
-                    if ch.endswith('rotation'):
-                        angle = glm.radians(ch_values[joint.channels.index(ch)])
-                        axis = None
-                        if ch == 'Xrotation':
-                            axis = glm.vec3(1, 0, 0)
-                        elif ch == 'Yrotation':
-                            axis = glm.vec3(0, 1, 0)
-                        elif ch == 'Zrotation':
-                            axis = glm.vec3(0, 0, 1)
-                        quat = quat * glm.angleAxis(angle, axis)
-
-
-                motion_frame.joint_rotations[joint.name] = quat
-
-                if "position" in ''.join(joint.channels):
-                    motion_frame.joint_positions[joint.name] = position
-
-                channel_index += num_channels
-            self.quaternion_frames.append(motion_frame)
-
-    def apply_virtual(self, root):
+        if not len(self.motion_data):
+            return
+        if self.channel_offsets is None:
+            self.channel_offsets = get_channel_offsets(joint_order)
+        if self.layout is None:
+            self.layout = SkeletonLayout.from_joint_order(joint_order)
+
+        rotation_index = self.layout.rotation_index
+        position_index = self.layout.position_index
+        data = self.motion_data
+        num_frames = len(data)
+        rotations = np.zeros((num_frames, len(rotation_index), 4), dtype=np.float32)
+        rotations[..., 0] = 1.0
+        positions = np.zeros((num_frames, len(position_index), 3), dtype=np.float32)
+
+        # channel 순서(예: ZYX)가 같은 joint끼리 묶어 한 번에 변환
+        groups = {}
+        for joint, channel_index in zip(joint_order, self.channel_offsets):
+            order = ''
+            rotation_channels = []
+            for i, ch in enumerate(joint.channels):
+                if ch.endswith('rotation'):
+                    order += ch[0]
+                    rotation_channels.append(channel_index + i)
+                elif ch.endswith('position'):
+                    positions[:, position_index[joint.name], 'XYZ'.index(ch[0])] = data[:, channel_index + i]
+
+            if order:
+                columns, channels = groups.setdefault(order, ([], []))
+                columns.append(rotation_index[joint.name])
+                channels.append(rotation_channels)
+
+        for order, (columns, channels) in groups.items():
+            rotations[:, columns] = euler_to_quat(data[:, channels], order)
+
+        self.rotations = rotations
+        self.positions = positions
+        self.frames = num_frames
+
+    def apply_virtual(self, root, prev_r_inv_ref=None):
         vr = VirtualRootJoint(root)
 
-        for frame in self.quaternion_frames:
-            hip_name = next(iter(frame.joint_rotations))
-            ap = frame.joint_positions.get(hip_name, glm.vec3(0))
-            ar = frame.joint_rotations[hip_name]
+        # slice로 공유 중인 배열을 건드리지 않도록 새 배열에 기록
+        rotations = self.rotations.copy()
+        positions = self.positions.copy()
+        hip_rot = self.layout.rotation_index[root.name]
+        hip_pos = self.layout.position_index.get(root.name)
+        vr_rot = self.layout.rotation_index["VirtualRoot"]
+        vr_pos = self.layout.position_index["VirtualRoot"]
+
+        if hip_pos is not None:
+            ap = positions[:, hip_pos]
+        else:
+            ap = np.zeros((len(rotations), 3), dtype=np.float32)
+        ar = rotations[:, hip_rot]
 
-            ap_local, ar_local = get_pelvis_virtual_safe(ap, ar)
-            ap_global = ap - ap_local
-            ar_global = ar * glm.conjugate(ar_local)
+        ap_local, ar_local, ap_global, ar_global = split_pelvis_virtual(ap, ar, prev_r_inv_ref=prev_r_inv_ref)
 
-            frame.joint_positions[hip_name] = ap_local
-            frame.joint_rotations[hip_name] = ar_local
+        if hip_pos is not None:
+            positions[:, hip_pos] = ap_local
+        rotations[:, hip_rot] = ar_local
 
-            frame.joint_positions["VirtualRoot"] = ap_global
-            frame.joint_rotations["VirtualRoot"] = ar_global
+        positions[:, vr_pos] = ap_global
+        rotations[:, vr_rot] = ar_global
 
+        self.rotations = rotations
+        self.positions = positions
         return vr
 
-    def apply_to_skeleton(self, frame_index: int, joint_root: Joint):
-
-        frame = self.quaternion_frames[frame_index]
+    def apply_to_skeleton(self, frame_index: int, joint_root: Joint, alpha=None):
+        """
+        :param alpha: 주어지면 frame_index - 1과 frame_index의 pose를 alpha 비율로 보간해서 적용 (render 보간)
+        """
+        rotations = self.row('rotations', frame_index)
+        positions = self.row('positions', frame_index)
+        if alpha is not None and frame_index > 0:
+            rotations = quat_slerp(self.row('rotations', frame_index - 1), rotations, alpha)
+            positions = vec_mix(self.row('positions', frame_index - 1), positions, alpha)
+        rotations = rotations.tolist()
+        positions = positions.tolist()
+        rotation_index = self.layout.rotation_index
+        position_index = self.layout.position_index
 
         def apply(joint: Joint):
             name = joint.name
-            rot = frame.joint_rotations.get(name, glm.quat(1, 0, 0, 0))
+            col = rotation_index.get(name)
+            rot = glm.quat(*rotations[col]) if col is not None else glm.quat(1, 0, 0, 0)
             R = glm.mat4_cast(rot)
 
             offset = glm.vec3(joint.offset)
             T_offset = glm.translate(glm.mat4(1.0), offset)
 
-            if name in frame.joint_positions:
-                T_root = glm.translate(glm.mat4(1.0), frame.joint_positions[name])
+            if name in position_index:
+                T_root = glm.translate(glm.mat4(1.0), glm.vec3(*positions[position_index[name]]))
                 local_transform = T_root * T_offset * R
             else:
                 local_transform = T_offset * R
@@ -221,22 +660,47 @@ class Motion:
 
         apply(joint_root)
 
+    def apply_to_skeleton_at(self, position, joint_root: Joint):
+        """
+        실수 frame 위치(position)의 pose를 앞뒤 frame을 보간해서 적용합니다.
+        simulation step이 frame_time과 다를 때 재생 위치가 frame 사이에 놓입니다.
+        """
+        frame = min(int(position), self.frames - 1)
+        fraction = position - frame
+        if fraction > 0 and frame + 1 < self.frames:
+            self.apply_to_skeleton(frame + 1, joint_root, fraction)
+        else:
+            self.apply_to_skeleton(frame, joint_root)
 
-def parse_bvh(filename):
-    joints_stack = []
-    root_joint = None
-    motion = None
 
-    with open(filename, 'r') as file:
-        lines = file.readlines()
+def _lazy_array_property(name):
+    def get(self):
+        array = self._arrays.get(name)
+        return self._materialize(name) if array is None else array
+
+    def set(self, value):
+        self._set_array(name, value)
+
+    return property(get, set)
+
+
+# Motion의 pose / feature 배열: lazy motion이면 처음 읽을 때 구간들을 합침
+for _name in Motion.LAZY_ARRAYS:
+    setattr(Motion, _name, _lazy_array_property(_name))
+
 
-    line_iter = iter(lines)
-    for line in line_iter:
+def _read_hierarchy(file):
+    """
+    HIERARCHY 블록을 읽어 root joint를 만듭니다. file은 MOTION 줄 바로 뒤에 놓입니다.
+    """
+    joints_stack = []
+    root_joint = None
+    for line in file:
         if 'ROOT' in line or 'JOINT' in line:
             joint_name = line.strip().split()[1]
-            next(line_iter)
-            offset = [float(x) for x in next(line_iter).strip().split()[1:]]
-            channels = next(line_iter).strip().split()[2:]
+            next(file)
+            offset = [float(x) for x in next(file).strip().split()[1:]]
+            channels = next(file).strip().split()[2:]
             joint = Joint(joint_name, offset, channels)
 
             if joints_stack:
@@ -247,25 +711,48 @@ def parse_bvh(filename):
             joints_stack.append(joint)
 
         elif 'End Site' in line:
-            next(line_iter)
-            offset = [float(x) for x in next(line_iter).strip().split()[1:]]
+            next(file)
+            offset = [float(x) for x in next(file).strip().split()[1:]]
             end_joint = Joint('End Site', offset, [])
             joints_stack[-1].add_child(end_joint)
-            next(line_iter)
+            next(file)
 
         elif '}' in line:
             joints_stack.pop()
 
         elif 'MOTION' in line:
             break
+    return root_joint
 
-    frames = int(next(line_iter).strip().split()[1])
-    frame_time = float(next(line_iter).strip().split()[2])
-    motion = Motion(frames, frame_time)
 
-    for _ in range(frames):
-        frame_data = [float(val) for val in next(line_iter).strip().split()]
-        motion.add_frame_data(frame_data)
+def parse_bvh_skeleton(filename):
+    """
+    BVH의 HIERARCHY만 읽어 skeleton(root joint)을 만듭니다. MOTION 블록은 읽지 않습니다.
+    """
+    with open(filename, 'r') as file:
+        return _read_hierarchy(file)
+
+
+def parse_bvh(filename):
+    with open(filename, 'r') as file:
+        root_joint = _read_hierarchy(file)
+        frames = int(next(file).strip().split()[1])
+        frame_time = float(next(file).strip().split()[2])
+
+        # MOTION 블록 전체를 token 문자열을 만들지 않고 한 번에 float32 배열로 읽음
+        try:
+            values = np.fromstring(file.read(), dtype=np.float32, sep=' ')
+        except ValueError as error:
+            raise ValueError(f"{filename}: MOTION block contains a non-numeric value.") from error
+
+    joint_order = get_preorder_joint_list(root_joint)
+    motion = Motion(frames, frame_time)
+    motion.channel_offsets = get_channel_offsets(joint_order)
+    motion.layout = SkeletonLayout.from_joint_order(joint_order)
+    num_channels = int(motion.channel_offsets[-1])
+    if values.size != frames * num_channels:
+        raise ValueError(f"{filename}: expected {frames} frames of {num_channels} channels, got {values.size} values.")
+    motion.motion_data = values.reshape(frames, num_channels)
 
     return root_joint, motion
 
@@ -281,6 +768,21 @@ def get_preorder_joint_list(root_joint):
     traverse(root_joint)
     return joint_list
 
+def get_parent_indices(joint_order):
+    """
+    joint_order 안에서 각 joint의 parent 위치를 배열로 만듭니다. 목록에 parent가 없으면 -1입니다.
+    """
+    position = {id(joint): i for i, joint in enumerate(joint_order)}
+    return np.array([position.get(id(joint.parent), -1) for joint in joint_order], dtype=np.int64)
+
+def get_channel_offsets(joint_order):
+    """
+    joint_order(preorder)의 각 joint가 motion_data 한 행에서 시작하는 channel 위치를 계산합니다.
+    마지막 원소는 전체 channel 수입니다.
+    """
+    counts = [len(joint.channels) for joint in joint_order]
+    return np.concatenate(([0], np.cumsum(counts))).astype(np.int64)
+
 def connect(motion1, motion2, start_index_new, transition_frames=20, start_index_m2=0):
     if abs(motion1.frame_time - motion2.frame_time) > 1e-6:
         raise ValueError("Frame times of the two motions do not match.")
@@ -289,75 +791,99 @@ def connect(motion1, motion2, start_index_new, transition_frames=20, start_index
         print(motion1.get_frames())
         return motion2
 
-    new_motion = Motion(0, motion1.frame_time)
-
-    # 1. offset 계산 (VirtualRoot 기준)
-    last_frame_m1 = motion1.quaternion_frames[-1]
-    first_frame_m2 = motion2.quaternion_frames[start_index_m2]
-
-    p1 = last_frame_m1.joint_positions["VirtualRoot"]
-    p2 = first_frame_m2.joint_positions["VirtualRoot"]
-
-    r1 = last_frame_m1.joint_rotations["VirtualRoot"]
-    r2 = first_frame_m2.joint_rotations["VirtualRoot"]
-    rotation_offset = r1 * glm.conjugate(r2)
-    position_offset = p1 - rotation_offset * p2
+    if motion1.layout != motion2.layout:
+        raise ValueError("Skeleton layouts of the two motions do not match.")
 
-    # 2. motion2 복사본 생성 + VirtualRoot offset 적용
-    adjusted_motion2 = []
+    layout = motion1.layout
+    vr_rot = layout.rotation_index["VirtualRoot"]
+    vr_pos = layout.position_index["VirtualRoot"]
 
-    for i, frame in enumerate(motion2.quaternion_frames):
-        new_frame = MotionFrame()
-        apply_offset = (i >= start_index_m2)  # start_index_m2부터만 offset 적용
-
-        for joint_name, quat in frame.joint_rotations.items():
-            if joint_name == "VirtualRoot" and apply_offset:
-                new_frame.joint_rotations[joint_name] = rotation_offset * quat
-            else:
-                new_frame.joint_rotations[joint_name] = quat
-
-        for joint_name, pos in frame.joint_positions.items():
-            if joint_name == "VirtualRoot" and apply_offset:
-                new_frame.joint_positions[joint_name] = rotation_offset * pos + position_offset
-            else:
-                new_frame.joint_positions[joint_name] = pos
-
-        adjusted_motion2.append(new_frame)
-
-    # 3. motion1의 blending 전까지 복사
-    for frame in motion1.quaternion_frames[:-transition_frames]:
-        new_motion.quaternion_frames.append(frame)
-
-    # 4. blending 구간 생성 (offset 이미 적용된 adjusted_motion2 사용)
-    for i in range(transition_frames):
-        t = (i + 1) / (transition_frames + 1)
-        frame1 = motion1.quaternion_frames[-transition_frames + i]
-        frame2 = adjusted_motion2[start_index_m2 + i]
-
-        blended_frame = MotionFrame()
-        joint_names = set(frame1.joint_rotations.keys()) | set(frame2.joint_rotations.keys())
-
-        for joint_name in joint_names:
-            # rotation slerp
-            if joint_name in frame1.joint_rotations and joint_name in frame2.joint_rotations:
-                r1 = frame1.joint_rotations[joint_name]
-                r2 = frame2.joint_rotations[joint_name]
-                blended_frame.joint_rotations[joint_name] = glm.slerp(r1, r2, t)
-
-            # position lerp
-            if joint_name in frame1.joint_positions and joint_name in frame2.joint_positions:
-                p1 = frame1.joint_positions[joint_name]
-                p2 = frame2.joint_positions[joint_name]
-                blended_frame.joint_positions[joint_name] = glm.mix(p1, p2, t)
-
-        new_motion.quaternion_frames.append(blended_frame)
-
-    # 5. motion2 transition 이후 프레임 복사 (offset 적용된 버전에서)
-    for frame in adjusted_motion2[start_index_m2 + transition_frames:]:
-        new_motion.quaternion_frames.append(frame)
-
-    new_motion.frames = len(new_motion.quaternion_frames)
-    return new_motion[start_index_new:]
+    # 1. offset 계산 (VirtualRoot 기준)
+    last1 = motion1.get_frames() - 1
+    p1 = motion1.row('positions', last1)[vr_pos]
+    p2 = motion2.row('positions', start_index_m2)[vr_pos]
+
+    r1 = motion1.row('rotations', last1)[vr_rot]
+    r2 = motion2.row('rotations', start_index_m2)[vr_rot]
+    rotation_offset = quat_multiply(r1, quat_conjugate(r2))
+    position_offset = p1 - quat_rotate(rotation_offset, p2)
+
+    # 2. motion2는 복사하지 않고 구간 + offset으로만 가리킴 (start_index_m2부터만 사용)
+    moved_frames = motion2.get_frames() - start_index_m2
+    moved = [segment.with_offset(rotation_offset, position_offset)
+             for segment in slice_segments(motion2.segments(), start_index_m2, motion2.get_frames())]
+    target = slice_segments(moved, 0, transition_frames)
+
+    # 3. blending 구간 생성 (offset 이미 적용된 motion2 사용) — 새로 만드는 배열은 이 transition_frames개뿐
+    head = motion1.segments()
+    source = slice_segments(head, last1 + 1 - transition_frames, last1 + 1)
+    t = ((np.arange(transition_frames) + 1) / (transition_frames + 1)).astype(np.float32)
+    blended_rotations = quat_slerp(gather_segments(source, 'rotations'), gather_segments(target, 'rotations'), t[:, None])
+    blended_positions = vec_mix(gather_segments(source, 'positions'), gather_segments(target, 'positions'), t[:, None])
+    blend = MotionSegment({'rotations': blended_rotations.astype(np.float32),
+                           'positions': blended_positions.astype(np.float32)},
+                          0, transition_frames, layout)
+
+    # 4. motion1의 blending 전까지 + blending 구간 + motion2 transition 이후
+    segments = slice_segments(head, 0, last1 + 1 - transition_frames) + [blend] + \
+        slice_segments(moved, transition_frames, moved_frames)
+    new_motion = Motion.from_segments(motion1.frame_time, layout, segments)
+    return new_motion[start_index_new:] if start_index_new else new_motion
+
+def inertialize(motion1, frame_index, motion2, start_index_m2=0, halflife=INERTIALIZATION_HALFLIFE):
+    """
+    motion1의 frame_index에서 motion2로 blending 없이 바로 전환합니다.
+    motion2를 connect와 같이 VirtualRoot 기준으로 맞춘 뒤, 그때 남는 joint 별 pose 차이를 InertializedSegment로 얹어
+    점점 줄입니다. 두 motion을 frame마다 섞지 않고 새 pose 배열도 만들지 않습니다.
+    :return: frame 0이 motion1의 frame_index와 같은 pose인 (lazy) Motion
+    """
+    if abs(motion1.frame_time - motion2.frame_time) > 1e-6:
+        raise ValueError("Frame times of the two motions do not match.")
+    if motion1.layout != motion2.layout:
+        raise ValueError("Skeleton layouts of the two motions do not match.")
+
+    layout = motion1.layout
+    frame_time = motion1.frame_time
+    vr_rot = layout.rotation_index["VirtualRoot"]
+    vr_pos = layout.position_index["VirtualRoot"]
+
+    # 1. 현재 pose와 한 frame 전 pose (첫 frame이면 속도 0)
+    source_rotations = motion1.row('rotations', frame_index)
+    source_positions = motion1.row('positions', frame_index)
+    previous = max(frame_index - 1, 0)
+    previous_rotations = motion1.row('rotations', previous)
+    previous_positions = motion1.row('positions', previous)
+
+    # 2. connect와 같은 VirtualRoot offset으로 motion2를 맞춤 (복사 없음)
+    r2 = motion2.row('rotations', start_index_m2)[vr_rot]
+    p2 = motion2.row('positions', start_index_m2)[vr_pos]
+    rotation_offset = quat_multiply(source_rotations[vr_rot], quat_conjugate(r2))
+    position_offset = source_positions[vr_pos] - quat_rotate(rotation_offset, p2)
+    moved_frames = motion2.get_frames() - start_index_m2
+    moved = [segment.with_offset(rotation_offset, position_offset)
+             for segment in slice_segments(motion2.segments(), start_index_m2, motion2.get_frames())]
+
+    # 3. 맞춘 motion2의 처음 두 frame과의 차이 -> 초기 offset과 속도
+    target = slice_segments(moved, 0, min(2, moved_frames))
+    target_rotations = gather_segments(target, 'rotations')
+    target_positions = gather_segments(target, 'positions')
+    rotation_offsets = quat_to_rotation_vector(quat_multiply(source_rotations, quat_conjugate(target_rotations[0])))
+    source_angular = quat_to_rotation_vector(quat_multiply(source_rotations, quat_conjugate(previous_rotations)))
+    target_angular = quat_to_rotation_vector(quat_multiply(target_rotations[-1], quat_conjugate(target_rotations[0])))
+    rotation_velocities = (source_angular - target_angular) / frame_time
+    position_offsets = source_positions - target_positions[0]
+    position_velocities = ((source_positions - previous_positions) - (target_positions[-1] - target_positions[0])) / frame_time
+
+    # 4. halflife의 8배가 지나면 offset이 사실상 0이므로 그 뒤는 motion2를 그대로 가리킴
+    duration = min(int(math.ceil(8 * halflife / frame_time)) + 1, moved_frames)
+    head = []
+    offset = 0
+    for segment in slice_segments(moved, 0, duration):
+        head.append(InertializedSegment(segment, segment.start - offset, rotation_offsets, rotation_velocities,
+                                        position_offsets, position_velocities, frame_time, halflife))
+        offset += len(segment)
+    segments = head + slice_segments(moved, duration, moved_frames)
+    return Motion.from_segments(frame_time, layout, segments, motion2.site_names)
 
 def get_joint_chains_from_root(root):
     leaf_chains = [[root, root.children[0]]]
@@ -0,0 +1,323 @@
+import argparse
+import time
+
+import numpy as np
+from pyglm import glm
+
+from bvh_controller import INERTIALIZATION_HALFLIFE, VirtualRootJoint, connect, inertialize
+from feature_extractor import MotionKDTree, splice_features, feature_sections
+
+
+def wrap_angle(angle):
+    """
+    각도를 [-pi, pi) 범위로 감습니다.
+    """
+    return np.remainder(angle + np.pi, 2 * np.pi) - np.pi
+
+
+class CrowdControllers:
+    """
+    controller.InputController를 agent 수만큼 배열로 들고 한 번에 갱신합니다.
+    키 입력 대신 goals를 향해 가속하고, arrive_radius 안에 들어오면 감속합니다.
+    진행 방향(current_forward)은 XZ 평면의 yaw 각도로 저장합니다.
+    :param count: agent 수
+    """
+    def __init__(self, count, max_speed=50.0, acceleration=1.2, deceleration=3.0, arrive_radius=20.0):
+        self.max_speed = max_speed
+        self.acceleration = acceleration
+        self.deceleration = deceleration
+        self.arrive_radius = arrive_radius
+        self.positions = np.zeros((count, 3), dtype=np.float32)
+        self.velocities = np.zeros((count, 3), dtype=np.float32)
+        self.goals = np.zeros((count, 3), dtype=np.float32)
+        self.yaws = np.zeros(count, dtype=np.float32)
+        self.turn_rates = np.zeros(count, dtype=np.float32)
+
+    @property
+    def forwards(self):
+        return np.stack([np.sin(self.yaws), np.zeros_like(self.yaws), np.cos(self.yaws)], axis=1)
+
+    def step(self, delta_time):
+        """
+        InputController.update_virtual_kinematics를 모든 agent에 대해 한 번에 수행합니다.
+        :return: 아직 목표에 도착하지 않은 agent mask
+        """
+        to_goal = self.goals - self.positions
+        to_goal[:, 1] = 0.0
+        distance = np.linalg.norm(to_goal, axis=1)
+        moving = distance > self.arrive_radius
+
+        desired = to_goal * (self.max_speed / np.maximum(distance, 1e-8))[:, None]
+        accelerate = (desired - self.velocities) * (self.acceleration * delta_time)
+        decelerate = -self.velocities * (self.deceleration * delta_time)
+        self.velocities += np.where(moving[:, None], accelerate, decelerate)
+
+        # 속도 방향으로 min(0.2, speed * 0.02)만큼 slerp (Y축 회전끼리의 slerp는 yaw 보간과 같음)
+        speed = np.linalg.norm(self.velocities, axis=1)
+        target = np.arctan2(self.velocities[:, 0], self.velocities[:, 2])
+        turn = np.where(speed > 0, wrap_angle(target - self.yaws) * np.minimum(0.2, speed * 0.02), 0.0)
+        self.yaws = wrap_angle(self.yaws + turn).astype(np.float32)
+        self.turn_rates = (turn / delta_time).astype(np.float32)
+
+        self.positions += self.velocities * delta_time
+        return moving
+
+    def root_transform(self, i):
+        """
+        agent i의 VirtualRoot 전역 변환 (이동 + yaw 회전)
+        """
+        return glm.translate(glm.mat4(1.0), glm.vec3(*self.positions[i].tolist())) * \
+            glm.mat4_cast(glm.angleAxis(float(self.yaws[i]), glm.vec3(0, 1, 0)))
+
+
+class Crowd:
+    """
+    motion matching으로 움직이는 agent 여러 명을 한 번에 시뮬레이션합니다.
+    controller 상태는 CrowdControllers 배열에, query feature는 (N, D) 행렬 하나에 모아 두고,
+    검색할 때가 된 agent는 모아서 MotionKDTree.search_batch 한 번으로 검색합니다.
+    focus에서 먼 agent는 lod_rates에 따라 몇 step에 한 번만 feature를 갱신하고 검색합니다
+    (갱신하지 않은 시간만큼 한 번에 진행하므로 재생 속도는 같습니다).
+    재생 위치는 실제 흐른 시간 / frame_time frame씩 나아가므로 step 간격과 무관하게 BVH 속도로 재생됩니다.
+    :param tree: agent들이 공유하는 MotionKDTree
+    :param count: agent 수
+    :param arena_radius: 목표 지점을 뽑는 원의 반지름
+    :param lod_distances: LOD 경계 거리 (오름차순)
+    :param lod_rates: LOD 별 갱신 간격 (step), len(lod_distances) + 1개
+    :param search_interval: 검색 간격 (motion frame)
+    :param motion_penalty: 현재 motion을 유지하도록 주는 거리 여유
+    :param transition_frames: clip 전환 시 blending 할 frame 수
+    :param motion_window: 전환할 때 매칭된 clip에서 가져올 최대 frame 수 (None이면 clip 끝까지).
+                          feature 계산이 전환 비용의 대부분이므로 짧게 자릅니다. 끝에 다다르면 다시 검색합니다.
+    :param transition_mode: 'blend' (connect로 crossfade) 또는 'inertialize' (매칭된 clip을 바로 재생하며 pose 차이를 줄임)
+    :param halflife: 'inertialize'에서 pose 차이가 절반으로 줄어드는 시간 (초)
+    :raises ValueError: database에 clip이 없을 때
+    """
+    def __init__(self, tree, count, arena_radius=500.0, lod_distances=(300.0, 800.0), lod_rates=(1, 2, 4),
+                 search_interval=50, motion_penalty=5.0, transition_frames=20, motion_window=200, seed=0,
+                 transition_mode='blend', halflife=INERTIALIZATION_HALFLIFE):
+        if tree.index.empty:
+            # 시작 motion을 고를 clip이 없음 (이미 움직이는 crowd는 database가 비어도 전환 없이 계속 재생)
+            raise ValueError("Crowd needs at least one clip in the motion database")
+        self.tree = tree
+        self.count = count
+        self.arena_radius = arena_radius
+        self.lod_distances = np.asarray(lod_distances, dtype=np.float32)
+        self.lod_rates = np.asarray(lod_rates, dtype=np.int64)
+        self.search_interval = search_interval
+        self.motion_penalty = motion_penalty
+        self.transition_frames = transition_frames
+        self.transition_mode = transition_mode
+        self.halflife = halflife
+        self.motion_window = motion_window
+        self.rng = np.random.default_rng(seed)
+        self.horizons = np.asarray(tree.horizons, dtype=np.float32)
+
+        self.controllers = CrowdControllers(count)
+        self.controllers.positions[:, [0, 2]] = self._random_points(count)
+        self.assign_goals(np.arange(count))
+
+        # agent 전체가 공유하는 skeleton. 그릴 때 agent마다 pose를 덮어씀 (motion 블록은 읽지 않음)
+        self.hips = tree.load_skeleton()
+        VirtualRootJoint(self.hips)
+        self.motions = self._initial_motions()
+        self.frame_time = self.motions[0].frame_time
+
+        self.frame = 0
+        self.frame_idx = np.zeros(count, dtype=np.int64)
+        # 실수 재생 위치 (frame 단위). frame_idx는 그 정수 부분
+        self.frame_pos = np.zeros(count, dtype=np.float64)
+        self.counts = self.rng.integers(0, search_interval, count).astype(np.float64)
+        # 마지막 갱신 뒤 흐른 시간 (초)
+        self.pending = np.zeros(count, dtype=np.float64)
+        # 같은 LOD의 agent들이 같은 frame에 몰리지 않도록 갱신 시점을 흩어 놓음
+        self.phases = self.rng.integers(0, int(self.lod_rates.max()), count)
+        self.colors = self.rng.uniform(0.2, 1.0, (count, 3)).tolist()
+        self.switches = 0
+        self.searches = 0
+
+        motion = self.motions[0]
+        sections = feature_sections(len(motion.site_names), len(motion.row('rotations', 0)), len(self.horizons))
+        self.raw = np.zeros((count, sections[-1]), dtype=np.float32)
+        self.velocities = self.raw[:, sections[0]:sections[1]].reshape(count, -1, 3)
+        self.site_positions = self.raw[:, sections[1]:sections[2]].reshape(count, -1, 3)
+        self.future_xz = self.raw[:, sections[2]:sections[3]].reshape(count, -1, 2)
+        self.future_dir_xz = self.raw[:, sections[3]:sections[4]].reshape(count, -1, 2)
+        self.rotations = self.raw[:, sections[4]:sections[5]].reshape(count, -1, 4)
+
+    def _random_points(self, count):
+        radius = self.arena_radius * np.sqrt(self.rng.uniform(0, 1, count))
+        angle = self.rng.uniform(-np.pi, np.pi, count)
+        return np.stack([radius * np.sin(angle), radius * np.cos(angle)], axis=1)
+
+    def _initial_motions(self):
+        """
+        database의 임의 frame에서 시작하는 motion을 agent마다 만듭니다. database clip의 pose와 feature를 복사 없이 공유합니다.
+        """
+        index_map = self.tree.index_map
+        starts = index_map[self.rng.integers(0, len(index_map), self.count)]
+        clips = {}
+        motions = []
+        for clip_id, frame in starts.tolist():
+            if clip_id not in clips:
+                clips[clip_id] = self.tree.get_motion(clip_id)
+            motions.append(clips[clip_id][frame:])
+        return motions
+
+    def assign_goals(self, agents):
+        goals = np.zeros((len(agents), 3), dtype=np.float32)
+        goals[:, [0, 2]] = self._random_points(len(agents))
+        self.controllers.goals[agents] = goals
+
+    def step(self, delta_time=None, focus=None):
+        """
+        모든 agent를 simulation step 하나만큼 진행합니다.
+        :param delta_time: step 간격 (초). None이면 frame_time
+        :param focus: LOD 기준 위치 (카메라 중심 등). None이면 원점
+        :return: 이번 step에 갱신한 agent index
+        """
+        delta_time = delta_time or self.frame_time
+        controllers = self.controllers
+        moving = controllers.step(delta_time)
+        if not moving.all():
+            self.assign_goals(np.flatnonzero(~moving))
+
+        self.frame += 1
+        self.pending += delta_time
+        focus = np.zeros(3, dtype=np.float32) if focus is None else np.asarray(focus, dtype=np.float32)
+        offset = controllers.positions - focus
+        distance = np.hypot(offset[:, 0], offset[:, 2])
+        rates = self.lod_rates[np.searchsorted(self.lod_distances, distance)]
+        due = np.flatnonzero((self.frame + self.phases) % rates == 0)
+        if not len(due):
+            return due
+
+        # 건너뛴 시간만큼 한 번에 진행
+        elapsed = self.pending[due] / self.frame_time
+        self.pending[due] = 0.0
+        self.counts[due] += elapsed
+        frame_len = np.array([self.motions[i].frames for i in due.tolist()])
+        self.frame_pos[due] = np.minimum(self.frame_pos[due] + elapsed, frame_len - 1)
+        self.frame_idx[due] = self.frame_pos[due].astype(np.int64)
+
+        self.update_features(due)
+        search = (self.counts[due] >= self.search_interval) | (self.frame_idx[due] + 21 > frame_len)
+        if search.any():
+            self.search(due[search])
+        return due
+
+    def update_features(self, agents):
+        """
+        agents의 현재 frame feature와 예측 궤적을 raw 행렬에 채웁니다. horizon은 motion frame 단위입니다.
+        궤적은 QueryBuilder.predict_trajectory와 같은 계산을 agent 전체에 대해 한 번에 합니다.
+        agent의 VirtualRoot 방향이 진행 방향과 같으므로 root 기준 방향은 회전 각도의 절반만큼 돈 z축입니다.
+        """
+        for i, frame in zip(agents.tolist(), self.frame_idx[agents].tolist()):
+            motion = self.motions[i]
+            self.velocities[i] = motion.row('velocities', frame)
+            self.site_positions[i] = motion.row('site_positions', frame)
+            self.rotations[i] = motion.row('rotations', frame)
+
+        velocity = self.controllers.velocities[agents]
+        self.velocities[agents, 0] = velocity
+
+        time_ahead = self.horizons * self.frame_time
+        half = wrap_angle(self.controllers.turn_rates[agents, None] * time_ahead) * 0.5
+        sin, cos = np.sin(half), np.cos(half)
+        distance = np.linalg.norm(velocity, axis=1)[:, None] * time_ahead
+        self.future_xz[agents, :, 0] = sin * distance
+        self.future_xz[agents, :, 1] = cos * distance
+        self.future_dir_xz[agents, :, 0] = sin
+        self.future_dir_xz[agents, :, 1] = cos
+
+    def search(self, agents):
+        """
+        agents를 한 번에 검색하고, 현재 motion을 이어 가는 것보다 충분히 가까우면 매칭된 clip으로 전환합니다.
+        """
+        index = self.tree.index
+        queries = index.normalize(self.raw[agents])
+        dists, matches = self.tree.search_batch(queries, index)
+        self.searches += len(agents)
+
+        for k, i in enumerate(agents.tolist()):
+            self.counts[i] = 0
+            motion = self.motions[i]
+            frame = int(self.frame_idx[i])
+            if frame + 21 < motion.frames:
+                current = index.normalize(MotionKDTree.extract_feature_matrix(motion, frame + 1, frame + 2)[0])
+                dist_current = np.linalg.norm(queries[k] - current)
+            else:
+                dist_current = float('inf')
+            if dists[k] + self.motion_penalty >= dist_current:
+                continue
+
+            clip_id, matched_idx = matches[k].tolist()
+            matched_motion = self.tree.get_motion(clip_id)
+            if matched_motion is not None:
+                self.switch(i, matched_motion, matched_idx)
+
+    def switch(self, i, matched_motion, matched_idx):
+        motion = self.motions[i]
+        frame = int(self.frame_idx[i])
+        end = None if self.motion_window is None else matched_idx + self.motion_window
+        if self.transition_mode == 'inertialize':
+            new_motion = inertialize(motion, frame, matched_motion[matched_idx:end], 0, self.halflife)
+        elif frame + self.transition_frames <= motion.frames:
+            new_motion = connect(motion[frame:frame + self.transition_frames], matched_motion[matched_idx:end], 0,
+                                 transition_frames=self.transition_frames)
+        else:
+            # blending 할 frame이 남아 있지 않으면 매칭된 clip을 그대로 이어 붙임
+            new_motion = matched_motion[matched_idx:end]
+        self.motions[i] = splice_features(self.hips.parent, new_motion, self.tree.horizons, self.tree.end_policy)
+        self.frame_idx[i] = 0
+        self.frame_pos[i] = 0.0
+        self.switches += 1
+
+    def apply_agent(self, i):
+        """
+        공유 skeleton에 agent i의 pose와 위치를 적용합니다.
+        :return: 그릴 수 있는 VirtualRootJoint
+        """
+        # 공유 skeleton의 VirtualRootJoint (hips의 부모)
+        skeleton = self.hips.parent
+        self.motions[i].apply_to_skeleton_at(float(self.frame_pos[i]), skeleton)
+        skeleton.kinematics = self.controllers.root_transform(i)
+        return skeleton
+
+
+def measure(tree, counts, frames=300, transition_mode='blend'):
+    """
+    agent 수별로 frame당 시뮬레이션 시간을 잽니다 (그리기 제외). LOD 기준 위치는 원점입니다.
+    :return: [(agent 수, frame당 평균 ms, 최대 ms, 전환 횟수)]
+    """
+    results = []
+    for count in counts:
+        crowd = Crowd(tree, count, transition_mode=transition_mode)
+        crowd.step()
+        times = []
+        for _ in range(frames):
+            start = time.perf_counter()
+            crowd.step()
+            times.append(time.perf_counter() - start)
+        results.append((count, np.mean(times) * 1000, np.max(times) * 1000, crowd.switches))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="crowd 시뮬레이션이 60Hz 안에 몇 명까지 도는지 측정")
+    parser.add_argument('root_path', help="BVH 폴더")
+    parser.add_argument('--cache-dir', default=None)
+    parser.add_argument('--backend', default='kdtree')
+    parser.add_argument('--agents', type=int, nargs='+', default=[50, 100, 200, 400, 800])
+    parser.add_argument('--frames', type=int, default=300)
+    parser.add_argument('--transition', default='blend', choices=('blend', 'inertialize'), help="전환 방식")
+    args = parser.parse_args()
+
+    tree = MotionKDTree(args.root_path, cache_dir=args.cache_dir, backend=args.backend)
+    budget = 1000.0 / 60.0
+    print(f"{'agents':>8}{'mean(ms)':>10}{'max(ms)':>10}{'switches':>10}  60Hz")
+    for count, mean, peak, switches in measure(tree, args.agents, args.frames, transition_mode=args.transition):
+        print(f"{count:>8}{mean:>10.2f}{peak:>10.2f}{switches:>10}  {'ok' if mean <= budget else 'over'}")
+
+
+if __name__ == "__main__":
+    main()
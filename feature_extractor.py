@@ -1,20 +1,413 @@
 from bvh_controller import *
+from motion_cache import MotionCache, SpillStore
+from search_backends import make_backend
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+import itertools
 import numpy as np
 import os
-from scipy.spatial import KDTree
+import threading
 from tqdm import tqdm
 
+# feature 벡터의 구성(순서, 차원, horizon 등)이 바뀌면 올려서 cache를 무효화합니다.
+FEATURE_CONFIG_VERSION = 2
+
+# clip과 함께 저장하는 frame 별 feature 배열 (전환 뒤 motion이 그대로 가져다 씀)
+FEATURE_ARRAYS = ('velocities', 'site_positions', 'future_positions', 'future_orientations')
+
+def prepare_motion(root, motion, horizons=FUTURE_HORIZONS, end_policy='hold'):
+    """
+    motion에 virtual root를 붙이고 feature 배열을 계산합니다.
+    :param root: skeleton의 root joint (Hips)
+    :return: VirtualRootJoint
+    """
+    joint_order = get_preorder_joint_list(root)
+    motion.build_quaternion_frames(joint_order)
+    virtual = motion.apply_virtual(root)
+    motion.apply_velocity_feature(virtual)
+    motion.apply_future_feature(horizons, end_policy)
+    return virtual
+
+def splice_features(root, motion, horizons=FUTURE_HORIZONS, end_policy='hold'):
+    """
+    connect로 만든 motion의 feature를 채웁니다. database clip에서 온 구간은 clip에 저장된 feature를 복사 없이 쓰고,
+    feature가 없는 구간(blending 구간)과 그 구간을 velocity / 미래 horizon으로 참조하는 frame만 다시 계산합니다.
+    prepare_motion과 달리 VirtualRoot를 다시 나누지 않고 connect가 이어 붙인 VirtualRoot 궤적을 그대로 씁니다.
+    :param root: motion의 VirtualRootJoint
+    :return: feature가 채워진 (lazy) Motion
+    """
+    frames = motion.get_frames()
+    segments = motion.segments()
+    max_horizon = int(max(horizons))
+
+    # feature가 없는 구간 앞쪽 max_horizon frame(미래가 그 구간에 걸침)과 바로 다음 frame(velocity)까지 다시 계산
+    ranges = []
+    start = 0
+    for segment in segments:
+        stop = start + len(segment)
+        if 'velocities' not in segment.arrays:
+            lo, hi = max(start - max_horizon, 0), min(stop + 1, frames)
+            if ranges and lo <= ranges[-1][1]:
+                ranges[-1][1] = hi
+            else:
+                ranges.append([lo, hi])
+        start = stop
+    if not ranges:
+        return motion
+
+    pieces = []
+    site_names = motion.site_names
+    position = 0
+    for lo, hi in ranges:
+        pieces += slice_segments(segments, position, lo)
+        # 미래 horizon만큼 뒤로, velocity용으로 앞으로 두 frame 더 잘라서 계산 (window의 첫 frame site 위치는 0이 됨)
+        window_start = max(lo - 2, 0)
+        window = motion[window_start:min(hi + max_horizon, frames)]
+        window.apply_velocity_feature(root)
+        window.apply_future_feature(horizons, end_policy)
+        skip = lo - window_start
+        arrays = {name: getattr(window, name)[skip:skip + hi - lo] for name in Motion.LAZY_ARRAYS}
+        pieces.append(MotionSegment(arrays, 0, hi - lo, motion.layout))
+        site_names = window.site_names
+        position = hi
+    pieces += slice_segments(segments, position, frames)
+    return Motion.from_segments(motion.frame_time, motion.layout, pieces, site_names)
+
+def read_bvh_file(filepath, horizons=FUTURE_HORIZONS, end_policy='hold'):
+    root, motion = parse_bvh(filepath)
+    prepare_motion(root, motion, horizons, end_policy)
+    return motion
+
+def feature_sections(num_sites, num_rotations, num_horizons):
+    """
+    feature 벡터에서 각 block이 시작하는 위치.
+    :return: [velocity, site 위치, 미래 위치 xz, 미래 방향 xz, 회전, 끝]
+    """
+    return np.cumsum([0, num_sites * 3, num_sites * 3, num_horizons * 2, num_horizons * 2, num_rotations * 4]).tolist()
+
+def process_clip(filepath, horizons=FUTURE_HORIZONS, end_policy='hold'):
+    """
+    BVH 하나를 처리해 (정규화 전) feature 행렬과 pose 배열을 만듭니다.
+    process pool worker에서도 실행되므로 Motion 객체 대신 배열과 이름 목록만 반환합니다.
+    :return: dict — features[i]는 frame i + 1에 해당
+    """
+    motion = read_bvh_file(filepath, horizons, end_policy)
+    # 마지막 21 frame과 frame 0은 검색 대상에서 제외
+    features = MotionKDTree.extract_feature_matrix(motion, 1, max(len(motion.velocities) - 21, 1))
+
+    rotation_names, rotations, position_names, positions = motion.get_pose_arrays()
+    result = {
+        'frame_time': motion.frame_time,
+        'rotation_names': rotation_names,
+        'position_names': position_names,
+        'site_names': motion.site_names,
+        'features': features,
+        'rotations': rotations,
+        'positions': positions,
+    }
+    for name in FEATURE_ARRAYS:
+        result[name] = getattr(motion, name)
+    return result
+
+def clip_motion(frame_time, names, arrays):
+    """
+    pose 배열과 frame 별 feature 배열(cache의 memory-map 등)을 복사 없이 감싼 Motion을 만듭니다.
+    :param names: rotation_names, position_names, site_names가 있는 dict (process_clip 결과 또는 cache meta)
+    """
+    motion = Motion.from_pose_arrays(frame_time, names['rotation_names'], arrays['rotations'],
+                                     names['position_names'], arrays['positions'])
+    motion.site_names = list(names['site_names'])
+    for name in FEATURE_ARRAYS:
+        setattr(motion, name, arrays[name])
+    return motion
+
+def file_signature(path):
+    stat = os.stat(path)
+    return stat.st_size, stat.st_mtime_ns
+
+
+def clip_statistics(features):
+    """
+    clip 단위 통계를 float64로 구합니다.
+    :return: (frame 수, 평균, 편차 제곱합)
+    """
+    count = len(features)
+    if not count:
+        return 0, np.zeros(features.shape[1], dtype=np.float64), np.zeros(features.shape[1], dtype=np.float64)
+    mean = np.mean(features, axis=0, dtype=np.float64)
+    return count, mean, np.sum(np.square(features - mean), axis=0)
+
+
+def cached_statistics(meta, features):
+    """
+    cache meta에 저장해 둔 clip 통계를 복원합니다. 없거나 frame 수가 다르면 (이전 형식의 entry) None
+    """
+    if meta.get('count') != len(features) or 'm2' not in meta:
+        return None
+    return meta['count'], np.array(meta['mean'], dtype=np.float64), np.array(meta['m2'], dtype=np.float64)
+
+
+class ClipRecord:
+    """
+    database에 들어 있는 clip 하나입니다. pose 데이터는 들고 있지 않고 MotionPool에서 필요할 때 불러옵니다.
+    정규화 전 feature와 함께 clip 단위 통계(frame 수, 평균, 편차 제곱합)를 float64로 들고 있어서
+    clip을 추가/삭제할 때 전체 feature를 다시 훑지 않고 전역 통계를 다시 합칠 수 있습니다.
+    :param clip_id: MotionKDTree 안에서 고유한 번호. index snapshot이 바뀌어도 유지됩니다.
+    :param statistics: 미리 구한 (frame 수, 평균, 편차 제곱합). None이면 features로 계산
+    """
+    def __init__(self, clip_id, path, features, meta, signature, statistics=None):
+        self.clip_id = clip_id
+        self.path = path
+        self.features = features
+        self.meta = meta
+        self.signature = signature
+        self.count, self.mean, self.m2 = statistics if statistics is not None else clip_statistics(features)
+
+
+def combine_statistics(clips):
+    """
+    clip 단위 통계를 합쳐 전역 평균/표준편차를 구합니다 (Chan et al. 병렬 분산 공식).
+    :return: (mean, std) float32, std에는 0 나눗셈 방지용 1e-8이 더해져 있음. frame이 하나도 없으면 None
+    """
+    clips = [clip for clip in clips if clip.count]
+    total = sum(clip.count for clip in clips)
+    if not total:
+        return None
+    mean = sum(clip.count * clip.mean for clip in clips) / total
+    m2 = sum(clip.m2 + clip.count * np.square(clip.mean - mean) for clip in clips)
+    std = np.sqrt(m2 / total)
+    return mean.astype(np.float32), std.astype(np.float32) + 1e-8
+
+
+class MotionPool:
+    """
+    최근에 사용한 clip의 Motion(pose 배열)만 들고 있는 LRU pool입니다.
+    :param capacity: 동시에 들고 있을 최대 clip 수
+    """
+    def __init__(self, capacity=16):
+        self.capacity = capacity
+        self.motions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, clip_id, loader):
+        with self._lock:
+            motion = self.motions.get(clip_id)
+            if motion is not None:
+                self.motions.move_to_end(clip_id)
+                return motion
+        motion = loader()
+        self.put(clip_id, motion)
+        return motion
+
+    def put(self, clip_id, motion):
+        with self._lock:
+            self.motions[clip_id] = motion
+            self.motions.move_to_end(clip_id)
+            while len(self.motions) > self.capacity:
+                self.motions.popitem(last=False)
+
+    def discard(self, clip_id):
+        with self._lock:
+            self.motions.pop(clip_id, None)
+
+
+class SearchIndex:
+    """
+    검색에 쓰이는 정규화된 feature 행렬, 통계, 트리, index_map을 묶은 snapshot입니다.
+    index_map은 (N, 2) int32 배열로 각 행이 (clip_id, frame 번호)이고, clip_paths는 clip_id -> 경로입니다.
+    만든 뒤에는 수정하지 않고, 새 snapshot을 만들어 MotionKDTree.index를 한 번에 바꿔 끼웁니다.
+    clip이 하나도 없으면 tree가 None인 빈 snapshot이고, 검색 결과는 거리 inf, clip_id -1 ("매칭 없음")입니다.
+    """
+    def __init__(self, feature_vectors, mean, std, weights, index_map, clip_paths, tree):
+        self.feature_vectors = feature_vectors
+        self.mean = mean
+        self.std = std
+        self.weights = weights
+        self.index_map = index_map
+        self.clip_paths = clip_paths
+        self.tree = tree
+
+    @property
+    def empty(self):
+        return self.tree is None
+
+    @property
+    def clip_offsets(self):
+        """
+        clip 경계 행 번호 [0, ..., N]. index_map의 행은 clip 단위로 모여 있음
+        """
+        clip_ids = self.index_map[:, 0]
+        boundaries = np.flatnonzero(clip_ids[1:] != clip_ids[:-1]) + 1
+        return np.concatenate([[0], boundaries, [len(clip_ids)]]).astype(np.int64)
+
+    def normalize(self, vec, out=None):
+        z = np.subtract(vec, self.mean, out=out)
+        z /= self.std
+        z *= self.weights
+        return z
+
+
+class QueryBuilder:
+    """
+    캐릭터 하나의 검색 query를 미리 할당한 float32 buffer에 채웁니다.
+    매 frame FeatureFrame을 deepcopy하거나 list/glm 객체를 새로 만들지 않고, 정규화와 가중치도 buffer 안에서 적용합니다.
+    raw의 배치는 extract_feature_vector와 같습니다:
+      velocity (S * 3), site 위치 (S * 3), 미래 위치 xz (K * 2), 미래 방향 xz (K * 2), 회전 (J * 4)
+    future_position / future_orientation은 예측한 (K, 3) 궤적으로, draw_matching_features에 그대로 넘길 수 있습니다.
+    :param num_sites: site 수 (Hips, 발)
+    :param num_rotations: motion.rotations의 joint 수
+    :param horizons: 미래 frame 간격 목록
+    """
+    def __init__(self, num_sites, num_rotations, horizons=FUTURE_HORIZONS):
+        num_horizons = len(horizons)
+        sections = feature_sections(num_sites, num_rotations, num_horizons)
+        self.raw = np.zeros(sections[-1], dtype=np.float32)
+        self.query = np.zeros(sections[-1], dtype=np.float32)
+
+        # raw를 나눠 쓰는 view
+        self.velocities = self.raw[sections[0]:sections[1]].reshape(num_sites, 3)
+        self.site_positions = self.raw[sections[1]:sections[2]].reshape(num_sites, 3)
+        self.future_xz = self.raw[sections[2]:sections[3]].reshape(num_horizons, 2)
+        self.future_dir_xz = self.raw[sections[3]:sections[4]].reshape(num_horizons, 2)
+        self.rotations = self.raw[sections[4]:sections[5]].reshape(num_rotations, 4)
+
+        self.future_position = np.zeros((num_horizons, 3), dtype=np.float32)
+        self.future_orientation = np.zeros((num_horizons, 3), dtype=np.float32)
+
+        # 궤적 예측용 작업 buffer
+        self.horizons = np.asarray(horizons, dtype=np.float32)
+        self._time = np.zeros(num_horizons, dtype=np.float32)
+        self._angle = np.zeros(num_horizons, dtype=np.float32)
+        self._cos = np.zeros(num_horizons, dtype=np.float32)
+        self._sin = np.zeros(num_horizons, dtype=np.float32)
+        self._direction = np.zeros((num_horizons, 3), dtype=np.float32)
+        self._square = np.zeros((num_horizons, 3), dtype=np.float32)
+        self._norm = np.zeros((num_horizons, 1), dtype=np.float32)
+        self._root = np.zeros((4, 4), dtype=np.float32)
+        self._forward = np.zeros(3, dtype=np.float32)
+
+    @classmethod
+    def for_motion(cls, motion, horizons=FUTURE_HORIZONS):
+        return cls(len(motion.site_names), motion.rotations.shape[1], horizons)
+
+    def update(self, motion, idx, root_kinematics, hip_velocity, current_dir, turn_rate, delta_time):
+        """
+        motion의 idx frame feature와 입력으로 예측한 궤적을 raw에 채웁니다.
+        :param root_kinematics: VirtualRoot의 전역 변환 (glm.mat4, 이동 + 회전)
+        :param hip_velocity: 입력 속도 (Hips velocity 대신 사용)
+        :param current_dir: 현재 진행 방향 (XZ 평면)
+        :param turn_rate: 초당 회전 각도 (rad)
+        :return: raw
+        """
+        self.velocities[:] = motion.row('velocities', idx)
+        self.velocities[0] = hip_velocity
+        self.site_positions[:] = motion.row('site_positions', idx)
+        self.rotations[:] = motion.row('rotations', idx)
+        self.predict_trajectory(root_kinematics, hip_velocity, current_dir, turn_rate, delta_time)
+        return self.raw
+
+    def predict_trajectory(self, root_kinematics, hip_velocity, current_dir, turn_rate, delta_time):
+        """
+        진행 방향을 horizon 별로 Y축 회전시키며 앞으로 나아가는 궤적을 VirtualRoot 기준으로 예측합니다.
+        현재 방향과 목표 방향을 0.5로 slerp 하므로 각 horizon에서는 (최단 경로로 감은) 회전 각도의 절반만 돕니다.
+        """
+        speed = float(np.linalg.norm(hip_velocity))
+        self._forward[:] = current_dir
+        self._forward /= np.linalg.norm(self._forward)
+        dx, dy, dz = self._forward.tolist()
+
+        np.multiply(self.horizons, delta_time, out=self._time)
+        np.multiply(self._time, turn_rate, out=self._angle)
+        self._angle += np.pi
+        np.remainder(self._angle, 2 * np.pi, out=self._angle)
+        self._angle -= np.pi
+        self._angle *= 0.5
+        np.cos(self._angle, out=self._cos)
+        np.sin(self._angle, out=self._sin)
+
+        # 진행 방향을 Y축으로 회전한 world 방향 (_angle은 여기부터 임시 buffer로 사용)
+        direction = self._direction
+        np.multiply(self._cos, dx, out=direction[:, 0])
+        np.multiply(self._sin, dz, out=self._angle)
+        direction[:, 0] += self._angle
+        direction[:, 1] = dy
+        np.multiply(self._cos, dz, out=direction[:, 2])
+        np.multiply(self._sin, dx, out=self._angle)
+        direction[:, 2] -= self._angle
+
+        # VirtualRoot 회전의 역변환 (강체 변환이므로 전치) 적용: v @ R == R^T v
+        self._root[:] = root_kinematics
+        rotation = self._root[:3, :3]
+        np.matmul(direction, rotation, out=self.future_orientation)
+        np.square(self.future_orientation, out=self._square)
+        np.sum(self._square, axis=1, keepdims=True, out=self._norm)
+        np.sqrt(self._norm, out=self._norm)
+        self.future_orientation /= self._norm
+
+        self._time *= speed
+        direction *= self._time[:, None]
+        np.matmul(direction, rotation, out=self.future_position)
+
+        self.future_xz[:, 0] = self.future_position[:, 0]
+        self.future_xz[:, 1] = self.future_position[:, 2]
+        self.future_dir_xz[:, 0] = self.future_orientation[:, 0]
+        self.future_dir_xz[:, 1] = self.future_orientation[:, 2]
+
+    def normalize(self, index):
+        """
+        raw를 index의 통계와 가중치로 정규화해 query에 씁니다.
+        """
+        return index.normalize(self.raw, out=self.query)
+
+
 class MotionKDTree:
-    def __init__(self, root_path):
+    def __init__(self, root_path, cache_dir=None, horizons=FUTURE_HORIZONS, end_policy='hold', workers=None,
+                 pool_size=16, backend='kdtree', backend_options=None):
         self.bvh_paths = self.find_all_bvh_files(root_path)
-        self.index_map = []
-        self.tree = None
-        self.mean = None
-        self.std = None
-        self.feature_vectors = []
-        self.weights = []
+        self.horizons = tuple(horizons)
+        self.end_policy = end_policy
+        self.workers = workers
+        self.clips = {}
+        self.index = None
+        self.motion_pool = MotionPool(pool_size)
+        self._clip_ids = itertools.count()
+        # 검색 backend 이름과 설정 (search_backends.BACKENDS 참고)
+        self.backend = backend
+        self.backend_options = dict(backend_options or {})
+        config_version = f"{FEATURE_CONFIG_VERSION}:{','.join(map(str, self.horizons))}:{end_policy}"
+        self.cache = MotionCache(cache_dir, config_version) if cache_dir else None
+        # cache가 없으면 pool에서 밀려난 clip을 다시 처리하지 않도록 임시 폴더에 내려 둠
+        self.spill = SpillStore() if self.cache is None else None
+        self._lock = threading.Lock()
+        self._rebuild_thread = None
+        self._dirty = False
         self.build()
 
+    # 현재 index snapshot의 값을 그대로 노출
+    @property
+    def tree(self):
+        return self.index.tree
+
+    @property
+    def mean(self):
+        return self.index.mean
+
+    @property
+    def std(self):
+        return self.index.std
+
+    @property
+    def weights(self):
+        return self.index.weights
+
+    @property
+    def feature_vectors(self):
+        return self.index.feature_vectors
+
+    @property
+    def index_map(self):
+        return self.index.index_map
+
     def find_all_bvh_files(self, root_folder):
         bvh_files = []
         for dirpath, _, filenames in os.walk(root_folder):
@@ -25,15 +418,10 @@ class MotionKDTree:
         return bvh_files
 
     def read_bvh_file(self, filepath):
-        root, motion = parse_bvh(filepath)
-        joint_order = get_preorder_joint_list(root)
-        motion.build_quaternion_frames(joint_order)
-        virtual = motion.apply_virtual(root)
-        motion.apply_velocity_feature(virtual)
-        motion.apply_future_feature()
-        return motion
+        return read_bvh_file(filepath, self.horizons, self.end_policy)
 
-    def extract_feature_vector(self, frame, quaternion_frame):
+    @staticmethod
+    def extract_feature_vector(frame, quaternion_frame):
         vec = []
         for v in frame.velocity.values():
             vec.extend([v.x, v.y, v.z])
@@ -46,37 +434,287 @@ class MotionKDTree:
         for q in quaternion_frame.joint_rotations.values():
             vec.extend([q.w, q.x, q.y, q.z])
         return np.array(vec, dtype=np.float32)
-    
-    def normalize(self, vec):
-        z = (vec - self.mean) / self.std
-        return z * self.weights 
+
+    @staticmethod
+    def extract_feature_matrix(motion, start=0, stop=None):
+        """
+        motion의 feature 배열에서 frame start ~ stop - 1의 feature 행렬을 한 번에 만듭니다.
+        열 순서는 extract_feature_vector와 같습니다.
+        :return: (N, D) float32
+        """
+        if motion.is_lazy:
+            # 필요한 frame만 합침
+            motion, start, stop = motion[start:stop], 0, None
+        rows = slice(start, stop)
+        blocks = [
+            motion.velocities[rows],
+            motion.site_positions[rows],
+            motion.future_positions[rows][..., [0, 2]],
+            motion.future_orientations[rows][..., [0, 2]],
+            motion.rotations[rows],
+        ]
+        return np.concatenate([block.reshape(len(block), int(np.prod(block.shape[1:]))) for block in blocks],
+                              axis=1).astype(np.float32, copy=False)
+
+    def normalize(self, vec, out=None):
+        return self.index.normalize(vec, out)
+
+    def load_cached_clip(self, path):
+        """
+        cache에 저장된 clip을 불러옵니다.
+        :return: ClipRecord 또는 None
+        """
+        if self.cache is None:
+            return None
+        signature = file_signature(path)
+        cached = self.cache.load_clip(path, ['features'])
+        if cached is None:
+            return None
+        arrays, meta = cached
+        # 통계는 meta에서 복원하므로 memory-map한 feature를 훑지 않음
+        return ClipRecord(next(self._clip_ids), path, arrays['features'], meta, signature,
+                          cached_statistics(meta, arrays['features']))
+
+    def load_motion(self, clip):
+        """
+        clip(ClipRecord)의 pose와 frame 별 feature 배열을 cache 또는 spill store에서 memory-map으로 불러옵니다.
+        둘 다 없을 때만 (cache entry가 지워진 경우 등) BVH를 다시 처리합니다.
+        """
+        names = ['rotations', 'positions', *FEATURE_ARRAYS]
+        if self.cache is not None:
+            stored = self.cache.load_clip(clip.path, names)
+        else:
+            stored = self.spill.load(clip.clip_id, names)
+        if stored is not None:
+            arrays, meta = stored
+            return clip_motion(meta['frame_time'], meta, arrays)
+        result = process_clip(clip.path, self.horizons, self.end_policy)
+        return clip_motion(result['frame_time'], result, result)
+
+    def get_motion(self, clip_id):
+        """
+        clip_id의 Motion을 LRU pool에서 가져오고, 없으면 불러와서 pool에 넣습니다.
+        :return: Motion, clip이 이미 삭제되었으면 None
+        """
+        clip = next((clip for clip in list(self.clips.values()) if clip.clip_id == clip_id), None)
+        if clip is None:
+            return None
+        return self.motion_pool.get(clip_id, lambda: self.load_motion(clip))
+
+    def load_skeleton(self):
+        """
+        database clip의 skeleton(root joint)을 BVH의 HIERARCHY만 읽어 새로 만듭니다. database의 clip은 모두 같은 skeleton입니다.
+        """
+        return parse_bvh_skeleton(next(iter(list(self.clips))))
+
+    def discard_motion(self, clip_id):
+        """
+        교체되거나 삭제된 clip의 pose를 pool과 spill store에서 버립니다.
+        """
+        self.motion_pool.discard(clip_id)
+        if self.spill is not None:
+            self.spill.discard(clip_id)
+
+    def process_clips(self, paths):
+        """
+        clip들을 처리한 결과를 paths 순서대로 내보냅니다. workers가 2 이상이면 process pool을 사용합니다.
+        """
+        if not self.workers or self.workers <= 1 or len(paths) <= 1:
+            for path in paths:
+                yield process_clip(path, self.horizons, self.end_policy)
+            return
+
+        with ProcessPoolExecutor(max_workers=min(self.workers, len(paths))) as executor:
+            yield from executor.map(process_clip, paths,
+                                    [self.horizons] * len(paths), [self.end_policy] * len(paths))
+
+    def store_clip(self, path, result, signature):
+        """
+        process_clip 결과를 ClipRecord로 만들고, cache가 있으면 저장합니다. 없으면 pose와 feature 배열을 spill store에 내려 둡니다.
+        pose 배열은 방금 만든 것이므로 LRU pool에 바로 넣어 둡니다.
+        :param signature: 처리하기 전에 읽어 둔 (size, mtime_ns)
+        :return: ClipRecord
+        """
+        clip_id = next(self._clip_ids)
+        self.motion_pool.put(clip_id, clip_motion(result['frame_time'], result, result))
+        meta = None
+        statistics = clip_statistics(result['features'])
+        names = {'frame_time': result['frame_time'],
+                 'rotation_names': result['rotation_names'],
+                 'position_names': result['position_names'],
+                 'site_names': result['site_names']}
+        if self.cache is not None:
+            count, mean, m2 = statistics
+            meta = self.cache.store_clip(
+                path, {name: result[name] for name in ('features', 'rotations', 'positions', *FEATURE_ARRAYS)},
+                dict(names, count=count, mean=mean.tolist(), m2=m2.tolist()))
+        else:
+            # feature 행렬은 ClipRecord가 메모리에 들고 있으므로 pose와 frame 별 feature만 내려 둠
+            self.spill.store(clip_id, {name: result[name] for name in ('rotations', 'positions', *FEATURE_ARRAYS)},
+                             names)
+        return ClipRecord(clip_id, path, result['features'], meta, signature, statistics)
 
     def build(self):
         print("building KDTree")
-        feature_vectors = []
-        for path in tqdm(self.bvh_paths):
-            motion = self.read_bvh_file(path)
-            for idx, frame in enumerate(motion.feature_frames[:-21]):
-                if idx:  # skip frame 0 if needed
-                    vec = self.extract_feature_vector(frame, motion.quaternion_frames[idx])
-                    feature_vectors.append(vec)
-                    self.index_map.append((motion, idx, path))
-
-        self.mean = np.mean(feature_vectors, axis=0)
-        self.std = np.std(feature_vectors, axis=0) + 1e-8
-        self.weights = self.compute_weights()
-
-        for vec in feature_vectors:
-            #print(vec)
-            normalized = self.normalize(np.array(vec))
-            self.feature_vectors.append(normalized)
-
-        self.tree = KDTree(self.feature_vectors)
-
-    def search(self, query_vec):
-        dist, idx = self.tree.query(query_vec)
-        return dist, self.index_map[idx], query_vec
-    
+        clips = [self.load_cached_clip(path) for path in self.bvh_paths]
+        missing = [i for i, clip in enumerate(clips) if clip is None]
+        signatures = {i: file_signature(self.bvh_paths[i]) for i in missing}
+        results = self.process_clips([self.bvh_paths[i] for i in missing])
+        for result, i in zip(tqdm(results, total=len(missing)), missing):
+            clips[i] = self.store_clip(self.bvh_paths[i], result, signatures[i])
+
+        # 병렬 처리 여부와 관계없이 bvh_paths 순서로 합침
+        self.clips = {clip.path: clip for clip in clips}
+
+        weights = self.compute_weights()
+
+        if self.cache is not None and all(clip.meta is not None for clip in clips):
+            index_key = self.cache.index_key([clip.meta for clip in clips], weights, self.backend_description())
+            cached = self.cache.load_index(index_key, ['feature_vectors', 'mean', 'std', 'weights', 'index_map'])
+            if cached is not None and len(cached[0]['index_map']) == sum(clip.count for clip in clips):
+                arrays, tree = cached
+                # cache에는 clip 순서 번호로 저장되어 있으므로 현재 clip_id로 바꿈
+                index_map = np.array(arrays['index_map'])
+                index_map[:, 0] = np.array([clip.clip_id for clip in clips], dtype=np.int32)[index_map[:, 0]]
+                self.index = SearchIndex(arrays['feature_vectors'], arrays['mean'], arrays['std'], arrays['weights'],
+                                         index_map, {clip.clip_id: clip.path for clip in clips}, tree)
+                return
+
+        self.index = self.make_index(clips)
+        self.store_index(clips)
+
+    def backend_description(self):
+        options = ','.join(f"{key}={value!r}" for key, value in sorted(self.backend_options.items()))
+        return f"{self.backend}({options})"
+
+    def make_index_map(self, clips):
+        """
+        :return: (N, 2) int32 배열, 각 행은 (clip_id, frame 번호). clip의 frame 0은 건너뜀
+        """
+        counts = [clip.count for clip in clips]
+        clip_ids = np.repeat(np.array([clip.clip_id for clip in clips], dtype=np.int32), counts)
+        frame_ids = np.concatenate([np.arange(1, count + 1, dtype=np.int32) for count in counts]) \
+            if clips else np.zeros(0, dtype=np.int32)
+        return np.stack([clip_ids, frame_ids], axis=1)
+
+    def make_index(self, clips):
+        """
+        clip 목록으로 새 SearchIndex를 만듭니다. 통계는 clip 단위 통계를 합쳐서 구합니다.
+        """
+        statistics = combine_statistics(clips)
+        if statistics is None:
+            # 마지막 clip까지 지워진 경우: 검색이 항상 "매칭 없음"을 돌려주는 빈 snapshot
+            weights = self.compute_weights()
+            return SearchIndex(np.zeros((0, len(weights)), dtype=np.float32),
+                               np.zeros(len(weights), dtype=np.float32), np.ones(len(weights), dtype=np.float32),
+                               weights, np.zeros((0, 2), dtype=np.int32), {}, None)
+        mean, std = statistics
+        index = SearchIndex(None, mean, std, self.compute_weights(), self.make_index_map(clips),
+                            {clip.clip_id: clip.path for clip in clips}, None)
+        # 합친 행렬 하나를 제자리에서 정규화
+        features = np.concatenate([clip.features for clip in clips if clip.count], axis=0)
+        index.feature_vectors = index.normalize(features, out=features)
+        clip_offsets = np.cumsum([0] + [clip.count for clip in clips])
+        index.tree = make_backend(self.backend, index.feature_vectors, clip_offsets, **self.backend_options)
+        return index
+
+    def store_index(self, clips):
+        index = self.index
+        if self.cache is None or index.empty or any(clip.meta is None for clip in clips):
+            return
+        # clip_id는 실행마다 달라지므로 clip 순서 번호로 바꿔서 저장
+        positions = {clip.clip_id: i for i, clip in enumerate(clips)}
+        index_map = np.array(index.index_map)
+        index_map[:, 0] = [positions[clip_id] for clip_id in index_map[:, 0].tolist()]
+        self.cache.store_index(self.cache.index_key([clip.meta for clip in clips], index.weights,
+                                                    self.backend_description()),
+                               {'feature_vectors': index.feature_vectors, 'mean': index.mean, 'std': index.std,
+                                'weights': index.weights, 'index_map': index_map},
+                               index.tree)
+
+    def add_clip(self, path, background=False):
+        """
+        clip을 추가하거나, 이미 있으면 다시 처리해서 교체합니다. 해당 clip만 처리한 뒤 index를 다시 만듭니다.
+        :param background: True면 index 재생성을 background thread에서 하고 끝나면 교체합니다.
+        """
+        signature = file_signature(path)
+        clip = self.load_cached_clip(path)
+        if clip is None:
+            clip = self.store_clip(path, process_clip(path, self.horizons, self.end_policy), signature)
+        with self._lock:
+            previous = self.clips.get(path)
+            self.clips[path] = clip
+            if path not in self.bvh_paths:
+                self.bvh_paths.append(path)
+        if previous is not None:
+            self.discard_motion(previous.clip_id)
+        self.rebuild_index(background)
+
+    replace_clip = add_clip
+
+    def remove_clip(self, path, background=False):
+        with self._lock:
+            clip = self.clips.pop(path, None)
+            if clip is None:
+                return
+            self.bvh_paths.remove(path)
+        self.discard_motion(clip.clip_id)
+        self.rebuild_index(background)
+
+    def rebuild_index(self, background=False):
+        """
+        현재 clip 목록으로 index를 다시 만들어 교체합니다.
+        background 재생성 중에 또 변경이 들어오면, 진행 중인 thread가 끝난 뒤 한 번 더 만듭니다.
+        """
+        if not background:
+            with self._lock:
+                clips = list(self.clips.values())
+            self.index = self.make_index(clips)
+            self.store_index(clips)
+            return
+
+        with self._lock:
+            self._dirty = True
+            if self._rebuild_thread is not None:
+                return
+            self._rebuild_thread = threading.Thread(target=self._rebuild_loop, daemon=True)
+            self._rebuild_thread.start()
+
+    def _rebuild_loop(self):
+        while True:
+            with self._lock:
+                if not self._dirty:
+                    self._rebuild_thread = None
+                    return
+                self._dirty = False
+                clips = list(self.clips.values())
+            index = self.make_index(clips)
+            # 참조 하나만 바꾸므로 검색 쪽은 항상 완성된 snapshot만 보게 됨
+            self.index = index
+            self.store_index(clips)
+
+    def wait_for_index(self):
+        """
+        진행 중인 background index 재생성이 끝날 때까지 기다립니다.
+        """
+        while True:
+            thread = self._rebuild_thread
+            if thread is None:
+                return
+            thread.join()
+
+    def search(self, query_vec, index=None):
+        """
+        :return: (거리, (clip_id, frame 번호, 경로), query_vec). pose는 get_motion(clip_id)로 불러옵니다.
+            빈 index면 (inf, (-1, -1, None), query_vec)
+        """
+        index = index or self.index
+        if index.empty:
+            return float('inf'), (-1, -1, None), query_vec
+        dist, idx = index.tree.query(query_vec)
+        clip_id, frame_idx = index.index_map[idx].tolist()
+        return dist, (clip_id, frame_idx, index.clip_paths[clip_id]), query_vec
+
     def compute_weights(self, quaternion_length =132):
         # hip velocity: 3, site velocity: 6, site pos: 6, future pos: 9, future ori: remainder
         w = []
@@ -84,16 +722,116 @@ class MotionKDTree:
         w += [1.5] * 6    # site velocities
         w += [0.0] * 3    # handling hip position
         w += [1.5] * 6    # site positions
-        w += [1.0] * 6    # future position
-        w += [1.0] * 6  # future orientation
+        w += [1.0] * (2 * len(self.horizons))    # future position
+        w += [1.0] * (2 * len(self.horizons))  # future orientation
         w += [0.2] * quaternion_length
         return np.array(w, dtype=np.float32)
-    
+
     def search_frame(self, query_frame, quaternion_frame):
+        # 정규화와 검색에 같은 snapshot을 사용
+        index = self.index
         query_vec = self.extract_feature_vector(query_frame, quaternion_frame)
-        query_vec = self.normalize(query_vec)
+        query_vec = index.normalize(query_vec)
+
+        return self.search(query_vec, index)
 
-        return self.search(query_vec)
+    def search_batch(self, query_vecs, index=None):
+        """
+        정규화된 query 여러 개를 backend의 일괄 검색(행렬곱, 멀티 thread 등)으로 한 번에 검색합니다.
+        :param query_vecs: (M, D)
+        :return: (거리 (M,), (M, 2) int 배열 — 각 행은 (clip_id, frame 번호)). 빈 index면 거리 inf, 행은 (-1, -1)
+        """
+        index = index or self.index
+        if index.empty:
+            count = len(query_vecs)
+            return np.full(count, np.inf, dtype=np.float32), np.full((count, 2), -1, dtype=np.int32)
+        dists, idxs = index.tree.query_batch(np.asarray(query_vecs))
+        return np.asarray(dists), index.index_map[np.asarray(idxs)]
+
+    def search_query_batch(self, builders):
+        """
+        QueryBuilder 여러 개를 같은 snapshot으로 정규화해서 search_batch로 한 번에 검색합니다.
+        :return: (거리 (M,), (M, 2) (clip_id, frame 번호), 경로 목록)
+        """
+        index = self.index
+        query_vecs = np.stack([builder.normalize(index) for builder in builders])
+        dists, matches = self.search_batch(query_vecs, index)
+        return dists, matches, [index.clip_paths.get(clip_id) for clip_id in matches[:, 0].tolist()]
+
+    def search_query(self, builder):
+        """
+        QueryBuilder의 raw를 현재 snapshot으로 정규화해 builder.query에 쓰고 검색합니다.
+        """
+        index = self.index
+        return self.search(builder.normalize(index), index)
+
+    def search_stats(self):
+        """
+        현재 검색 backend가 누적한 통계 (block 가지치기 횟수 등). 통계가 없는 backend면 None
+        """
+        return getattr(self.index.tree, 'stats', None)
 
     def distance_function(self, a, b):
         return np.linalg.norm(a - b)
+
+
+class ClipWatcher:
+    """
+    BVH 폴더를 주기적으로 확인해서 추가/수정/삭제된 clip을 MotionKDTree에 반영합니다.
+    clip 처리와 index 재생성은 모두 watcher thread에서 이뤄지므로 viewer는 멈추지 않습니다.
+    :param tree: 갱신할 MotionKDTree
+    :param root_path: 감시할 폴더
+    :param interval: 확인 주기 (초)
+    """
+    def __init__(self, tree, root_path, interval=2.0):
+        self.tree = tree
+        self.root_path = root_path
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def poll(self):
+        """
+        폴더를 한 번 확인하고 변경 사항을 반영합니다.
+        :return: 변경된 clip 수
+        """
+        paths = self.tree.find_all_bvh_files(self.root_path)
+        known = {path: clip.signature for path, clip in list(self.tree.clips.items())}
+        changes = 0
+
+        for path in paths:
+            try:
+                signature = file_signature(path)
+            except OSError:
+                continue
+            if known.get(path) != signature:
+                try:
+                    self.tree.add_clip(path, background=True)
+                except (OSError, ValueError, IndexError, StopIteration) as e:
+                    # 아직 쓰는 중인 파일 등은 다음 확인 때 다시 시도
+                    print(f"[ClipWatcher] skipped {path}: {e}")
+                    continue
+                changes += 1
+
+        current = set(paths)
+        for path in known:
+            if path.startswith(self.root_path) and path not in current:
+                self.tree.remove_clip(path, background=True)
+                changes += 1
+        return changes
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            changes = self.poll()
+            if changes:
+                print(f"[ClipWatcher] {changes} clip(s) updated")
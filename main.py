@@ -1,4 +1,5 @@
 import tkinter as tk
+import argparse
 import math
 import pygame
 from OpenGL.GL import *
@@ -6,19 +7,19 @@ from OpenGL.GLU import *
 import imgui
 from imgui.integrations.pygame import PygameRenderer
 from pyglm import glm
-from bvh_controller import parse_bvh, get_preorder_joint_list, FeatureFrame, get_joint_chains_from_root, connect
-from Rendering import draw_humanoid, draw_virtual_root_axis, draw_matching_features
+from Rendering import SkeletonRenderer, draw_virtual_root_axis, draw_matching_features
 from utils import draw_axes, set_lights, random_color
 from virtual_transforms import extract_xz_plane
 import Events
 import UI
-from feature_extractor import MotionKDTree
+from feature_extractor import MotionKDTree, ClipWatcher
+from simulation import FixedTimestep, load_entry, advance_entries, apply_entry, TRANSITION_MODE, TRANSITION_MODES
+from profiler import FrameProfiler
+from crowd import Crowd
 import numpy as np
-import copy
+import os
 
 
-tk.Tk().withdraw()
-
 state = {
     'center': glm.vec3(0, 0, 0),
     'eye': glm.vec3(20, 60, 200) * 0.5,
@@ -32,6 +33,14 @@ state = {
     'is_translating': False,
     'stop': False,
     'motions': [],
+    'crowd': None,
+    'profiler': None,
+    'transition_mode': TRANSITION_MODE,
+    # render 속도 (Hz)와 simulation step (Hz, 0이면 motion의 frame_time)
+    'render_rate': 60,
+    'sim_rate': 0,
+    'interpolate': True,
+    'instanced': True,
     'open_file_dialog': False
 }
 
@@ -42,89 +51,11 @@ def resize(width, height):
     gluPerspective(45.0, (width - 300) / (height - 200), 0.1, 5000.0)
     glMatrixMode(GL_MODELVIEW)
 
-def make_default_feature_frame(virtual_root, feature_frame):
-    joint_chains = get_joint_chains_from_root(virtual_root)
-    zero = glm.vec3(0)
-    root_name = virtual_root.children[0].name
-    feature_frame.velocity[root_name] = glm.vec3(0)
-    for chain in joint_chains:
-        joint_name = chain[-1].name
-        feature_frame.velocity[joint_name] = zero
-        feature_frame.site_positions[joint_name] = zero
-    for _ in range(3):
-        feature_frame.future_position.append(zero)
-        feature_frame.future_orientation.append(zero)
-    return feature_frame
-
-def make_current_feature_frame(vr, motion, idx, delta_time, hip_velocity, current_pos, current_dir, turn_rate):
-    feature_frame = copy.deepcopy(motion.feature_frames[idx])
-    feature_frame.future_position = []
-    feature_frame.future_orientation = []
-
-    feature_frame.velocity["Hips"] = hip_velocity
-    inv_root_tf = glm.inverse(vr.kinematics)
-
-    # future prediction (turning & moving forward)
-    steps = [20, 40, 60]
-    dir = glm.normalize(current_dir)
-    speed = glm.length(hip_velocity)
-
-    for k in steps:
-        t = k * delta_time
-        angle = turn_rate * t
-        rot_quat = glm.angleAxis(angle, glm.vec3(0, 1, 0))  # 회전 축: Y축
-
-        # 목표 방향과 slerp blending
-        target_dir = glm.normalize(rot_quat * dir)
-        q_current = glm.quat(glm.vec3(0, 0, 1), dir)
-        q_target = glm.quat(glm.vec3(0, 0, 1), target_dir)
-        q_blended = glm.slerp(q_current, q_target, 0.5)
-        rotated_dir = glm.normalize(q_blended * glm.vec3(0, 0, 1))
-
-        predicted_pos = current_pos + rotated_dir * speed * t
-
-        # local 기준 상대 위치/방향으로 변환
-        rel_pos = glm.vec3(inv_root_tf * glm.vec4(predicted_pos - current_pos, 0.0))
-        rel_dir = glm.normalize(glm.vec3(inv_root_tf * glm.vec4(rotated_dir, 0.0)))
-
-        feature_frame.future_position.append(rel_pos)
-        feature_frame.future_orientation.append(rel_dir)
-
-    return feature_frame
-
-
 def init_motion(file_path):
-    root, motion = parse_bvh(file_path)
-    joint_order = get_preorder_joint_list(root)
-    motion.build_quaternion_frames(joint_order)
-    virtual_root = motion.apply_virtual(root)
-    motion.apply_velocity_feature(virtual_root)
-    motion.apply_future_feature()
-    cur_feature = make_default_feature_frame(virtual_root, FeatureFrame())
-    new_entry = {
-        'name': file_path.split("/")[-1],
-        'root': virtual_root,
-        'motion': motion,
-        'frame_len': motion.frames,
-        'visible': True,
-        'frame_idx': 1,
-        'color': random_color(),
-        'controller': Events.InputController(),
-        'current_feature': cur_feature,
-        'count': 0
-    }
-    state['motions'].append(new_entry)
+    step = 1.0 / state['sim_rate'] if state['sim_rate'] else None
+    state['motions'].append(load_entry(file_path, Events.InputController(), random_color(), step))
     print("File loaded:", file_path)
 
-def attatch_motion(root, motion):
-    joint_order = get_preorder_joint_list(root)
-    motion.build_quaternion_frames(joint_order)
-    virtual_root = motion.apply_virtual(root)
-    motion.apply_velocity_feature(virtual_root)
-    motion.apply_future_feature()
-    cur_feature = make_default_feature_frame(virtual_root, FeatureFrame())
-    return cur_feature
-
 def main():
     pygame.init()
     size = (800, 600)
@@ -137,26 +68,32 @@ def main():
     impl = PygameRenderer()
     clock = pygame.time.Clock()
     running = True
-
-    search_interval = 50
-    motion_penalty = 5.0
+    renderer = SkeletonRenderer(instanced=state['instanced'])
+    crowd = state.get('crowd')
+    if crowd is not None:
+        crowd_clock = FixedTimestep(1.0 / state['sim_rate'] if state['sim_rate'] else crowd.frame_time)
 
     while running:
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
-                running = False
-                continue
-            impl.process_event(event)
-            io = imgui.get_io()
-            if event.type == pygame.MOUSEWHEEL and not io.want_capture_mouse:
-                Events.handle_mouse_wheel(event, state)
-            if event.type == pygame.MOUSEMOTION and not io.want_capture_mouse:
-                Events.handle_mouse_motion(event, state)
-            if event.type in (pygame.MOUSEBUTTONDOWN, pygame.MOUSEBUTTONUP) and not io.want_capture_mouse:
-                Events.handle_mouse_button(event, state)
-            if event.type == pygame.VIDEORESIZE:
-                size = event.size
-                screen = pygame.display.set_mode(size, pygame.DOUBLEBUF | pygame.OPENGL | pygame.RESIZABLE)
+        # 지난 frame부터 흐른 실제 시간만큼 simulation을 고정 step으로 진행 (render 속도와 무관)
+        elapsed = clock.tick(state['render_rate']) / 1000.0
+        profiler = state['profiler']
+        profiler.begin_frame()
+        with profiler.scope('events'):
+            for event in pygame.event.get():
+                if event.type == pygame.QUIT:
+                    running = False
+                    continue
+                impl.process_event(event)
+                io = imgui.get_io()
+                if event.type == pygame.MOUSEWHEEL and not io.want_capture_mouse:
+                    Events.handle_mouse_wheel(event, state)
+                if event.type == pygame.MOUSEMOTION and not io.want_capture_mouse:
+                    Events.handle_mouse_motion(event, state)
+                if event.type in (pygame.MOUSEBUTTONDOWN, pygame.MOUSEBUTTONUP) and not io.want_capture_mouse:
+                    Events.handle_mouse_button(event, state)
+                if event.type == pygame.VIDEORESIZE:
+                    size = event.size
+                    screen = pygame.display.set_mode(size, pygame.DOUBLEBUF | pygame.OPENGL | pygame.RESIZABLE)
 
         width, height = size[0], size[1]
         side_width = int(width * 0.25)
@@ -174,74 +111,54 @@ def main():
                   state['upVector'].x, state['upVector'].y, state['upVector'].z)
         draw_axes()
 
+        if crowd is not None:
+            steps = crowd_clock.advance(elapsed)
+            if not state['stop']:
+                with profiler.scope('crowd'):
+                    for _ in range(steps):
+                        crowd.step(crowd_clock.step, focus=np.array(state['center']))
+            with profiler.scope('draw'):
+                for i in range(crowd.count):
+                    renderer.add(crowd.apply_agent(i), crowd.colors[i])
+
+        entries = []
         if state.get('motions'):
-            for motion_entry in state['motions']:
-                if motion_entry.get('visible', True):
-                    controller = motion_entry['controller']
-                    keys = pygame.key.get_pressed()
-                    controller.update(keys)  
-
-                    if not state['stop']:
-                        motion_entry['frame_idx'] = motion_entry['frame_idx'] + 1
-
-                    frame_idx = motion_entry['frame_idx']
-                    motion_entry['motion'].apply_to_skeleton(frame_idx, motion_entry['root'])
-                    pos, dir, turn_rate = controller.update_virtual_kinematics(motion_entry['root'], motion_entry['motion'].frame_time)
-                    motion_entry['current_feature'] = make_current_feature_frame(
-                        motion_entry['root'],
-                        motion_entry['motion'],
-                        motion_entry['frame_idx'],
-                        motion_entry['motion'].frame_time,
-                        controller.current_velocity,
-                        pos, dir, turn_rate
+            entries = [motion_entry for motion_entry in state['motions'] if motion_entry.get('visible', True)]
+            keys = pygame.key.get_pressed()
+            for motion_entry in entries:
+                motion_entry['controller'].update(keys)
+            # step마다 검색할 캐릭터를 모아서 한 번에 검색
+            advance_entries(tree, entries, elapsed, state['stop'], profiler, state['transition_mode'])
+
+            with profiler.scope('draw'):
+                for motion_entry in entries:
+                    # 직전 step과 현재 step 사이를 보간한 pose로 그림 (보간한 root 변환은 그릴 때만 사용)
+                    motion_entry['draw_root'] = apply_entry(motion_entry, state['interpolate'] and not state['stop'])
+                    renderer.add(motion_entry['root'], motion_entry['color'], motion_entry['draw_root'])
+
+        with profiler.scope('draw'):
+            # 모은 skeleton을 한 번에 그린 뒤 축과 feature를 그림 (draw_matching_features가 modelview를 바꿈)
+            renderer.draw()
+            for motion_entry in entries:
+                if motion_entry['root'].children:
+                    draw_virtual_root_axis(
+                        extract_xz_plane(
+                            motion_entry['draw_root'] *
+                            motion_entry['root'].children[0].kinematics
+                        ), motion_entry['color']
                     )
-                    draw_humanoid(motion_entry['root'], motion_entry['color'])
-                    if motion_entry['root'].children:
-                        draw_virtual_root_axis(
-                            extract_xz_plane(
-                                motion_entry['root'].kinematics *
-                                motion_entry['root'].children[0].kinematics
-                            ), motion_entry['color']
-                        )
-                        draw_matching_features(motion_entry['root'], motion_entry['current_feature'])
-                    motion_entry['count'] += 1
-
-                    if frame_idx + 21 > motion_entry['frame_len']:
-                        motion_entry['count'] = 1000
-                    if motion_entry['count'] >= search_interval:
-                        dist, [matched_motion, matched_idx, path], query_vec = tree.search_frame(motion_entry['current_feature'], motion_entry['motion'].quaternion_frames[frame_idx])
-
-                        if frame_idx + 21 < motion_entry['frame_len']:
-                            current_next_feature = motion_entry['motion'].feature_frames[frame_idx + 1]
-                            current_next_joint = motion_entry['motion'].quaternion_frames[frame_idx + 1]
-                            current_next_vec = tree.extract_feature_vector(current_next_feature, current_next_joint)
-                            current_next_vec = tree.normalize(current_next_vec)
-                            dist_current = tree.distance_function(query_vec, current_next_vec)
-                        else:
-                            dist_current = float('inf')
-
-                        if dist + motion_penalty < dist_current:
-                            new_motion = connect(motion_entry['motion'][motion_entry['frame_idx']:motion_entry['frame_idx']+20],
-                                                matched_motion[matched_idx:], 0, transition_frames=20)
-
-                            motion_entry['motion'] = new_motion
-                            motion_entry['name'] = path.split("/")[-1]
-                            motion_entry['frame_idx'] = 0
-                            motion_entry['frame_len'] = new_motion.frames
-                            motion_entry['count'] = 0
-                            motion_entry['current_feature'] = attatch_motion(motion_entry['root'].children[0], new_motion)
-
-                            print(f"[SMART MATCH] {path} @ {matched_idx} (better distance: {dist:.2f} < {dist_current:.2f})")
-                        else:
-                            motion_entry['count'] = 0
-
-
-        io.display_size = width, height
-        imgui.new_frame()
-        imgui.render()
-        impl.render(imgui.get_draw_data())
-        pygame.display.flip()
-        clock.tick(60)
+                    draw_matching_features(motion_entry['root'], motion_entry['query'],
+                                           root_kinematics=motion_entry['draw_root'])
+
+        with profiler.scope('ui'):
+            io.display_size = width, height
+            imgui.new_frame()
+            UI.draw_profiler_panel(state, imgui.get_main_viewport())
+            imgui.render()
+            impl.render(imgui.get_draw_data())
+        with profiler.scope('present'):
+            pygame.display.flip()
+        profiler.end_frame()
 
         if state.get('open_file_dialog'):
             from tkinter import filedialog
@@ -257,8 +174,33 @@ def main():
     pygame.quit()
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--crowd', type=int, default=0, help="motion matching으로 움직이는 agent 수")
+    parser.add_argument('--profile', action='store_true', help="단계별 frame time 측정을 켠 채로 시작")
+    parser.add_argument('--transition', default=TRANSITION_MODE, choices=TRANSITION_MODES,
+                        help="clip 전환 방식 (blend: crossfade, inertialize: 바로 재생하며 pose 차이를 줄임)")
+    parser.add_argument('--fps', type=int, default=60, help="render 속도 (Hz)")
+    parser.add_argument('--sim-rate', type=float, default=0,
+                        help="simulation step (Hz). 0이면 BVH의 frame_time. 재생 속도는 step과 무관하게 BVH를 따름")
+    parser.add_argument('--no-interpolate', action='store_true', help="render할 때 step 사이를 보간하지 않음")
+    parser.add_argument('--legacy-render', action='store_true', help="skeleton을 instancing 없이 joint마다 그림 (비교용)")
+    args = parser.parse_args()
+
     file_path = "./bvh/data/exp/slow_walk.bvh"
     root_path = './bvh/data/exp'
+    cache_dir = './.motion_cache'
+    # process pool worker가 이 모듈을 다시 import해도 창이 뜨지 않도록 여기서 생성
+    tk.Tk().withdraw()
+    state['render_rate'] = args.fps
+    state['sim_rate'] = args.sim_rate
+    state['interpolate'] = not args.no_interpolate
+    state['instanced'] = not args.legacy_render
     init_motion(file_path)
-    tree = MotionKDTree(root_path)
+    tree = MotionKDTree(root_path, cache_dir=cache_dir, workers=os.cpu_count())
+    # 실행 중에 폴더에 추가/수정/삭제된 BVH를 database에 반영
+    ClipWatcher(tree, root_path).start()
+    if args.crowd:
+        state['crowd'] = Crowd(tree, args.crowd, transition_mode=args.transition)
+    state['transition_mode'] = args.transition
+    state['profiler'] = FrameProfiler(enabled=args.profile)
     main()
\ No newline at end of file
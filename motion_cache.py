@@ -0,0 +1,230 @@
+import hashlib
+import json
+import os
+import pickle
+import shutil
+import tempfile
+import weakref
+
+import numpy as np
+
+CACHE_FORMAT_VERSION = 1
+
+
+def content_hash(path, chunk_size=1 << 20):
+    """
+    파일 내용의 sha1 hash를 계산합니다.
+    :param path: 파일 경로
+    :param chunk_size: 한 번에 읽을 byte 수
+    :return: hex 문자열
+    """
+    h = hashlib.sha1()
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(chunk_size), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _write_json(path, data):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as file:
+        json.dump(data, file)
+    os.replace(tmp_path, path)
+
+
+def _read_json(path):
+    try:
+        with open(path, 'r') as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_arrays(directory, arrays):
+    for name, array in arrays.items():
+        tmp_path = os.path.join(directory, name + '.tmp.npy')
+        np.save(tmp_path, np.ascontiguousarray(array))
+        os.replace(tmp_path, os.path.join(directory, name + '.npy'))
+
+
+def _load_arrays(directory, names):
+    arrays = {}
+    for name in names:
+        path = os.path.join(directory, name + '.npy')
+        if not os.path.exists(path):
+            return None
+        arrays[name] = np.load(path, mmap_mode='r')
+    return arrays
+
+
+class MotionCache:
+    """
+    처리된 motion database를 디스크에 저장하는 cache입니다.
+    clip 별 feature/pose 배열과 정규화된 index를 .npy로 저장하고, 읽을 때는 memory-map 합니다.
+    clip entry는 BVH 경로, 파일 크기, mtime(달라지면 content hash), feature 설정 버전으로 검증합니다.
+    :param cache_dir: cache 디렉토리
+    :param config_version: feature 설정 버전. 바뀌면 기존 entry는 모두 무효가 됩니다.
+    """
+    def __init__(self, cache_dir, config_version):
+        self.cache_dir = cache_dir
+        self.config_version = f"{CACHE_FORMAT_VERSION}:{config_version}"
+        self.clip_dir = os.path.join(cache_dir, 'clips')
+        self.index_dir = os.path.join(cache_dir, 'index')
+        os.makedirs(self.clip_dir, exist_ok=True)
+        os.makedirs(self.index_dir, exist_ok=True)
+
+    def clip_path(self, bvh_path):
+        key = hashlib.sha1(os.path.abspath(bvh_path).encode()).hexdigest()
+        return os.path.join(self.clip_dir, key)
+
+    def load_clip(self, bvh_path, array_names):
+        """
+        cache된 clip 배열을 memory-map으로 불러옵니다.
+        :param bvh_path: 원본 BVH 경로
+        :param array_names: 불러올 배열 이름 목록
+        :return: (arrays, meta) 또는 cache가 없거나 오래되었으면 None
+        """
+        directory = self.clip_path(bvh_path)
+        meta = _read_json(os.path.join(directory, 'meta.json'))
+        if meta is None or meta.get('config_version') != self.config_version:
+            return None
+
+        stat = os.stat(bvh_path)
+        if meta['size'] != stat.st_size:
+            return None
+        if meta['mtime_ns'] != stat.st_mtime_ns:
+            # touch만 된 경우는 내용이 같으므로 mtime만 갱신해서 재사용
+            if meta['hash'] != content_hash(bvh_path):
+                return None
+            meta['mtime_ns'] = stat.st_mtime_ns
+            _write_json(os.path.join(directory, 'meta.json'), meta)
+
+        arrays = _load_arrays(directory, array_names)
+        if arrays is None:
+            return None
+        return arrays, meta
+
+    def store_clip(self, bvh_path, arrays, extra_meta=None):
+        """
+        clip 배열을 저장합니다. meta.json을 마지막에 쓰므로 중간에 중단되어도 깨진 entry가 남지 않습니다.
+        :param bvh_path: 원본 BVH 경로
+        :param arrays: 이름 -> np.ndarray
+        :param extra_meta: meta.json에 함께 저장할 값 (joint 이름, frame_time 등)
+        :return: 저장한 meta
+        """
+        directory = self.clip_path(bvh_path)
+        os.makedirs(directory, exist_ok=True)
+        meta_path = os.path.join(directory, 'meta.json')
+        if os.path.exists(meta_path):
+            os.remove(meta_path)
+
+        _write_arrays(directory, arrays)
+
+        stat = os.stat(bvh_path)
+        meta = dict(extra_meta or {})
+        meta.update({
+            'path': os.path.abspath(bvh_path),
+            'size': stat.st_size,
+            'mtime_ns': stat.st_mtime_ns,
+            'hash': content_hash(bvh_path),
+            'config_version': self.config_version,
+        })
+        _write_json(meta_path, meta)
+        return meta
+
+    def index_key(self, clip_metas, weights, backend=''):
+        """
+        :param backend: 검색 backend 이름과 설정. 저장된 검색 구조가 backend마다 다르므로 key에 포함합니다.
+        """
+        h = hashlib.sha1(self.config_version.encode())
+        for meta in clip_metas:
+            h.update(f"{meta['path']}|{meta['hash']}".encode())
+        h.update(np.ascontiguousarray(weights, dtype=np.float32).tobytes())
+        h.update(backend.encode())
+        return h.hexdigest()
+
+    def load_index(self, key, array_names):
+        """
+        정규화된 feature 행렬과 통계, 검색 트리를 불러옵니다.
+        :param key: index_key()로 만든 key
+        :param array_names: 불러올 배열 이름 목록
+        :return: (arrays, tree) 또는 None
+        """
+        meta = _read_json(os.path.join(self.index_dir, 'meta.json'))
+        if meta is None or meta.get('key') != key:
+            return None
+
+        arrays = _load_arrays(self.index_dir, array_names)
+        if arrays is None:
+            return None
+
+        try:
+            with open(os.path.join(self.index_dir, 'tree.pkl'), 'rb') as file:
+                tree = pickle.load(file)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            return None
+        return arrays, tree
+
+    def store_index(self, key, arrays, tree):
+        meta_path = os.path.join(self.index_dir, 'meta.json')
+        if os.path.exists(meta_path):
+            os.remove(meta_path)
+
+        _write_arrays(self.index_dir, arrays)
+
+        tmp_path = os.path.join(self.index_dir, 'tree.pkl.tmp')
+        with open(tmp_path, 'wb') as file:
+            pickle.dump(tree, file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, os.path.join(self.index_dir, 'tree.pkl'))
+
+        _write_json(meta_path, {'key': key})
+
+    def clear(self):
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+        os.makedirs(self.clip_dir, exist_ok=True)
+        os.makedirs(self.index_dir, exist_ok=True)
+
+
+class SpillStore:
+    """
+    cache 디렉토리 없이 실행할 때 처리한 clip 배열을 임시 폴더에 .npy로 내려 두는 저장소입니다.
+    LRU pool에서 밀려난 clip을 BVH를 다시 처리하지 않고 memory-map으로 다시 불러옵니다.
+    폴더는 객체가 사라지거나 close()를 부르면 지워집니다.
+    """
+    def __init__(self, prefix='motion_spill_'):
+        self.directory = tempfile.mkdtemp(prefix=prefix)
+        self.metas = {}
+        self._finalizer = weakref.finalize(self, shutil.rmtree, self.directory, True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, str(key))
+
+    def store(self, key, arrays, meta):
+        """
+        :param key: clip 식별자 (clip_id)
+        :param arrays: 이름 -> np.ndarray
+        :param meta: 배열과 함께 돌려줄 값 (joint 이름, frame_time 등). 메모리에만 둠
+        """
+        directory = self._path(key)
+        os.makedirs(directory, exist_ok=True)
+        _write_arrays(directory, arrays)
+        self.metas[key] = meta
+
+    def load(self, key, array_names):
+        """
+        :return: (arrays, meta) 또는 저장된 적이 없으면 None
+        """
+        meta = self.metas.get(key)
+        if meta is None:
+            return None
+        arrays = _load_arrays(self._path(key), array_names)
+        if arrays is None:
+            return None
+        return arrays, meta
+
+    def discard(self, key):
+        if self.metas.pop(key, None) is not None:
+            shutil.rmtree(self._path(key), ignore_errors=True)
+
+    def close(self):
+        self._finalizer()
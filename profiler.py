@@ -0,0 +1,137 @@
+import json
+import time
+from collections import deque
+
+import numpy as np
+
+
+class RingBuffer:
+    """
+    최근 capacity개의 값만 저장하는 고정 크기 버퍼.
+    """
+    def __init__(self, capacity):
+        self.data = np.zeros(capacity, dtype=np.float32)
+        self.index = 0
+        self.count = 0
+
+    def push(self, value):
+        self.data[self.index] = value
+        self.index = (self.index + 1) % len(self.data)
+        self.count = min(self.count + 1, len(self.data))
+
+    def values(self):
+        """
+        오래된 것부터 시간 순서로
+        """
+        if self.count < len(self.data):
+            return self.data[:self.count]
+        return np.roll(self.data, -self.index)
+
+
+class _NullScope:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_SCOPE = _NullScope()
+
+
+class _Scope:
+    __slots__ = ('profiler', 'name', 'start')
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.profiler.record(self.name, self.start, time.perf_counter())
+        return False
+
+
+class FrameProfiler:
+    """
+    main loop의 단계별 시간을 frame 단위로 모아 단계마다 ring buffer에 저장합니다.
+    한 frame 안에서 같은 이름의 scope가 여러 번 열리면 (캐릭터마다 등) 시간을 더합니다.
+    꺼져 있으면 scope()가 아무것도 하지 않는 객체를 돌려주므로 계측 비용이 거의 없습니다.
+    :param capacity: 단계마다 기억할 frame 수
+    :param max_events: trace로 남길 최대 scope 수 (오래된 것부터 버림)
+    """
+    def __init__(self, capacity=300, enabled=False, max_events=200000):
+        self.capacity = capacity
+        self.enabled = enabled
+        self.stages = {}
+        self.frame_times = RingBuffer(capacity)
+        self.events = deque(maxlen=max_events)
+        self.frame = 0
+        self._current = {}
+        self._frame_start = None
+
+    def scope(self, name):
+        if not self.enabled:
+            return _NULL_SCOPE
+        return _Scope(self, name)
+
+    def record(self, name, start, stop):
+        self._current[name] = self._current.get(name, 0.0) + (stop - start)
+        self.events.append((name, start, stop - start, self.frame))
+
+    def begin_frame(self):
+        if not self.enabled:
+            self._frame_start = None
+            return
+        self._current = {}
+        self._frame_start = time.perf_counter()
+
+    def end_frame(self):
+        """
+        이번 frame의 단계별 합계와 begin_frame부터의 frame time을 buffer에 넣습니다.
+        """
+        if not self.enabled or self._frame_start is None:
+            return
+        self.frame_times.push((time.perf_counter() - self._frame_start) * 1e3)
+        for name in self._current.keys() - self.stages.keys():
+            self.stages[name] = RingBuffer(self.capacity)
+        for name, buffer in self.stages.items():
+            buffer.push(self._current.get(name, 0.0) * 1e3)
+        self._frame_start = None
+        self.frame += 1
+
+    def reset(self):
+        self.stages = {}
+        self.frame_times = RingBuffer(self.capacity)
+        self.events.clear()
+        self._current = {}
+        self._frame_start = None
+
+    def summary(self):
+        """
+        :return: {단계 이름: (평균, p95, 최대)} ms 단위. 'frame'은 frame 전체
+        """
+        result = {}
+        for name, buffer in [('frame', self.frame_times)] + sorted(self.stages.items()):
+            values = buffer.values()
+            if len(values):
+                result[name] = (float(values.mean()), float(np.percentile(values, 95)), float(values.max()))
+        return result
+
+    def dump_trace(self, path):
+        """
+        기록된 scope들을 Chrome trace event 형식(chrome://tracing, Perfetto에서 열림)으로 저장합니다.
+        """
+        events = [{'name': name, 'ph': 'X', 'ts': start * 1e6, 'dur': duration * 1e6,
+                   'pid': 0, 'tid': 0, 'args': {'frame': frame}}
+                  for name, start, duration, frame in list(self.events)]
+        with open(path, 'w') as file:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, file)
+        return len(events)
+
+
+# 계측 지점의 기본값. 항상 꺼져 있음
+NULL_PROFILER = FrameProfiler(capacity=1, max_events=0)
@@ -0,0 +1,428 @@
+import numpy as np
+from scipy.spatial import KDTree, cKDTree
+
+
+class KDTreeBackend:
+    """
+    scipy.spatial.KDTree 검색 (기존 방식).
+    :param data: (N, D) 정규화된 feature 행렬
+    :param workers: query_batch에 쓸 thread 수 (1이면 단일 thread)
+    """
+    name = 'kdtree'
+    exact = True
+
+    def __init__(self, data, workers=1):
+        self.tree = KDTree(data)
+        self.workers = workers
+
+    def query(self, vec):
+        return self.tree.query(vec)
+
+    def query_batch(self, vecs):
+        return self.tree.query(vecs, workers=self.workers)
+
+
+class CKDTreeBackend:
+    """
+    scipy.spatial.cKDTree 검색. 여러 query는 workers 개의 thread로 나눠서 처리합니다.
+    :param data: (N, D) 정규화된 feature 행렬
+    :param workers: query_batch에 쓸 thread 수 (-1이면 전체 core)
+    :param leafsize: leaf node 크기
+    """
+    name = 'ckdtree'
+    exact = True
+
+    def __init__(self, data, workers=-1, leafsize=16):
+        self.tree = cKDTree(data, leafsize=leafsize)
+        self.workers = workers
+
+    def query(self, vec):
+        return self.tree.query(vec)
+
+    def query_batch(self, vecs):
+        return self.tree.query(vecs, workers=self.workers)
+
+
+def _nearest_candidates(data, sq_norms, vecs, count, block_size):
+    """
+    ||a||^2 - 2ab + ||b||^2 를 block 단위 행렬곱으로 계산해서 query 별로 가까운 후보 count개를 고릅니다.
+    ||a||^2는 순위에 영향을 주지 않으므로 생략합니다.
+    :return: ((M, count) 후보 index, (M, count) 후보의 float32 점수 ||b||^2 - 2ab)
+    """
+    candidates = []
+    scores = []
+    for start in range(0, len(data), block_size):
+        block = data[start:start + block_size]
+        score = sq_norms[start:start + block_size] - 2.0 * (vecs @ block.T)
+        k = min(count, block.shape[0])
+        top = np.argpartition(score, k - 1, axis=1)[:, :k]
+        candidates.append(top + start)
+        scores.append(np.take_along_axis(score, top, axis=1))
+    candidates = np.concatenate(candidates, axis=1)
+    scores = np.concatenate(scores, axis=1)
+    k = min(count, candidates.shape[1])
+    top = np.argpartition(scores, k - 1, axis=1)[:, :k]
+    return np.take_along_axis(candidates, top, axis=1), np.take_along_axis(scores, top, axis=1)
+
+
+def _exact_nearest(data, vecs, candidates):
+    """
+    후보 중에서 float64로 정확한 거리를 다시 계산해 가장 가까운 것을 고릅니다.
+    :return: (거리 (M,), index (M,))
+    """
+    diff = data[candidates].astype(np.float64) - vecs[:, None, :]
+    dists = np.sqrt(np.einsum('mkd,mkd->mk', diff, diff))
+    best = np.argmin(dists, axis=1)
+    rows = np.arange(len(vecs))
+    return dists[rows, best], candidates[rows, best]
+
+
+class BruteForceBackend:
+    """
+    전체 feature 행렬을 BLAS 행렬곱으로 훑는 선형 탐색입니다. 고차원에서는 KD-tree보다 빠른 경우가 많습니다.
+    float32 행렬곱으로 후보 rerank개를 고른 뒤 float64로 정확한 거리를 다시 계산합니다.
+    후보 밖의 행이 float32 오차 범위 안에서 더 가까울 수 있는 query는 float64로 전체를 다시 훑으므로 결과는 정확 검색과 같습니다.
+    stats에 query 수와 전체를 다시 훑은 query 수를 누적합니다 (reset_stats()로 초기화).
+    :param data: (N, D) 정규화된 feature 행렬
+    :param block_size: 한 번에 행렬곱 할 database 행 수
+    :param rerank: 정확한 거리로 다시 비교할 후보 수
+    """
+    name = 'brute'
+    exact = True
+
+    def __init__(self, data, block_size=16384, rerank=8):
+        self.data = np.ascontiguousarray(data, dtype=np.float32)
+        self.sq_norms = np.einsum('ij,ij->i', self.data, self.data)
+        self.max_norm = float(np.sqrt(self.sq_norms.max(initial=0.0)))
+        # float32 내적/제곱합 오차 상한의 계수: 단위 반올림 eps/2 x (D번 누적 + 뺄셈) x 여유 2배
+        self.error_scale = (self.data.shape[1] + 2) * float(np.finfo(np.float32).eps)
+        self.block_size = block_size
+        self.rerank = rerank
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.stats = {
+            'queries': 0,
+            'full_scans': 0,
+        }
+
+    def query(self, vec):
+        dists, idxs = self.query_batch(np.asarray(vec)[None])
+        return dists[0], idxs[0]
+
+    def query_batch(self, vecs):
+        vecs = np.asarray(vecs, dtype=np.float32)
+        candidates, scores = _nearest_candidates(self.data, self.sq_norms, vecs, self.rerank, self.block_size)
+        dists, idxs = _exact_nearest(self.data, vecs, candidates)
+        self.stats['queries'] += len(vecs)
+        if candidates.shape[1] == len(self.data):
+            return dists, idxs
+
+        # 후보 밖의 행은 float32 점수가 후보의 최대 점수 이상이므로,
+        # 그 값이 최근접 후보의 정확한 점수 + 오차 상한보다 크면 더 가까운 행이 있을 수 없음
+        query_sq = np.einsum('md,md->m', vecs.astype(np.float64), vecs.astype(np.float64))
+        query_norms = np.sqrt(query_sq)
+        bounds = self.error_scale * (self.max_norm ** 2 + 2.0 * query_norms * self.max_norm)
+        unsure = np.flatnonzero(scores.max(axis=1) <= np.square(dists) - query_sq + bounds)
+        for m in unsure.tolist():
+            dists[m], idxs[m] = self._full_scan(vecs[m])
+        self.stats['full_scans'] += len(unsure)
+        return dists, idxs
+
+    def _full_scan(self, vec):
+        """
+        float64로 전체 행을 훑어 가장 가까운 행을 찾습니다.
+        """
+        best_dist, best_idx = np.inf, -1
+        vec = vec.astype(np.float64)
+        for start in range(0, len(self.data), self.block_size):
+            diff = self.data[start:start + self.block_size].astype(np.float64) - vec
+            dists = np.einsum('nd,nd->n', diff, diff)
+            i = int(np.argmin(dists))
+            if dists[i] < best_dist:
+                best_dist, best_idx = dists[i], start + i
+        return np.sqrt(best_dist), best_idx
+
+
+class IVFBackend:
+    """
+    k-means로 feature를 n_lists개의 cluster로 나누고, query와 가까운 n_probe개 cluster만 탐색하는 근사 검색입니다.
+    n_probe를 키울수록 정확 검색에 가까워지고 느려집니다.
+    :param data: (N, D) 정규화된 feature 행렬
+    :param n_lists: cluster 수 (None이면 sqrt(N))
+    :param n_probe: query마다 탐색할 cluster 수
+    :param iterations: k-means 반복 횟수
+    :param seed: k-means 초기화 seed
+    :param block_size: cluster 배정 시 한 번에 행렬곱 할 행 수
+    """
+    name = 'ivf'
+    exact = False
+
+    def __init__(self, data, n_lists=None, n_probe=8, iterations=10, seed=0, block_size=16384):
+        data = np.ascontiguousarray(data, dtype=np.float32)
+        n_lists = min(n_lists or max(1, int(np.sqrt(len(data)))), len(data))
+        self.n_probe = n_probe
+        self.block_size = block_size
+
+        rng = np.random.default_rng(seed)
+        centroids = data[rng.choice(len(data), n_lists, replace=False)]
+        for _ in range(iterations):
+            assignment = self._assign(data, centroids)
+            counts = np.bincount(assignment, minlength=n_lists)
+            order = np.argsort(assignment, kind='stable')
+            filled = counts > 0
+            starts = np.searchsorted(assignment[order], np.arange(n_lists))[filled]
+            sums = np.add.reduceat(data[order], starts, axis=0, dtype=np.float64)
+            # 비어 있는 cluster는 이전 중심을 유지
+            centroids[filled] = (sums / counts[filled, None]).astype(np.float32)
+        assignment = self._assign(data, centroids)
+
+        # cluster 순서로 정렬해서 cluster 하나가 연속된 구간이 되도록 함
+        order = np.argsort(assignment, kind='stable')
+        self.ids = order
+        self.data = data[order]
+        self.offsets = np.searchsorted(assignment[order], np.arange(n_lists + 1))
+        self.centroids = centroids
+        self.centroid_sq_norms = np.einsum('ij,ij->i', centroids, centroids)
+
+    def _assign(self, data, centroids):
+        sq_norms = np.einsum('ij,ij->i', centroids, centroids)
+        assignment = np.empty(len(data), dtype=np.int64)
+        for start in range(0, len(data), self.block_size):
+            block = data[start:start + self.block_size]
+            assignment[start:start + len(block)] = np.argmin(sq_norms - 2.0 * (block @ centroids.T), axis=1)
+        return assignment
+
+    def query(self, vec):
+        dists, idxs = self.query_batch(np.asarray(vec)[None])
+        return dists[0], idxs[0]
+
+    def query_batch(self, vecs):
+        vecs = np.asarray(vecs, dtype=np.float32)
+        n_probe = min(self.n_probe, len(self.centroids))
+        probes, _ = _nearest_candidates(self.centroids, self.centroid_sq_norms, vecs, n_probe, self.block_size)
+
+        dists = np.empty(len(vecs), dtype=np.float64)
+        idxs = np.empty(len(vecs), dtype=np.int64)
+        for i, vec in enumerate(vecs):
+            rows = np.concatenate([np.arange(self.offsets[c], self.offsets[c + 1]) for c in probes[i]])
+            if not len(rows):
+                rows = np.arange(len(self.data))
+            diff = self.data[rows].astype(np.float64) - vec
+            d = np.einsum('kd,kd->k', diff, diff)
+            best = np.argmin(d)
+            dists[i] = np.sqrt(d[best])
+            idxs[i] = self.ids[rows[best]]
+        return dists, idxs
+
+
+def _box_distance2(lo, hi, vec):
+    """
+    query와 각 AABB 사이의 최소 거리 제곱. box 안에 있는 차원은 0입니다.
+    """
+    gap = np.maximum(lo - vec, 0.0) + np.maximum(vec - hi, 0.0)
+    return np.einsum('ij,ij->i', gap, gap)
+
+
+class AABBBackend:
+    """
+    clip의 연속된 frame을 큰 block(large_size)과 그 안의 작은 block(small_size)으로 묶고,
+    block 별로 차원마다 min/max (AABB)를 미리 구해 둔 정확 검색입니다.
+    box까지의 최소 거리가 지금까지 찾은 최근접 거리보다 크면 block 전체를 건너뜁니다.
+    큰 block은 box 거리 순으로 방문하므로 가까운 후보를 일찍 찾고, 나머지는 대부분 가지치기됩니다.
+    stats에 방문/가지치기 한 block 수와 거리 계산 횟수를 누적합니다 (reset_stats()로 초기화).
+    :param data: (N, D) 정규화된 feature 행렬
+    :param clip_offsets: clip 경계 행 번호 [0, ..., N]. block은 clip 경계를 넘지 않습니다.
+    :param small_size: 작은 block의 frame 수
+    :param large_size: 큰 block의 frame 수
+    """
+    name = 'aabb'
+    exact = True
+    clip_aware = True
+
+    def __init__(self, data, clip_offsets=None, small_size=16, large_size=128):
+        self.data = np.ascontiguousarray(data, dtype=np.float32)
+        if clip_offsets is None:
+            clip_offsets = [0, len(self.data)]
+
+        small_starts = []
+        large_first = []
+        for clip_start, clip_end in zip(clip_offsets[:-1], clip_offsets[1:]):
+            for large_start in range(clip_start, clip_end, large_size):
+                large_first.append(len(small_starts))
+                small_starts.extend(range(large_start, min(large_start + large_size, clip_end), small_size))
+        # block이 전체 행을 순서대로 덮으므로 block 끝은 다음 block의 시작
+        self.small_starts = np.array(small_starts + [len(self.data)], dtype=np.int64)
+        self.large_first = np.array(large_first + [len(small_starts)], dtype=np.int64)
+
+        # box는 float64로 들고 있어서 하한 계산의 반올림 오차로 잘못 가지치기하지 않도록 함
+        data64 = self.data.astype(np.float64)
+        self.small_lo = np.minimum.reduceat(data64, self.small_starts[:-1], axis=0)
+        self.small_hi = np.maximum.reduceat(data64, self.small_starts[:-1], axis=0)
+        self.large_lo = np.minimum.reduceat(self.small_lo, self.large_first[:-1], axis=0)
+        self.large_hi = np.maximum.reduceat(self.small_hi, self.large_first[:-1], axis=0)
+        self.small_sizes = np.diff(self.small_starts)
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.stats = {
+            'queries': 0,
+            'large_blocks': 0,
+            'large_pruned': 0,
+            'small_blocks': 0,
+            'small_pruned': 0,
+            'distance_evaluations': 0,
+        }
+
+    def query(self, vec):
+        vec = np.asarray(vec, dtype=np.float64)
+        stats = self.stats
+        large_bounds = _box_distance2(self.large_lo, self.large_hi, vec)
+        order = np.argsort(large_bounds)
+        best_dist2 = np.inf
+        best_idx = -1
+
+        stats['queries'] += 1
+        stats['large_blocks'] += len(order)
+        for visited, large in enumerate(order.tolist()):
+            if large_bounds[large] > best_dist2:
+                # box 거리 순으로 정렬되어 있으므로 나머지도 모두 멀다
+                stats['large_pruned'] += len(order) - visited
+                break
+
+            first, last = int(self.large_first[large]), int(self.large_first[large + 1])
+            small_bounds = _box_distance2(self.small_lo[first:last], self.small_hi[first:last], vec)
+            keep = small_bounds <= best_dist2
+            stats['small_blocks'] += last - first
+            stats['small_pruned'] += int(last - first - np.count_nonzero(keep))
+
+            row_start, row_end = self.small_starts[first], self.small_starts[last]
+            rows = np.arange(row_start, row_end)[np.repeat(keep, self.small_sizes[first:last])]
+            if not len(rows):
+                continue
+            diff = self.data[rows].astype(np.float64) - vec
+            dist2 = np.einsum('ij,ij->i', diff, diff)
+            stats['distance_evaluations'] += len(rows)
+            i = np.argmin(dist2)
+            if dist2[i] < best_dist2:
+                best_dist2 = dist2[i]
+                best_idx = rows[i]
+        return np.sqrt(best_dist2), best_idx
+
+    def query_batch(self, vecs):
+        results = [self.query(vec) for vec in np.asarray(vecs)]
+        return np.array([r[0] for r in results]), np.array([r[1] for r in results], dtype=np.int64)
+
+
+class PCABackend:
+    """
+    차원을 줄인 공간에서 후보를 찾고 원래 벡터로 다시 순위를 매기는 검색입니다.
+    가중치가 0인 차원(정규화 후 항상 0인 열)을 빼고, 남은 열을 PCA 기저에 투영한 뒤 cKDTree를 만듭니다.
+    주성분 수는 누적 분산 비율이 variance 이상이 되는 최소 개수입니다.
+    query마다 축소 공간에서 rerank개의 후보를 찾아 전체 벡터 거리로 다시 비교합니다.
+    투영 거리는 실제 거리의 하한이므로, adaptive면 후보 중 가장 먼 투영 거리가 찾은 거리보다 작을 때
+    후보 수를 두 배로 늘려 다시 찾고, 결과는 정확 검색과 같습니다.
+    :param data: (N, D) 정규화된 feature 행렬
+    :param variance: 유지할 누적 분산 비율 (0 ~ 1)
+    :param rerank: 전체 벡터로 다시 비교할 후보 수
+    :param adaptive: True면 정확한 결과가 보장될 때까지 후보 수를 늘림
+    :param workers: query_batch에 쓸 thread 수
+    """
+    name = 'pca'
+
+    def __init__(self, data, variance=0.99, rerank=16, adaptive=True, workers=-1):
+        self.data = np.ascontiguousarray(data, dtype=np.float32)
+        self.rerank = rerank
+        self.adaptive = adaptive
+        self.exact = adaptive
+        self.workers = workers
+
+        self.active = np.flatnonzero(np.any(self.data != 0, axis=0))
+        active = self.data[:, self.active].astype(np.float64)
+        self.mean = active.mean(axis=0)
+        active -= self.mean
+        eigenvalues, eigenvectors = np.linalg.eigh(active.T @ active)
+        order = np.argsort(eigenvalues)[::-1]
+        eigenvalues = np.maximum(eigenvalues[order], 0.0)
+        ratio = np.cumsum(eigenvalues) / max(eigenvalues.sum(), 1e-300)
+        components = min(int(np.searchsorted(ratio, variance)) + 1, len(ratio))
+        self.basis = eigenvectors[:, order[:components]]
+        self.components = components
+
+        # 투영은 float64로 해서 하한 비교가 반올림 오차에 흔들리지 않도록 함
+        self.tree = cKDTree(active @ self.basis)
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.stats = {
+            'queries': 0,
+            'candidates': 0,
+            'expansions': 0,
+        }
+
+    def project(self, vecs):
+        return (np.asarray(vecs, dtype=np.float64)[..., self.active] - self.mean) @ self.basis
+
+    def _rerank(self, vec, count):
+        """
+        vec 하나에 대해 후보 count개를 찾아 전체 벡터 거리로 비교합니다.
+        :return: (거리, index, 가장 먼 후보의 투영 거리)
+        """
+        projected_dists, candidates = self.tree.query(self.project(vec), k=count)
+        projected_dists, candidates = np.atleast_1d(projected_dists), np.atleast_1d(candidates)
+        diff = self.data[candidates].astype(np.float64) - vec
+        dists = np.sqrt(np.einsum('kd,kd->k', diff, diff))
+        best = np.argmin(dists)
+        self.stats['candidates'] += count
+        return dists[best], candidates[best], projected_dists[-1]
+
+    def query(self, vec):
+        vec = np.asarray(vec, dtype=np.float32)
+        count = min(self.rerank, len(self.data))
+        self.stats['queries'] += 1
+        while True:
+            dist, idx, bound = self._rerank(vec, count)
+            if not self.adaptive or count >= len(self.data) or bound >= dist - 1e-9:
+                return dist, idx
+            count = min(count * 2, len(self.data))
+            self.stats['expansions'] += 1
+
+    def query_batch(self, vecs):
+        vecs = np.asarray(vecs, dtype=np.float32)
+        count = min(self.rerank, len(self.data))
+        projected_dists, candidates = self.tree.query(self.project(vecs), k=[count] if count == 1 else count,
+                                                      workers=self.workers)
+        diff = self.data[candidates].astype(np.float64) - vecs[:, None, :]
+        dists = np.sqrt(np.einsum('mkd,mkd->mk', diff, diff))
+        best = np.argmin(dists, axis=1)
+        rows = np.arange(len(vecs))
+        best_dists, best_idxs = dists[rows, best], candidates[rows, best]
+        self.stats['queries'] += len(vecs)
+        self.stats['candidates'] += count * len(vecs)
+
+        if self.adaptive and count < len(self.data):
+            # 하한으로 정확성을 확인하지 못한 query만 후보를 늘려서 다시 검색
+            for i in np.flatnonzero(projected_dists[:, -1] < best_dists - 1e-9):
+                self.stats['queries'] -= 1
+                best_dists[i], best_idxs[i] = self.query(vecs[i])
+        return best_dists, best_idxs
+
+
+BACKENDS = {backend.name: backend
+            for backend in (KDTreeBackend, CKDTreeBackend, BruteForceBackend, IVFBackend, AABBBackend, PCABackend)}
+
+
+def make_backend(name, data, clip_offsets=None, **options):
+    """
+    이름으로 검색 backend를 만듭니다.
+    :param name: 'kdtree', 'ckdtree', 'brute', 'ivf', 'aabb', 'pca' 중 하나
+    :param data: (N, D) 정규화된 feature 행렬
+    :param clip_offsets: clip 경계 행 번호 [0, ..., N]. clip 단위로 block을 나누는 backend만 사용합니다.
+    :param options: backend 생성자에 넘길 설정
+    """
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown search backend: {name} (choose from {', '.join(BACKENDS)})")
+    backend = BACKENDS[name]
+    if getattr(backend, 'clip_aware', False):
+        options['clip_offsets'] = clip_offsets
+    return backend(data, **options)
@@ -0,0 +1,333 @@
+import argparse
+import time
+
+from bvh_controller import INERTIALIZATION_HALFLIFE, parse_bvh, connect, inertialize
+from controller import InputController
+from feature_extractor import MotionKDTree, QueryBuilder, prepare_motion, splice_features
+from profiler import FrameProfiler, NULL_PROFILER
+from virtual_transforms import interpolate_transform
+
+SEARCH_INTERVAL = 50
+MOTION_PENALTY = 5.0
+TRANSITION_FRAMES = 20
+# 전환 방식: 'blend' (connect로 transition_frames 동안 crossfade) 또는 'inertialize'
+TRANSITION_MODE = 'blend'
+TRANSITION_MODES = ('blend', 'inertialize')
+
+
+class FixedTimestep:
+    """
+    실제로 흐른 시간을 모아 두었다가 고정된 간격(step)으로 simulation을 몇 번 진행할지 정합니다.
+    render가 늦어진 frame에는 밀린 만큼 여러 step을 진행하므로 simulation 속도가 render 속도에 묶이지 않고,
+    남은 시간의 비율(alpha)로 render가 직전 step과 현재 step 사이를 보간합니다.
+    :param step: step 간격 (초)
+    :param max_lag: 한 번에 따라잡을 최대 시간 (초). 넘는 시간은 버림 (창을 끌다 놓은 뒤 몰아서 따라잡지 않도록)
+    """
+    def __init__(self, step, max_lag=0.25):
+        self.step = step
+        self.max_steps = max(int(max_lag / step), 1)
+        self.accumulator = 0.0
+
+    def advance(self, elapsed):
+        """
+        :param elapsed: 지난 호출 뒤 흐른 시간 (초)
+        :return: 이번에 진행할 step 수
+        """
+        self.accumulator += elapsed
+        steps = int(self.accumulator // self.step)
+        if steps > self.max_steps:
+            steps = self.max_steps
+            self.accumulator %= self.step
+        else:
+            self.accumulator -= steps * self.step
+        return steps
+
+    @property
+    def alpha(self):
+        return min(self.accumulator / self.step, 1.0)
+
+
+def load_entry(file_path, controller=None, color=None, step=None):
+    """
+    BVH를 읽어 main.py의 state['motions']에 들어가는 motion entry를 만듭니다.
+    :param controller: InputController (없으면 새로 만듦)
+    :param step: advance_entries가 쓰는 고정 step 간격 (초). None이면 motion의 frame_time.
+                 재생 속도는 step과 무관하게 BVH의 frame_time을 따름 (step마다 step / frame_time frame 진행)
+    """
+    root, motion = parse_bvh(file_path)
+    virtual_root = prepare_motion(root, motion)
+    return {
+        'name': file_path.split("/")[-1],
+        'root': virtual_root,
+        'motion': motion,
+        'frame_len': motion.frames,
+        'visible': True,
+        'frame_idx': 1,
+        # 실수 재생 위치 (frame 단위). frame_idx는 그 정수 부분
+        'frame_pos': 1.0,
+        'color': color,
+        'controller': controller or InputController(),
+        'query': QueryBuilder.for_motion(motion),
+        'count': 0,
+        'clock': FixedTimestep(step or motion.frame_time),
+        # 직전 step의 재생 위치와 controller가 정한 root 변환 (render 보간용, simulation은 읽지 않음)
+        'prev_pos': None,
+        'prev_root': None,
+        'cur_root': None
+    }
+
+
+def update_entry(entry, stop=False, search_interval=SEARCH_INTERVAL, profiler=NULL_PROFILER):
+    """
+    entry 하나를 clock의 step 하나만큼 진행합니다: 재생 위치 증가, pose 적용, controller 갱신, query feature 계산.
+    재생 위치는 step / frame_time frame씩 나아가므로 재생 속도는 simulation step과 무관합니다.
+    controller의 입력은 호출 전에 설정되어 있어야 합니다.
+    clip 끝에 닿았는데 전환하지 못했으면 (매칭 없음, 삭제된 clip 등) 마지막 frame에 머물며 매 step 다시 검색합니다.
+    :param search_interval: 검색 간격 (motion frame)
+    :param profiler: 단계별 시간을 기록할 FrameProfiler
+    :return: 이번 step에 검색해야 하면 True
+    """
+    motion = entry['motion']
+    controller = entry['controller']
+    step = entry['clock'].step
+    frames = step / motion.frame_time
+    entry['prev_pos'] = entry['frame_pos']
+    if not stop:
+        entry['frame_pos'] = min(entry['frame_pos'] + frames, entry['frame_len'] - 1.0)
+    frame_idx = entry['frame_idx'] = int(entry['frame_pos'])
+
+    entry['prev_root'] = entry['cur_root']
+    with profiler.scope('apply_to_skeleton'):
+        motion.apply_to_skeleton_at(entry['frame_pos'], entry['root'])
+    with profiler.scope('controller'):
+        pos, dir, turn_rate = controller.update_virtual_kinematics(entry['root'], step)
+    entry['cur_root'] = entry['root'].kinematics
+    with profiler.scope('query_features'):
+        # 미래 궤적의 horizon은 motion frame 단위이므로 frame_time을 씀
+        entry['query'].update(motion, frame_idx, entry['root'].kinematics, controller.current_velocity,
+                              dir, turn_rate, motion.frame_time)
+    entry['count'] += frames
+
+    if frame_idx + 21 > entry['frame_len']:
+        entry['count'] = 1000
+    return entry['count'] >= search_interval
+
+
+def search_entries(tree, entries, motion_penalty=MOTION_PENALTY, transition_frames=TRANSITION_FRAMES,
+                   profiler=NULL_PROFILER, transition_mode=TRANSITION_MODE, halflife=INERTIALIZATION_HALFLIFE):
+    """
+    entries를 한 번에 검색하고, 현재 motion을 이어 가는 것보다 충분히 가까우면 매칭된 clip으로 전환합니다.
+    :param transition_mode: 'blend'면 connect로 crossfade, 'inertialize'면 매칭된 clip을 바로 재생하며 pose 차이를 줄임
+    :param halflife: 'inertialize'에서 pose 차이가 절반으로 줄어드는 시간 (초)
+    :return: 전환한 entry 수
+    """
+    if transition_mode not in TRANSITION_MODES:
+        raise ValueError(f"Unknown transition mode: {transition_mode}")
+    switches = 0
+    with profiler.scope('search'):
+        dists, matches, paths = tree.search_query_batch([entry['query'] for entry in entries])
+    for entry, dist, (clip_id, matched_idx), path in zip(entries, dists.tolist(), matches.tolist(), paths):
+        frame_idx = entry['frame_idx']
+        query_vec = entry['query'].query
+
+        with profiler.scope('current_distance'):
+            if frame_idx + 21 < entry['frame_len']:
+                # 다음 frame의 feature 한 행을 배열에서 바로 만듦 (frame 객체를 거치지 않음)
+                current_next_vec = MotionKDTree.extract_feature_matrix(entry['motion'], frame_idx + 1, frame_idx + 2)[0]
+                current_next_vec = tree.normalize(current_next_vec, out=current_next_vec)
+                dist_current = tree.distance_function(query_vec, current_next_vec)
+            else:
+                dist_current = float('inf')
+
+        # 매칭된 clip의 pose는 전환할 때만 불러옴 (삭제된 clip이면 None)
+        with profiler.scope('load_motion'):
+            matched_motion = tree.get_motion(clip_id) if dist + motion_penalty < dist_current else None
+        if matched_motion is not None:
+            if transition_mode == 'inertialize':
+                # 새 frame 0이 현재 pose이고, 매칭된 clip의 feature를 그대로 씀
+                with profiler.scope('inertialize'):
+                    new_motion = inertialize(entry['motion'], frame_idx, matched_motion, matched_idx, halflife)
+            else:
+                with profiler.scope('connect'):
+                    new_motion = connect(entry['motion'][frame_idx:frame_idx + transition_frames],
+                                         matched_motion[matched_idx:], 0, transition_frames=transition_frames)
+
+                # 매칭된 clip의 feature를 그대로 쓰고 blending 구간 근처만 다시 계산
+                with profiler.scope('switch_features'):
+                    new_motion = splice_features(entry['root'], new_motion, tree.horizons, tree.end_policy)
+
+            entry['motion'] = new_motion
+            entry['name'] = path.split("/")[-1]
+            entry['frame_idx'] = 0
+            entry['frame_pos'] = 0.0
+            entry['prev_pos'] = 0.0
+            entry['frame_len'] = new_motion.frames
+            entry['count'] = 0
+            switches += 1
+
+            print(f"[SMART MATCH] {path} @ {matched_idx} (better distance: {dist:.2f} < {dist_current:.2f})")
+        else:
+            entry['count'] = 0
+    return switches
+
+
+def advance_entries(tree, entries, elapsed, stop=False, profiler=NULL_PROFILER, transition_mode=TRANSITION_MODE):
+    """
+    실제로 흐른 시간 elapsed(초)만큼 entries를 진행합니다. entry마다 'clock'의 step 하나에 update_entry를 한 번 부르고,
+    step마다 검색할 entry를 모아 한 번에 검색합니다. controller의 입력은 호출 전에 설정되어 있어야 합니다.
+    :return: 가장 많이 진행한 entry의 step 수
+    """
+    counts = [entry['clock'].advance(elapsed) for entry in entries]
+    rounds = max(counts, default=0)
+    for k in range(rounds):
+        due = []
+        for entry, count in zip(entries, counts):
+            if count > k and update_entry(entry, stop, profiler=profiler):
+                due.append(entry)
+        if due:
+            search_entries(tree, due, profiler=profiler, transition_mode=transition_mode)
+    return rounds
+
+
+def apply_entry(entry, interpolate=True):
+    """
+    render 직전에 entry의 pose를 skeleton에 적용합니다. interpolate면 직전 step과 현재 step의 재생 위치 사이를
+    clock의 alpha로 보간합니다 (멈춰 있으면 두 위치가 같아 pose가 그대로).
+    root 변환은 motion이 아니라 controller가 정한 값(prev_root, cur_root)을 쓰고, 보간한 값은 그릴 때만 쓰도록 돌려줍니다.
+    root.kinematics는 controller의 현재 값으로 남겨 둡니다.
+    :return: 그릴 때 쓸 root 변환
+    """
+    root = entry['root']
+    alpha = entry['clock'].alpha if interpolate else None
+    position = entry['frame_pos']
+    if alpha is not None and entry['prev_pos'] is not None:
+        position = entry['prev_pos'] + (position - entry['prev_pos']) * alpha
+    entry['motion'].apply_to_skeleton_at(position, root)
+    current, previous = entry['cur_root'], entry['prev_root']
+    if current is None:
+        # 아직 step을 진행하지 않았으면 motion의 root 그대로
+        return root.kinematics
+    root.kinematics = current
+    if alpha is None or previous is None:
+        return current
+    return interpolate_transform(previous, current, alpha)
+
+
+class ScriptedInput:
+    """
+    (frame 수, 누른 키) 목록으로 controller 입력을 재생합니다.
+    예: [(120, 'W'), (60, 'WA'), (90, '')] — 120 frame 동안 W, 60 frame 동안 W+A, 90 frame 동안 입력 없음
+    :param loop: 끝나면 처음부터 반복
+    """
+    def __init__(self, script, loop=True):
+        self.script = [(int(frames), keys.upper()) for frames, keys in script]
+        self.length = sum(frames for frames, _ in self.script)
+        self.loop = loop
+
+    @classmethod
+    def parse(cls, text, loop=True):
+        """
+        '120:W,60:WA,90:' 형식의 문자열로 만듭니다.
+        """
+        script = []
+        for item in text.split(','):
+            frames, _, keys = item.partition(':')
+            script.append((frames, keys))
+        return cls(script, loop)
+
+    def keys(self, frame):
+        if self.loop and self.length:
+            frame %= self.length
+        for frames, keys in self.script:
+            if frame < frames:
+                return keys
+            frame -= frames
+        return ''
+
+
+class HeadlessRunner:
+    """
+    창, GL context, pygame 없이 motion matching loop를 돌립니다.
+    main.py와 같은 update_entry / search_entries를 사용하고, 입력은 ScriptedInput으로 재생합니다.
+    :param tree: MotionKDTree
+    :param file_paths: 캐릭터마다 시작할 BVH 경로
+    :param script: ScriptedInput (모든 캐릭터가 같은 입력을 받음)
+    :param profiler: 단계별 시간을 기록할 FrameProfiler
+    :param transition_mode: search_entries 참고
+    """
+    def __init__(self, tree, file_paths, script, profiler=NULL_PROFILER, transition_mode=TRANSITION_MODE):
+        self.tree = tree
+        self.script = script
+        self.profiler = profiler
+        self.transition_mode = transition_mode
+        self.entries = [load_entry(path) for path in file_paths]
+        self.frame = 0
+        self.switches = 0
+        self.searches = 0
+
+    def step(self):
+        self.profiler.begin_frame()
+        keys = self.script.keys(self.frame)
+        due = []
+        for entry in self.entries:
+            entry['controller'].set_keys(keys)
+            if update_entry(entry, profiler=self.profiler):
+                due.append(entry)
+        if due:
+            self.searches += len(due)
+            self.switches += search_entries(self.tree, due, profiler=self.profiler,
+                                            transition_mode=self.transition_mode)
+        self.profiler.end_frame()
+        self.frame += 1
+
+    def run(self, frames):
+        """
+        frames만큼 가능한 빠르게 진행합니다.
+        :return: 결과 dict (frame 수, 걸린 시간, 초당 simulated frame 수, 검색/전환 횟수)
+        """
+        start = time.perf_counter()
+        for _ in range(frames):
+            self.step()
+        seconds = time.perf_counter() - start
+        return {
+            'frames': frames,
+            'characters': len(self.entries),
+            'seconds': seconds,
+            'fps': frames / seconds if seconds > 0 else float('inf'),
+            'searches': self.searches,
+            'switches': self.switches,
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="motion matching loop를 화면 없이 실행합니다")
+    parser.add_argument('root_path', help="database BVH 폴더")
+    parser.add_argument('--bvh', default=None, help="시작 motion (기본값: database의 첫 clip)")
+    parser.add_argument('--characters', type=int, default=1)
+    parser.add_argument('--frames', type=int, default=1000)
+    parser.add_argument('--script', default='120:W,60:WA,120:W,60:WD,90:', help="'frame 수:키' 목록")
+    parser.add_argument('--cache-dir', default=None)
+    parser.add_argument('--backend', default='kdtree')
+    parser.add_argument('--transition', default=TRANSITION_MODE, choices=TRANSITION_MODES, help="전환 방식")
+    parser.add_argument('--profile', action='store_true', help="단계별 시간 (평균/p95/최대) 출력")
+    parser.add_argument('--trace', default=None, help="Chrome trace JSON을 저장할 경로 (--profile 포함)")
+    args = parser.parse_args()
+
+    tree = MotionKDTree(args.root_path, cache_dir=args.cache_dir, backend=args.backend)
+    file_path = args.bvh or tree.bvh_paths[0]
+    profiler = FrameProfiler(capacity=args.frames, enabled=True) if args.profile or args.trace else NULL_PROFILER
+    runner = HeadlessRunner(tree, [file_path] * args.characters, ScriptedInput.parse(args.script), profiler,
+                            args.transition)
+    result = runner.run(args.frames)
+    print(f"{result['frames']} frames x {result['characters']} character(s) in {result['seconds']:.2f}s "
+          f"= {result['fps']:.1f} simulated fps, {result['searches']} searches, {result['switches']} switches")
+    if profiler.enabled:
+        print(f"{'stage':<20}{'mean(ms)':>10}{'p95(ms)':>10}{'max(ms)':>10}")
+        for name, (mean, p95, peak) in profiler.summary().items():
+            print(f"{name:<20}{mean:>10.3f}{p95:>10.3f}{peak:>10.3f}")
+    if args.trace:
+        print(f"{profiler.dump_trace(args.trace)} trace events written to {args.trace}")
+
+
+if __name__ == "__main__":
+    main()
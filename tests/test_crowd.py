@@ -0,0 +1,33 @@
+import os
+import shutil
+
+import pytest
+
+from crowd import Crowd
+from feature_extractor import MotionKDTree
+
+BVH_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'base_data.bvh')
+
+
+def test_crowd_rejects_empty_database(tmp_path):
+    tree = MotionKDTree(str(tmp_path))
+    assert tree.index.empty
+    with pytest.raises(ValueError, match="at least one clip"):
+        Crowd(tree, 4)
+
+
+def test_crowd_keeps_running_after_database_is_emptied(tmp_path):
+    path = str(tmp_path / 'base_data.bvh')
+    shutil.copy(BVH_PATH, path)
+    tree = MotionKDTree(str(tmp_path))
+    crowd = Crowd(tree, 4, lod_rates=(1, 1, 1))
+    tree.remove_clip(path)
+    assert tree.index.empty
+
+    # 검색 결과가 "매칭 없음"이므로 전환하지 않고 각자 clip 끝에서 멈춤
+    for _ in range(200):
+        crowd.step()
+    assert crowd.searches > 0
+    assert crowd.switches == 0
+    assert all(crowd.frame_pos[i] == motion.frames - 1 for i, motion in enumerate(crowd.motions))
+    crowd.apply_agent(0)
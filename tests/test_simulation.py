@@ -0,0 +1,60 @@
+import os
+import shutil
+
+import numpy as np
+import pytest
+
+from crowd import Crowd
+from feature_extractor import MotionKDTree
+from simulation import load_entry, update_entry
+
+BVH_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'base_data.bvh')
+
+
+@pytest.fixture(scope='module')
+def tree(tmp_path_factory):
+    root_path = tmp_path_factory.mktemp('bvh')
+    shutil.copy(BVH_PATH, root_path / 'base_data.bvh')
+    return MotionKDTree(str(root_path))
+
+
+def play_entry(sim_rate, seconds, render_rate=90):
+    """
+    render_rate로 seconds 동안 clock을 돌리며 entry를 진행하고 재생 위치를 돌려줍니다. 검색은 하지 않습니다.
+    """
+    entry = load_entry(BVH_PATH, step=1.0 / sim_rate)
+    start = entry['frame_pos']
+    for _ in range(int(seconds * render_rate)):
+        for _ in range(entry['clock'].advance(1.0 / render_rate)):
+            update_entry(entry, search_interval=float('inf'))
+    return entry['frame_pos'] - start, entry['motion'].frame_time
+
+
+def test_entry_playback_speed_does_not_depend_on_sim_rate():
+    seconds = 0.5
+    slow, frame_time = play_entry(60, seconds)
+    fast, _ = play_entry(120, seconds)
+    # BVH는 120Hz: 두 rate 모두 실제 시간만큼 (step 하나 오차 안에서) 재생
+    expected = seconds / frame_time
+    assert slow == pytest.approx(expected, abs=120 / 60)
+    assert fast == pytest.approx(expected, abs=1)
+    assert slow == pytest.approx(fast, abs=120 / 60)
+
+
+def play_crowd(tree, sim_rate, seconds):
+    # 전환하지 않도록 penalty를 무한대로, 모든 agent를 매 step 갱신
+    crowd = Crowd(tree, 4, lod_rates=(1, 1, 1), motion_penalty=float('inf'), seed=3)
+    start = crowd.frame_pos.copy()
+    for _ in range(int(round(seconds * sim_rate))):
+        crowd.step(1.0 / sim_rate)
+    return crowd.frame_pos - start, crowd.frame_time, crowd.motions
+
+
+def test_crowd_playback_speed_does_not_depend_on_sim_rate(tree):
+    seconds = 0.2
+    slow, frame_time, motions = play_crowd(tree, 60, seconds)
+    fast, _, _ = play_crowd(tree, 120, seconds)
+    remaining = np.array([motion.frames - 1 for motion in motions], dtype=np.float64)
+    expected = np.minimum(seconds / frame_time, remaining)
+    np.testing.assert_allclose(slow, expected, atol=1e-6)
+    np.testing.assert_allclose(fast, expected, atol=1e-6)
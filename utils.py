@@ -239,7 +239,7 @@ def draw_arrow(circle_radius, arrow_length, color):
 
 
 def draw_arrow_from_direction(forward_vec: glm.vec3, arrow_length=4, color=(1.0, 0.0, 0.0)):
-    f = np.array([forward_vec.x, 0.0, forward_vec.z], dtype=np.float32)
+    f = np.array([forward_vec[0], 0.0, forward_vec[2]], dtype=np.float32)
     norm = np.linalg.norm(f) + 1e-8
     dir = f / norm
 
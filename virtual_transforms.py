@@ -1,5 +1,6 @@
 from pyglm import glm
 import math
+import numpy as np
 
 def get_projection(v: glm.vec3, onto: glm.vec3):
     onto_norm = glm.normalize(onto)
@@ -81,4 +82,285 @@ def extract_xz_plane(kinetics: glm.mat4) -> glm.mat4:
     rotation_y[3].x = offset.x
     rotation_y[3].z = offset.z
     rotation_y[3].y = 0.0
-    return rotation_y
\ No newline at end of file
+    return rotation_y
+
+
+def interpolate_transform(a: glm.mat4, b: glm.mat4, alpha: float) -> glm.mat4:
+    """
+    회전과 이동만 있는 두 변환 사이를 보간합니다 (회전은 slerp, 이동은 선형).
+    """
+    rotation = glm.slerp(glm.quat_cast(glm.mat3(a)), glm.quat_cast(glm.mat3(b)), alpha)
+    translation = glm.mix(glm.vec3(a[3]), glm.vec3(b[3]), alpha)
+    return glm.translate(glm.mat4(1.0), translation) * glm.mat4_cast(rotation)
+
+# ---- numpy 배열 버전 quaternion 연산 ----
+# quaternion은 마지막 축이 (w, x, y, z)인 배열, 벡터는 마지막 축이 (x, y, z)인 배열입니다.
+# 연산 순서는 glm과 같게 맞춰 두었습니다.
+
+def quat_multiply(p, q):
+    pw, px, py, pz = np.moveaxis(np.asarray(p), -1, 0)
+    qw, qx, qy, qz = np.moveaxis(np.asarray(q), -1, 0)
+    return np.stack([
+        pw * qw - px * qx - py * qy - pz * qz,
+        pw * qx + px * qw + py * qz - pz * qy,
+        pw * qy + py * qw + pz * qx - px * qz,
+        pw * qz + pz * qw + px * qy - py * qx,
+    ], axis=-1)
+
+
+def quat_conjugate(q):
+    q = np.asarray(q)
+    return q * np.array([1, -1, -1, -1], dtype=q.dtype)
+
+
+def quat_rotate(q, v):
+    q = np.asarray(q)
+    v = np.asarray(v)
+    qv = q[..., 1:]
+    uv = np.cross(qv, v)
+    uuv = np.cross(qv, uv)
+    return v + ((uv * q[..., :1]) + uuv) * 2
+
+
+def quat_slerp(x, y, a):
+    """
+    glm.slerp와 같은 방식(짧은 경로, 거의 같은 회전이면 선형 보간)의 배열 버전입니다.
+    :param x: (..., 4) 시작 quaternion
+    :param y: (..., 4) 끝 quaternion
+    :param a: 보간 비율. x, y의 앞쪽 축과 broadcast 가능한 스칼라 또는 배열
+    """
+    x = np.asarray(x)
+    y = np.asarray(y)
+    a = np.asarray(a, dtype=x.dtype)[..., None]
+
+    cos_theta = np.sum(x * y, axis=-1, keepdims=True)
+    z = np.where(cos_theta < 0, -y, y)
+    cos_theta = np.abs(cos_theta)
+
+    linear = cos_theta > 1 - np.finfo(x.dtype).eps
+    angle = np.arccos(np.where(linear, 0, cos_theta))
+    sin_angle = np.where(linear, 1, np.sin(angle))
+    spherical = (np.sin((1 - a) * angle) * x + np.sin(a * angle) * z) / sin_angle
+    return np.where(linear, x * (1 - a) + z * a, spherical)
+
+
+def vec_mix(x, y, a):
+    a = np.asarray(a, dtype=np.asarray(x).dtype)[..., None]
+    return x * (1 - a) + y * a
+
+
+def quat_to_rotation_vector(q):
+    """
+    quaternion을 회전 벡터(축 * 각도, radian)로 바꿉니다. 짧은 경로(w >= 0)를 택합니다.
+    :param q: (..., 4) 단위 quaternion
+    :return: (..., 3)
+    """
+    q = np.asarray(q)
+    q = np.where(q[..., :1] < 0, -q, q)
+    sin_half = np.sqrt(_dot3(q[..., 1:], q[..., 1:]))
+    angle = 2 * np.arctan2(sin_half, q[..., 0])
+    # 각도가 0에 가까우면 angle / sin_half -> 2
+    small = sin_half < 1e-7
+    scale = np.where(small, 2, angle / np.where(small, 1, sin_half))
+    return q[..., 1:] * scale[..., None]
+
+
+def quat_from_rotation_vector(v):
+    """
+    quat_to_rotation_vector의 역변환입니다.
+    :param v: (..., 3) 회전 벡터
+    :return: (..., 4) 단위 quaternion
+    """
+    v = np.asarray(v)
+    half = np.sqrt(_dot3(v, v)) * 0.5
+    small = half < 1e-7
+    # sin(half) / (2 half) -> 0.5
+    scale = np.where(small, 0.5, np.sin(half) / np.where(small, 1, 2 * half))
+    return np.concatenate([np.cos(half)[..., None], v * scale[..., None]], axis=-1)
+
+
+AXIS_VECTORS = {
+    'X': np.array([1, 0, 0], dtype=np.float32),
+    'Y': np.array([0, 1, 0], dtype=np.float32),
+    'Z': np.array([0, 0, 1], dtype=np.float32),
+}
+
+
+def euler_to_quat(angles, order):
+    """
+    BVH rotation channel 값(도 단위)을 quaternion으로 바꿉니다.
+    channel 순서대로 q = q * angleAxis(angle, axis)를 곱하는 것과 같은 순서로 계산합니다.
+    sin/cos만 float64로 구한 뒤 float32로 반올림하므로 glm(libm sinf/cosf)과 최대 1 ulp 차이가 날 수 있습니다.
+    :param angles: (..., len(order)) 도 단위 각도
+    :param order: 'ZYX' 처럼 channel 순서대로 쓴 축 문자열
+    :return: (..., 4) float32 quaternion (w, x, y, z)
+    """
+    angles = np.asarray(angles)
+    # glm.angleAxis와 같이 라디안 값을 float32로 바꾼 뒤 절반을 취함
+    half = np.radians(angles.astype(np.float64)).astype(np.float32) * np.float32(0.5)
+    half = half.astype(np.float64)
+    c = np.cos(half).astype(np.float32)
+    s = np.sin(half).astype(np.float32)
+
+    q = np.zeros(angles.shape[:-1] + (4,), dtype=np.float32)
+    q[..., 0] = 1.0
+    for i, axis in enumerate(order):
+        axis_q = np.empty_like(q)
+        axis_q[..., 0] = c[..., i]
+        axis_q[..., 1:] = AXIS_VECTORS[axis] * s[..., i, None]
+        q = quat_multiply(q, axis_q)
+    return q
+
+
+def forward_kinematics(parents, offsets, rotations, translations=None):
+    """
+    모든 frame, 모든 joint의 전역 위치/회전을 한 번에 계산합니다.
+    parent가 child보다 앞에 오는 순서(preorder 등)를 가정하고, 같은 깊이의 joint를 묶어 처리합니다.
+    :param parents: (J,) parent index 배열, root는 -1
+    :param offsets: (J, 3) joint offset
+    :param rotations: (F, J, 4) local 회전
+    :param translations: (F, J, 3) offset에 더해지는 local 이동 (없으면 offset만 사용)
+    :return: (global_positions (F, J, 3), global_rotations (F, J, 4))
+    """
+    parents = np.asarray(parents)
+    offsets = np.asarray(offsets, dtype=np.float32)
+    rotations = np.asarray(rotations)
+    num_frames, num_joints = rotations.shape[:2]
+
+    local_positions = np.broadcast_to(offsets, (num_frames, num_joints, 3))
+    if translations is not None:
+        local_positions = translations + offsets
+
+    depth = np.zeros(num_joints, dtype=np.int64)
+    for j in range(num_joints):
+        if parents[j] >= 0:
+            depth[j] = depth[parents[j]] + 1
+
+    global_positions = np.empty((num_frames, num_joints, 3), dtype=np.float32)
+    global_rotations = np.empty((num_frames, num_joints, 4), dtype=np.float32)
+
+    roots = np.flatnonzero(depth == 0)
+    global_positions[:, roots] = local_positions[:, roots]
+    global_rotations[:, roots] = rotations[:, roots]
+
+    for d in range(1, depth.max(initial=0) + 1):
+        joints = np.flatnonzero(depth == d)
+        parent_rotations = global_rotations[:, parents[joints]]
+        global_positions[:, joints] = (global_positions[:, parents[joints]]
+                                       + quat_rotate(parent_rotations, local_positions[:, joints]))
+        global_rotations[:, joints] = quat_multiply(parent_rotations, rotations[:, joints])
+
+    return global_positions, global_rotations
+
+
+def _dot3(a, b):
+    tmp = a * b
+    return tmp[..., 0] + tmp[..., 1] + tmp[..., 2]
+
+
+def _normalize3(v):
+    return v * (np.float32(1) / np.sqrt(_dot3(v, v)))[..., None]
+
+
+def mat3_to_quat(t, u, v):
+    """
+    열 벡터 (t, u, v)로 이루어진 회전 행렬을 quaternion으로 바꿉니다 (glm.quat_cast와 같은 분기).
+    :return: (..., 4) quaternion (w, x, y, z)
+    """
+    m00, m01, m02 = t[..., 0], t[..., 1], t[..., 2]
+    m10, m11, m12 = u[..., 0], u[..., 1], u[..., 2]
+    m20, m21, m22 = v[..., 0], v[..., 1], v[..., 2]
+
+    four_squared_minus1 = np.stack([
+        m00 + m11 + m22,
+        m00 - m11 - m22,
+        m11 - m00 - m22,
+        m22 - m00 - m11,
+    ], axis=-1)
+    # glm과 같이 w, x, y, z 순서로 비교하면서 더 큰 값만 갱신 (동률이면 앞쪽)
+    biggest_index = np.zeros(t.shape[:-1], dtype=np.int64)
+    biggest = four_squared_minus1[..., 0]
+    for i in range(1, 4):
+        larger = four_squared_minus1[..., i] > biggest
+        biggest_index = np.where(larger, i, biggest_index)
+        biggest = np.where(larger, four_squared_minus1[..., i], biggest)
+
+    biggest_val = np.sqrt(biggest + np.float32(1)) * np.float32(0.5)
+    mult = np.float32(0.25) / biggest_val
+
+    candidates = np.stack([
+        np.stack([biggest_val, (m12 - m21) * mult, (m20 - m02) * mult, (m01 - m10) * mult], axis=-1),
+        np.stack([(m12 - m21) * mult, biggest_val, (m01 + m10) * mult, (m20 + m02) * mult], axis=-1),
+        np.stack([(m20 - m02) * mult, (m01 + m10) * mult, biggest_val, (m12 + m21) * mult], axis=-1),
+        np.stack([(m01 - m10) * mult, (m20 + m02) * mult, (m12 + m21) * mult, biggest_val], axis=-1),
+    ], axis=-2)
+    return np.take_along_axis(candidates, biggest_index[..., None, None], axis=-2)[..., 0, :]
+
+
+def lookrotation_batch(v, u):
+    """
+    lookrotation의 배열 버전입니다.
+    :param v: (..., 3) 바라보는 방향
+    :param u: (..., 3) up 벡터
+    :return: (..., 4) quaternion, w >= 0
+    """
+    v_hat = _normalize3(v)
+    u_hat = _normalize3(np.broadcast_to(u, v_hat.shape).astype(np.float32))
+    t_hat = _normalize3(np.cross(u_hat, v_hat))
+    up_corrected = np.cross(v_hat, t_hat)
+    rot_q = mat3_to_quat(t_hat, up_corrected, v_hat)
+    return np.where(rot_q[..., :1] < 0, -rot_q, rot_q)
+
+
+def get_pelvis_virtual_batch(ap, ar, fallback_forward=(0, 0, 1), smooth_ratio=0.2, prev_r_inv_ref=None):
+    """
+    get_pelvis_virtual_safe를 모든 frame에 대해 한 번에 계산합니다.
+    prev_r_inv_ref가 주어지면 frame 순서대로 slerp low-pass filter를 적용하고, 마지막 값으로 갱신합니다.
+    :param ap: (F, 3) pelvis 위치 (world 기준)
+    :param ar: (F, 4) pelvis 회전 (world 기준)
+    :return: (new_ap (F, 3), new_ar (F, 4))
+    """
+    ap = np.asarray(ap, dtype=np.float32)
+    ar = np.asarray(ar, dtype=np.float32)
+    up = np.array([0, 1, 0], dtype=np.float32)
+
+    # 수직 성분 제거 (위치 기준 평면화)
+    p = ap - _dot3(ap, up)[..., None] * up
+
+    # 현재 바라보는 방향 벡터 추출 후 수평화
+    f = quat_rotate(ar, np.array([0, 0, 1], dtype=np.float32))
+    f_mod = f - _dot3(f, up)[..., None] * up
+
+    # 길이가 너무 짧은 frame은 fallback 방향 사용
+    degenerate = np.sqrt(_dot3(f_mod, f_mod)) < 1e-4
+    f_mod = np.where(degenerate[..., None], np.asarray(fallback_forward, dtype=np.float32), f_mod)
+
+    # 회전 정렬 및 역변환 (glm.inverse: conjugate / dot)
+    r = lookrotation_batch(f_mod, up)
+    tmp = r * r
+    r_inv = quat_conjugate(r) / ((tmp[..., 0] + tmp[..., 1]) + (tmp[..., 2] + tmp[..., 3]))[..., None]
+
+    # low-pass filtering은 이전 frame 값에 의존하므로 순서대로 처리
+    if prev_r_inv_ref is not None:
+        prev = prev_r_inv_ref[0]
+        for i, q in enumerate(r_inv.tolist()):
+            prev = glm.slerp(prev, glm.quat(*q), smooth_ratio)
+            r_inv[i] = prev
+        prev_r_inv_ref[0] = prev
+
+    new_ap = quat_rotate(r_inv, ap - p)
+    new_ar = quat_multiply(r_inv, ar)
+    return new_ap, new_ar
+
+
+def split_pelvis_virtual(ap, ar, **kwargs):
+    """
+    pelvis 전역 변환을 virtual root(global)와 pelvis(local)로 나눕니다.
+    :return: (ap_local, ar_local, ap_global, ar_global)
+    """
+    ap = np.asarray(ap, dtype=np.float32)
+    ar = np.asarray(ar, dtype=np.float32)
+    ap_local, ar_local = get_pelvis_virtual_batch(ap, ar, **kwargs)
+    ap_global = ap - ap_local
+    ar_global = quat_multiply(ar, quat_conjugate(ar_local))
+    return ap_local, ar_local, ap_global, ar_global